@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+PROG_VERSION = "Time-stamp: <2026-10-16 18:00:00 vk>"
+
+# A thin client of "filetags --daemon": it only imports a few standard
+# modules and sends one request over the Unix socket of the daemon.
+# This way, tagging from image viewers or file managers does not pay for
+# starting filetags, reading the vocabulary and scanning directories on
+# each invocation. See Integration.org for details.
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+# same as DEFAULT_DAEMON_SOCKET of filetags:
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or
+                              os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                                           os.path.join(os.path.expanduser("~"), ".cache"), "filetags"),
+                              "filetags.socket")
+BETWEEN_TAG_SEPARATOR = ' '
+
+
+def send_requests(socket_filename, requests):
+    """
+    Sends requests to the filetags daemon listening on socket_filename
+    and returns its responses.
+
+    @param socket_filename: string of the file name of the socket of the daemon
+    @param requests: list of dicts like {"command": "list", "directory": "/a"}
+    @param return: list of response dicts with 'ok' and the result or an 'error'
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_filename)
+        with connection.makefile('rb') as responses:
+            result = []
+            for request in requests:
+                connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+                result.append(json.loads(responses.readline().decode('utf-8')))
+            return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sends requests to a running \"filetags --daemon\".")
+    parser.add_argument("--socket", dest="socket", default=DEFAULT_SOCKET,
+                        help="Unix socket of the daemon. Default: " + DEFAULT_SOCKET)
+    parser.add_argument("-s", "--dryrun", dest="dryrun", action="store_true",
+                        help="Just simulate tagging, do not modify files")
+    parser.add_argument("-R", "--recursive", dest="recursive", action="store_true",
+                        help="Include sub-directories for filter and list")
+    parser.add_argument("-t", "--tags", dest="tags", metavar='"STRING WITH TAGS"',
+                        help="Tags for tag and untag; they are asked for if omitted")
+    parser.add_argument("command", choices=['tag', 'untag', 'filter', 'list', 'stop'])
+    parser.add_argument("arguments", nargs='*', metavar='FILE|QUERY',
+                        help="Files for tag and untag, a tag query for filter")
+    options = parser.parse_intermixed_args()
+
+    request = {'command': options.command, 'recursive': options.recursive, 'dryrun': options.dryrun}
+    if options.command in ['tag', 'untag']:
+        if not options.arguments:
+            parser.error("Please add at least one file name as argument")
+        tags = options.tags
+        if tags is None:
+            tags = input('Please enter tags, separated by "' + BETWEEN_TAG_SEPARATOR + '": ')
+        request['tags'] = [x for x in tags.strip().split(BETWEEN_TAG_SEPARATOR) if x]
+        if not request['tags']:
+            sys.exit(0)
+        request['files'] = [os.path.abspath(x) for x in options.arguments]
+    elif options.command in ['filter', 'list']:
+        request['directory'] = os.getcwd()
+        if options.command == 'filter':
+            request['query'] = BETWEEN_TAG_SEPARATOR.join(options.arguments)
+
+    try:
+        response = send_requests(options.socket, [request])[0]
+    except OSError as error:
+        print('Could not reach the filetags daemon on "' + options.socket + '" (' + str(error) +
+              '). Please start it with "filetags --daemon".', file=sys.stderr)
+        sys.exit(2)
+
+    for filename in response.get('files', []):
+        print(filename)
+    for tag, count in sorted(response.get('tags', {}).items(), key=lambda x: (-x[1], x[0])):
+        print(' {0:5} : {1}'.format(count, tag))
+    if not response['ok']:
+        print(response['error'], file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
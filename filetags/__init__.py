@@ -38,23 +38,29 @@ def safe_import(library):
               "\".\nPlease install it, e.g., with \"sudo pip install " + library + "\".")
         sys.exit(2)
 
-import re
 import sys
 import os
-import platform
+
+if __name__ == "__main__" and sys.argv[1:] == ['--version']:
+    # fast path: neither the modules below nor the parser are needed for this
+    print(os.path.basename(sys.argv[0]) + " version " + PROG_VERSION[13:23])
+    sys.exit(0)
+
+import re
 import argparse   # for handling command line arguments
 import time
 import logging
 import errno      # for throwing FileNotFoundError
+from collections import OrderedDict  # for the LRU cache of parsed basenames
+from collections.abc import Mapping  # for read-only views of the file catalog
+from array import array   # for compact columns of the file catalog
 safe_import('operator')   # for sorting dicts
-safe_import('difflib')    # for good enough matching words
-safe_import('readline')   # for raw_input() reading from stdin
-safe_import('codecs')     # for handling Unicode content in .tagfiles
 safe_import('math')       # (integer) calculations
-safe_import('clint')      # for config file handling
-safe_import('itertools')  # for calculating permutations of tagtrees
-safe_import('colorama')   # for colorful output
-if platform.system() == 'Windows':
+# Modules which are only needed by some features are imported where they
+# are used so that simple invocations start quickly:
+# difflib, readline, codecs, itertools, colorama, platform, ...
+IS_WINDOWS = sys.platform == 'win32'
+if IS_WINDOWS:
     try:
         import win32com.client
     except ImportError:
@@ -68,27 +74,31 @@ PROG_VERSION_DATE = PROG_VERSION[13:23]
 FILENAME_TAG_SEPARATOR = ' -- '
 BETWEEN_TAG_SEPARATOR = ' '
 CONTROLLED_VOCABULARY_FILENAME = ".filetags"
+TAG_INDEX_FILENAME = ".filetags_index.sqlite"  # persistent tag index, located next to CONTROLLED_VOCABULARY_FILENAME
+TAG_INDEX_VERSION = 2  # increase when TAG_INDEX_SCHEMA changes: older indexes get re-built
+TAG_INDEX_MTIME_GRANULARITY = 2  # seconds; the coarsest modification time resolution of supported file systems (FAT)
 HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE = ' *'
 TAGFILTER_DIRECTORY = os.path.join(os.path.expanduser("~"), ".filetags_tagfilter")
+CACHE_DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache"),
+                               "filetags")  # results that are kept across runs; may be deleted any time
+SIMILAR_TAGS_CACHE_FILENAME = "similar_tags.json"  # within CACHE_DIRECTORY
+SIMILAR_TAGS_CACHE_SIZE = 50000  # number of tags kept in SIMILAR_TAGS_CACHE_FILENAME; the least recently used get dropped
+VOCABULARY_CACHE_SUBDIRECTORY = "vocabularies"  # within CACHE_DIRECTORY; one compiled file per controlled vocabulary
+VOCABULARY_CACHE_VERSION = 1  # increase when the format of the compiled vocabularies changes
+DEFAULT_DAEMON_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or CACHE_DIRECTORY,
+                                     "filetags.socket")  # keep in sync with bin/filetags_client.py
+TAGTREES_ORDERINGS = ['permutations', 'canonical', 'canonical-aliases']  # first one is the default
+TAGTREES_STAGING_SUFFIX = ".filetags_staging"  # sibling directory of --tagtrees-staged builds
+TAGTREES_OLD_SUFFIX = ".filetags_old"  # sibling directory of replaced tagtrees which gets removed in the background
+TAGTREES_MANIFEST_SUFFIX = ".filetags_manifest.json"  # manifest of --tagtrees-incremental, located next to the tagtrees directory
+DEFAULT_JOBS = 1  # number of parallel workers for --jobs
+DEFAULT_PARSE_CACHE_SIZE = 65536  # number of parsed basenames kept in memory
+SIMILAR_TAGS_PER_CHUNK = 250  # minimum number of tags per process for --jobs: smaller batches are not worth the processes
 DEFAULT_TAGTREES_MAXDEPTH = 2  # be careful when making this more than 2: exponential growth of time/links with number of tags!
 DEFAULT_IMAGE_VIEWER_LINUX = 'geeqie'
 DEFAULT_IMAGE_VIEWER_WINDOWS = 'explorer'
 TAG_LINK_ORIGINALS_WHEN_TAGGING_LINKS = True
-IS_WINDOWS = False
-
-# Determining the window size of the terminal:
-if platform.system() == 'Windows':
-    TTY_HEIGHT, TTY_WIDTH = 80, 80  # fall-back values
-    IS_WINDOWS = True
-else:
-    # check to avoid stty error when stdin is not a terminal.
-    if sys.stdin.isatty():
-        try:
-            TTY_HEIGHT, TTY_WIDTH = [int(x) for x in os.popen('stty size', 'r').read().split()]
-        except ValueError:
-            TTY_HEIGHT, TTY_WIDTH = 80, 80  # fall-back values
-    else:
-        TTY_HEIGHT, TTY_WIDTH = 80, 80
+TTY_HEIGHT, TTY_WIDTH = 80, 80  # fall-back values; main() determines the size of the terminal
 
 max_file_length = 0  # will be set after iterating over source files182
 
@@ -152,7 +162,19 @@ FILE_WITH_EXTENSION_REGEX_EXTENSION_INDEX = 2
 YYYY_MM_DD_PATTERN = re.compile(r'^(\d{4,4})-([01]\d)-([0123]\d)[- _T]')
 
 cache_of_tags_by_folder = {}
-cache_of_files_with_metadata = {}  # dict of big list of dicts: 'filename', 'path' and other metadata
+tag_index_connections = {}  # dict of open sqlite3 connections of tag indexes: index file name -> connection
+refreshed_tag_index_scopes = set()  # set of (index file name, startdir, recursive) which got refreshed in this run
+cache_of_files_with_metadata = {}  # dict of startdir -> FileCatalog with 'filename', 'path' and other metadata
+tagtrees_removal_threads = []  # threads removing replaced tagtrees of --tagtrees-staged in the background
+cache_of_inverted_tag_index = {}  # dict of (directory, recursive) -> (list of files, dict of tag -> set of positions in list)
+similar_tags_cache = None  # SimilarTagsCache, loaded on first use
+tag_similarity_worker_index = None  # TagSimilarityIndex of a worker process of --jobs
+cache_of_tag_cooccurrences = {}  # dict of (directory, frozenset of tags or None) -> (dict of tag -> dict of other tag -> count, list of tags by frequency)
+cache_of_path_tags = {}  # dict of absolute directory -> tuple of tags of the directory and all of its parents
+cache_of_parsed_basenames = OrderedDict()  # LRU cache of basename -> TaggedFileName; least recently used first
+parse_cache_statistics = {'hits': 0, 'misses': 0}
+cache_of_file_taggers = {}  # dict of vocabulary file name -> FileTagger of --daemon
+cache_of_directory_mtimes = {}  # dict of directory -> modification time when its caches got filled by a FileTagger
 controlled_vocabulary_filename = ''
 list_of_link_directories = []
 chosen_tagtrees_dir = False  # holds the definitive choice for a destination folder for filtering or tagtrees
@@ -183,6 +205,41 @@ parser.add_argument("-R", "--recursive", dest="recursive", action="store_true",
                     help="Recursively go through the current directory and all of its subdirectories. " +
                     "Implemented for --tag-gardening and --tagtrees")
 
+parser.add_argument("--jobs",
+                    dest="jobs",
+                    type=int,
+                    default=DEFAULT_JOBS,
+                    metavar='N',
+                    help="Number of parallel workers for traversing directory hierarchies and for " +
+                    "creating the directories and links of tagtrees. " +
+                    "Values larger than one help mostly on network file systems " +
+                    "where each request has to wait for the server. " +
+                    "With --tag-gardening, similar tags are searched by N processes on N cores. " +
+                    "The results do not depend on the number of workers. Default: " + str(DEFAULT_JOBS))
+
+parser.add_argument("--parse-cache-size",
+                    dest="parse_cache_size",
+                    type=int,
+                    default=DEFAULT_PARSE_CACHE_SIZE,
+                    metavar='N',
+                    help="Number of parsed file names to keep in memory. Large batches parse " +
+                    "the same file names repeatedly when filtering, collecting tags and " +
+                    "generating tagtrees. 0 disables the cache. Default: " + str(DEFAULT_PARSE_CACHE_SIZE))
+
+parser.add_argument("--no-cache", dest="no_cache", action="store_true",
+                    help="Do not read or write the caches in \"" + CACHE_DIRECTORY + "\" which keep " +
+                    "results like similar tags or parsed controlled vocabularies across runs")
+
+parser.add_argument("--daemon",
+                    dest="daemon_socket",
+                    nargs='?',
+                    const=DEFAULT_DAEMON_SOCKET,
+                    metavar='SOCKET',
+                    help="Run in the background and serve tag, untag, filter and list requests of " +
+                    "bin/filetags_client.py on the Unix socket SOCKET (default: \"" + DEFAULT_DAEMON_SOCKET +
+                    "\"). The controlled vocabulary, parsed file names and tags of directories are kept " +
+                    "in memory between requests. Combine with --index for large hierarchies.")
+
 parser.add_argument("-s", "--dryrun", dest="dryrun", action="store_true",
                     help="Enable dryrun mode: just simulate what would happen, do not modify files")
 
@@ -198,6 +255,12 @@ parser.add_argument("-f", "--filter", dest="tagfilter", action="store_true",
                     "containing links to all files with matching tags and start the filebrowser. " +
                     "Target directory can be overridden by --tagtrees-dir.")
 
+parser.add_argument("--query", dest="query", metavar='QUERY',
+                    help="Filter non-interactively for files matching a boolean tag query " +
+                    "like \"car (red OR blue) -draft\": tags next to each other are combined with AND, " +
+                    "OR and NOT (or a leading \"-\") are upper-case and parentheses group. " +
+                    "Implies --filter; may be combined with --tagtrees.")
+
 parser.add_argument("--filebrowser", dest="filebrowser", metavar='PATH_TO_FILEBROWSER',
                     help="Use this option to override the tool to view/manage files (for --filter; default: " +
                     DEFAULT_IMAGE_VIEWER_LINUX + "). Use \"none\" to omit the default one.")
@@ -258,6 +321,65 @@ parser.add_argument("--tagtrees-depth",
                     "symbolic links) the performance is really slow. " +
                     "Choose wisely.")
 
+parser.add_argument("--tagtrees-ordering",
+                    dest="tagtrees_ordering",
+                    choices=TAGTREES_ORDERINGS,
+                    default=TAGTREES_ORDERINGS[0],
+                    help="When tagtrees are created, \"permutations\" (the default) generates directories for " +
+                    "each order of tags like \"a/b\" and \"b/a\". " +
+                    "\"canonical\" only generates the alphabetically sorted order \"a/b\" which " +
+                    "reduces the number of links by the factorial of the depth. " +
+                    "\"canonical-aliases\" additionally adds relative symbolic links like \"b/a\" pointing " +
+                    "to \"../a/b\" so that any order can be browsed.")
+
+parser.add_argument("--tagtrees-max-links",
+                    dest="tagtrees_max_links",
+                    type=int,
+                    metavar='N',
+                    help="When tagtrees are created, the number of directories and links is computed " +
+                    "before touching the disk. If more than N links would be created, filetags aborts " +
+                    "without modifying anything.")
+
+parser.add_argument("--tagtrees-auto-depth",
+                    dest="tagtrees_auto_depth",
+                    action="store_true",
+                    help="Choose the deepest tagtrees depth whose links fit into --tagtrees-max-links. " +
+                    "A given --tagtrees-depth is used as upper limit.")
+
+parser.add_argument("--tagtrees-min-files",
+                    dest="tagtrees_min_files",
+                    type=int,
+                    default=1,
+                    metavar='N',
+                    help="When tagtrees are created, a directory of a combination of two or more tags is only " +
+                    "created when at least N files share this combination. This omits the many deep directories " +
+                    "holding only one or two links. Directories of single tags are always created. Default: 1")
+
+parser.add_argument("--tagtrees-staged",
+                    dest="tagtrees_staged",
+                    action="store_true",
+                    help="Build tagtrees in a sibling staging directory which replaces the old tagtrees " +
+                    "by renaming when it is complete. File browsers never show half-built tagtrees and the " +
+                    "old tagtrees get removed in the background.")
+
+parser.add_argument("--tagtrees-incremental",
+                    dest="tagtrees_incremental",
+                    action="store_true",
+                    help="Update existing tagtrees instead of deleting and re-creating them: only missing " +
+                    "links are created, stale links are removed and empty directories are pruned. " +
+                    "The links of the previous run are read from a manifest file located next to the " +
+                    "tagtrees directory. Without a manifest, the tagtrees are created from scratch.")
+
+parser.add_argument("--index",
+                    dest="use_index", action="store_true",
+                    help="Use a persistent tag index \"" + TAG_INDEX_FILENAME + "\" instead of traversing " +
+                    "the file system on each invocation. The index is located next to the \"" +
+                    CONTROLLED_VOCABULARY_FILENAME + "\" file of the current directory (or its parent " +
+                    "directories) or within the current directory if there is no such file. " +
+                    "It gets refreshed incrementally: only directories whose modification time has " +
+                    "changed are re-scanned. Implemented for --ln, --la, --lu, --tag-gardening, " +
+                    "--filter and --tagtrees")
+
 parser.add_argument("--ln", "--list-tags-by-number",
                     dest="list_tags_by_number", action="store_true",
                     help="List all file-tags sorted by their number of use")
@@ -287,7 +409,7 @@ parser.add_argument("--version",
                     dest="version", action="store_true",
                     help="Display version and exit")
 
-options = parser.parse_args()
+options = parser.parse_args([])  # default values when used as a library; main() parses the command line
 
 
 def handle_logging():
@@ -304,6 +426,25 @@ def handle_logging():
         logging.basicConfig(level=logging.INFO, format=FORMAT)
 
 
+def get_terminal_size():
+    """
+    Determines the window size of the terminal. This is done by main()
+    only so that importing filetags does not touch the terminal. Unlike
+    "stty size", os.get_terminal_size() does not start any process.
+
+    @param return: tuple of height and width; 80/80 on Windows or when stdin is not a terminal
+    """
+
+    # check to avoid errors when stdin is not a terminal.
+    if IS_WINDOWS or not sys.stdin.isatty():
+        return 80, 80
+    try:
+        size = os.get_terminal_size(sys.stdin.fileno())
+    except (OSError, ValueError):
+        return 80, 80  # fall-back values
+    return size.lines, size.columns
+
+
 def error_exit(errorcode, text):
     """exits with return value of errorcode and prints to stderr"""
 
@@ -317,6 +458,7 @@ class SimpleCompleter(object):
     # happily stolen from http://pymotw.com/2/readline/
 
     def __init__(self, options):
+        safe_import('readline')  # for tag completion when reading tags from stdin
         self.options = sorted(options)
 
         # removing '-' as a delimiter character in order to be able to use '-tagname' for removing:
@@ -348,6 +490,140 @@ class SimpleCompleter(object):
         return response
 
 
+class TaggedFileName(object):
+    """
+    Immutable record of a basename which is parsed once into its
+    components: the name (stem), the list of tags, the optional extension
+    and whether or not it is a Windows lnk file.
+
+    Operations like with_tag_added() are pure string operations without
+    any system call. They return new records so that several tags can be
+    added and removed before the new basename is rendered once with
+    str().
+
+    >>> name = TaggedFileName.parse('My photo -- foo.jpeg')
+    >>> str(name.with_tag_added('bar').with_tag_removed('foo'))
+    'My photo -- bar.jpeg'
+    """
+
+    __slots__ = ('stem', 'tags', 'extension', 'is_lnk')
+
+    def __init__(self, stem, tags=(), extension=None, is_lnk=False):
+        """
+        @param stem: string with the name without tags and extension
+        @param tags: tuple of tags
+        @param extension: string with the extension without the dot or None
+        @param is_lnk: boolean; True if the basename ends with ".lnk"
+        """
+        object.__setattr__(self, 'stem', stem)
+        object.__setattr__(self, 'tags', tuple(tags))
+        object.__setattr__(self, 'extension', extension)
+        object.__setattr__(self, 'is_lnk', is_lnk)
+
+    @classmethod
+    def parse(cls, basename):
+        """
+        Returns the record of basename. Since records are immutable, the
+        results are kept in a cache of the least recently used
+        basenames whose size is set by --parse-cache-size.
+
+        @param basename: an unicode string containing a file name without path
+        @param return: TaggedFileName
+        """
+
+        name = cache_of_parsed_basenames.get(basename)
+        if name is not None:
+            parse_cache_statistics['hits'] += 1
+            cache_of_parsed_basenames.move_to_end(basename)
+            return name
+
+        parse_cache_statistics['misses'] += 1
+        name = cls.parse_uncached(basename)
+        if options.parse_cache_size > 0:
+            cache_of_parsed_basenames[basename] = name
+            while len(cache_of_parsed_basenames) > options.parse_cache_size:
+                cache_of_parsed_basenames.popitem(last=False)
+        return name
+
+    @classmethod
+    def parse_uncached(cls, basename):
+        """
+        @param basename: an unicode string containing a file name without path
+        @param return: TaggedFileName
+        """
+
+        is_lnk = is_lnk_file(basename)
+        if is_lnk:
+            basename = basename[:-4]
+
+        components = re.match(FILE_WITH_TAGS_REGEX, basename)
+        if components:
+            return cls(components.group(FILE_WITH_TAGS_REGEX_FILENAME_INDEX),
+                       components.group(FILE_WITH_TAGS_REGEX_TAGLIST_INDEX).split(BETWEEN_TAG_SEPARATOR),
+                       components.group(FILE_WITH_TAGS_REGEX_EXTENSION_INDEX), is_lnk)
+
+        components = re.match(FILE_WITH_EXTENSION_REGEX, basename)
+        if components:
+            return cls(components.group(FILE_WITH_EXTENSION_REGEX_FILENAME_INDEX), (),
+                       components.group(FILE_WITH_EXTENSION_REGEX_EXTENSION_INDEX), is_lnk)
+        return cls(basename, (), None, is_lnk)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TaggedFileName is immutable')
+
+    def __eq__(self, other):
+        return isinstance(other, TaggedFileName) and \
+            (self.stem, self.tags, self.extension, self.is_lnk) == (other.stem, other.tags, other.extension, other.is_lnk)
+
+    def __hash__(self):
+        return hash((self.stem, self.tags, self.extension, self.is_lnk))
+
+    def __repr__(self):
+        return 'TaggedFileName(%r, %r, %r, %r)' % (self.stem, self.tags, self.extension, self.is_lnk)
+
+    def __str__(self):
+        basename = self.stem
+        if self.tags:
+            basename += FILENAME_TAG_SEPARATOR + BETWEEN_TAG_SEPARATOR.join(self.tags)
+        if self.extension is not None:
+            basename += '.' + self.extension
+        if self.is_lnk:
+            basename += '.lnk'
+        return basename
+
+    def contains_tag(self, tagname):
+        return tagname in self.tags
+
+    def with_tag_added(self, tagname):
+        """Returns a record with tagname appended to the tags unless it is already there"""
+        if tagname in self.tags:
+            return self
+        tags, extension = self.tags, self.extension
+        if extension is None and '.' in BETWEEN_TAG_SEPARATOR.join(tags):
+            # An extension which is no word like "tar-gz" is parsed as part of the
+            # tags but the new tag goes in front of it like it always did:
+            tags, extension = BETWEEN_TAG_SEPARATOR.join(tags).rsplit('.', 1)
+            tags = tuple(tags.split(BETWEEN_TAG_SEPARATOR))
+        return TaggedFileName(self.stem, tags + (tagname,), extension, self.is_lnk)
+
+    def with_tag_removed(self, tagname):
+        """Returns a record without any occurrence of tagname"""
+        if tagname not in self.tags:
+            return self
+        return TaggedFileName(self.stem, [x for x in self.tags if x != tagname], self.extension, self.is_lnk)
+
+    def with_tag_replaced(self, oldtag, newtag):
+        """Returns a record with each occurrence of oldtag replaced by newtag at the same position"""
+        if oldtag not in self.tags:
+            return self
+        tags = []
+        for tag in self.tags:
+            tag = newtag if tag == oldtag else tag
+            if tag not in tags:
+                tags.append(tag)
+        return TaggedFileName(self.stem, tags, self.extension, self.is_lnk)
+
+
 def contains_tag(filename, tagname=False):
     """
     Returns true if tagname is a tag within filename. If tagname is
@@ -362,17 +638,11 @@ def contains_tag(filename, tagname=False):
     if tagname:
         assert(tagname.__class__ == str)
 
-    filename, dirname, basename, basename_without_lnk = split_up_filename(filename)
-
-    components = re.match(FILE_WITH_TAGS_REGEX, os.path.basename(basename_without_lnk))
+    tags = TaggedFileName.parse(os.path.basename(filename)).tags
 
     if not tagname:
-        return components is not None
-    elif not components:
-        logging.debug("file [%s] does not match FILE_WITH_TAGS_REGEX" % filename)
-        return False
+        return len(tags) > 0
     else:
-        tags = components.group(FILE_WITH_TAGS_REGEX_TAGLIST_INDEX).split(BETWEEN_TAG_SEPARATOR)
         return tagname in tags
 
 
@@ -387,14 +657,7 @@ def extract_tags_from_filename(filename):
 
     assert(filename.__class__ == str)
 
-    filename, dirname, basename, basename_without_lnk = split_up_filename(filename)
-
-    components = re.match(FILE_WITH_TAGS_REGEX, basename_without_lnk)
-
-    if not components:
-        return []
-    else:
-        return components.group(FILE_WITH_TAGS_REGEX_TAGLIST_INDEX).split(BETWEEN_TAG_SEPARATOR)
+    return list(TaggedFileName.parse(os.path.basename(filename)).tags)
 
 
 def extract_tags_from_path(path):
@@ -402,60 +665,66 @@ def extract_tags_from_path(path):
     Returns list of all tags contained within the absolute path that may contain
     directories and an optional file. If no tag is found, return empty list.
 
+    The tags of the directories are taken from the cache of
+    get_path_tags_of_directory().
+
     @param path: an unicode string containing a path
     @param return: list of tags
     """
 
-    def splitall(path):
-        """
-        Snippet from https://www.safaribooksonline.com/library/view/python-cookbook/0596001673/ch04s16.html
-
-        >>> splitall('a/b/c')
-        ['a', 'b', 'c']
-        >>> splitall('/a/b/c/')
-        ['/', 'a', 'b', 'c', '']
-        >>> splitall('/')
-        ['/']
-        >>> splitall('C:')
-        ['C:']
-        >>> splitall('C:\\')
-        ['C:\\']
-        >>> splitall('C:\\a')
-        ['C:\\', 'a']
-        >>> splitall('C:\\a\\')
-        ['C:\\', 'a', '']
-        >>> splitall('C:\\a\\b')
-        ['C:\\', 'a', 'b']
-        >>> splitall('a\\b')
-        ['a', 'b']
-        """
-
-        allparts = []
-        while 1:
-            parts = os.path.split(path)
-            if parts[0] == path:  # sentinel for absolute paths
-                allparts.insert(0, parts[0])
-                break
-            elif parts[1] == path:  # sentinel for relative paths
-                allparts.insert(0, parts[1])
-                break
-            else:
-                path = parts[0]
-                allparts.insert(0, parts[1])
-        return allparts
-
     assert(path.__class__ == str)
 
-    tags = []
     abspath = os.path.abspath(path)
-    for item in splitall(abspath):
-        itemtags = extract_tags_from_filename(item)
-        for currentitemtag in itemtags:
-            if currentitemtag not in tags:
-                tags.append(currentitemtag)
+    parent, basename = os.path.split(abspath)
+    if not basename:
+        return list(get_path_tags_of_directory(abspath))
+    return list(merge_path_tags(get_path_tags_of_directory(parent), extract_tags_from_filename(basename)))
+
+
+def get_path_tags_of_directory(directory):
+    """
+    Returns the tags of directory and all of its parent directories like
+    extract_tags_from_path() does. The result of each directory is
+    cached and derived from the cached result of its parent so that all
+    files of a directory and all of its sub-directories share the work
+    of splitting and parsing the common path.
+
+    @param directory: an unicode string containing an absolute path of a directory
+    @param return: tuple of tags
+    """
+
+    tags = cache_of_path_tags.get(directory)
+    if tags is not None:
+        return tags
+
+    parent, basename = os.path.split(directory)
+    if parent == directory:
+        tags = ()  # root directory
+    elif not basename:
+        tags = get_path_tags_of_directory(parent)  # trailing separator
+    else:
+        tags = merge_path_tags(get_path_tags_of_directory(parent), extract_tags_from_filename(basename))
+
+    cache_of_path_tags[directory] = tags
     return tags
 
 
+def merge_path_tags(path_tags, tags):
+    """
+    Appends the tags of a path component to the tags of its parent
+    directories while skipping duplicates.
+
+    @param path_tags: tuple of tags of the parent directories
+    @param tags: list of tags of the path component
+    @param return: tuple of tags
+    """
+
+    new_tags = [x for x in dict.fromkeys(tags) if x not in path_tags]
+    if new_tags:
+        return path_tags + tuple(new_tags)
+    return path_tags
+
+
 def adding_tag_to_filename(filename, tagname):
     """
     Returns string of file name with tagname as additional tag.
@@ -468,50 +737,9 @@ def adding_tag_to_filename(filename, tagname):
     assert(filename.__class__ == str)
     assert(tagname.__class__ == str)
 
-    filename, dirname, basename, basename_without_lnk = split_up_filename(filename)
-
-    if contains_tag(basename_without_lnk) is False:
-        logging.debug("adding_tag_to_filename(%s, %s): no tag found so far" % (filename, tagname))
-
-        components = re.match(FILE_WITH_EXTENSION_REGEX, basename_without_lnk)
-        if components:
-            old_basename = components.group(FILE_WITH_EXTENSION_REGEX_FILENAME_INDEX)
-            extension = components.group(FILE_WITH_EXTENSION_REGEX_EXTENSION_INDEX)
-            if is_lnk_file(filename):
-                return os.path.join(dirname, old_basename + FILENAME_TAG_SEPARATOR +
-                                    tagname + '.' + extension + '.lnk')
-            else:
-                return os.path.join(dirname, old_basename + FILENAME_TAG_SEPARATOR +
-                                    tagname + '.' + extension)
-        else:
-            # filename has no extension
-            if is_lnk_file(filename):
-                return os.path.join(dirname, basename_without_lnk + FILENAME_TAG_SEPARATOR + tagname + '.lnk')
-            else:
-                return os.path.join(dirname, basename + FILENAME_TAG_SEPARATOR + tagname)
-
-    elif contains_tag(basename_without_lnk, tagname):
-        logging.debug("adding_tag_to_filename(%s, %s): tag already found in filename" % (filename, tagname))
-
-        return filename
+    filename, dirname, basename, basename_without_lnk = split_up_filename_pure(filename)
 
-    else:
-        logging.debug("adding_tag_to_filename(%s, %s): add as additional tag to existing list of tags" %
-                      (filename, tagname))
-
-        components = re.match(FILE_WITH_EXTENSION_REGEX, basename_without_lnk)
-        new_filename = False
-        if components:
-            old_basename = components.group(FILE_WITH_EXTENSION_REGEX_FILENAME_INDEX)
-            extension = components.group(FILE_WITH_EXTENSION_REGEX_EXTENSION_INDEX)
-            new_filename = os.path.join(dirname, old_basename + BETWEEN_TAG_SEPARATOR +
-                                        tagname + '.' + extension)
-        else:
-            new_filename = os.path.join(dirname, basename + BETWEEN_TAG_SEPARATOR + tagname)
-        if is_lnk_file(filename):
-            return new_filename + '.lnk'
-        else:
-            return new_filename
+    return os.path.join(dirname, str(TaggedFileName.parse(basename).with_tag_added(tagname)))
 
 
 def removing_tag_from_filename(orig_filename, tagname):
@@ -520,43 +748,17 @@ def removing_tag_from_filename(orig_filename, tagname):
 
     @param orig_filename: an unicode string containing a file name
     @param tagname: an unicode string containing a tag name
-    @param return: an unicode string of filename without tagname
+    @param return: orig_filename if it does not contain tagname; otherwise an unicode string of the basename without tagname
     """
 
     assert(orig_filename.__class__ == str)
     assert(tagname.__class__ == str)
 
-    if not contains_tag(orig_filename, tagname):
-        return orig_filename
-
-    filename, dirname, basename, basename_without_lnk = split_up_filename(orig_filename)
-    components = re.match(FILE_WITH_TAGS_REGEX, basename_without_lnk)
-
-    if not components:
-        logging.debug("file [%s] does not match FILE_WITH_TAGS_REGEX" % orig_filename)
+    name = TaggedFileName.parse(os.path.basename(orig_filename))
+    if not name.contains_tag(tagname):
         return orig_filename
-    else:
-        tags = components.group(FILE_WITH_TAGS_REGEX_TAGLIST_INDEX).split(BETWEEN_TAG_SEPARATOR)
-        old_filename = components.group(FILE_WITH_TAGS_REGEX_FILENAME_INDEX)
-        extension = components.group(FILE_WITH_TAGS_REGEX_EXTENSION_INDEX)
-        if not extension:
-            extension = ''
-        else:
-            extension = '.' + extension
 
-        new_filename = False
-        if len(tags) < 2:
-            logging.debug("given tagname is the only tag -> remove all tags and FILENAME_TAG_SEPARATOR as well")
-            new_filename = old_filename + extension
-        else:
-            # still tags left
-            new_filename = old_filename + FILENAME_TAG_SEPARATOR + \
-                BETWEEN_TAG_SEPARATOR.join([tag for tag in tags if tag != tagname]) + extension
-
-        if is_lnk_file(orig_filename):
-            return new_filename + '.lnk'
-        else:
-            return new_filename
+    return str(name.with_tag_removed(tagname))
 
 
 def extract_tags_from_argument(argument):
@@ -626,6 +828,8 @@ def print_item_transition(path, source, destination, transition):
     @param return: N/A
     """
 
+    safe_import('colorama')  # for colorful output
+
     transition_description = ''
     if transition == 'add':
         transition_description = 'renaming'
@@ -684,9 +888,8 @@ def find_unique_alternative_to_file(filename):
 
     # get existing filenames of the directory of filename:
     existingfilenames = []
-    for (dirpath, dirnames, filenames) in os.walk(path):
-        existingfilenames.extend(filenames)
-        break
+    for dirpath, subdir_entries, file_entries in scan_directory_tree(path, recursive=False):
+        existingfilenames.extend([x.name for x in file_entries])
 
     # reduce filename one character by character from the end and see if any
     # existing filename starts with this substring:
@@ -825,9 +1028,32 @@ def is_lnk_file(filename):
     return filename.upper().endswith('.LNK')
 
 
+def split_up_filename_pure(filename):
+    """
+    Returns separate strings for the given filename like
+    split_up_filename() but as a pure string operation: the file system
+    is not accessed and relative paths stay relative. Use this one for
+    parsing the many file names of directory listings.
+
+    @param filename: an unicode string containing a file name
+    @param return: filename, pathname, basename, basename without the optional ".lnk" extension
+    """
+
+    dirname, basename = os.path.split(filename)
+
+    if is_lnk_file(basename):
+        basename_without_lnk = basename[:-4]
+    else:
+        basename_without_lnk = basename
+
+    return os.path.join(dirname, basename), dirname, basename, basename_without_lnk
+
+
 def split_up_filename(filename, exception_on_file_not_found=False):
     """
-    Returns separate strings for the given filename.
+    Returns separate strings for the given filename. The path of an
+    existing file is resolved to an absolute one which costs a system
+    call. See split_up_filename_pure() for parsing without it.
 
     If filename is not a Windows lnk file, the "basename
     without the optional .lnk extension" is the same as
@@ -844,18 +1070,9 @@ def split_up_filename(filename, exception_on_file_not_found=False):
         else:
             logging.debug('split_up_filename(' + filename +
                           ') does NOT exist. Playing along and returning non-existent filename parts.')
-            dirname = os.path.dirname(filename)
-    else:
-        dirname = os.path.dirname(os.path.abspath(filename))
-
-    basename = os.path.basename(filename)
+            return split_up_filename_pure(filename)
 
-    if is_lnk_file(basename):
-        basename_without_lnk = basename[:-4]
-    else:
-        basename_without_lnk = basename
-
-    return os.path.join(dirname, basename), dirname, basename, basename_without_lnk
+    return split_up_filename_pure(os.path.abspath(filename))
 
 
 def handle_file_and_optional_link(orig_filename, tags, do_remove, do_filter, dryrun):
@@ -1082,45 +1299,35 @@ def handle_file(orig_filename, tags, do_remove, do_filter, dryrun):
             create_link(filename, os.path.join(chosen_tagtrees_dir, basename))
 
     else:  # add or remove tags:
-        new_basename = basename
-        logging.debug('handle_file: set new_basename [' + new_basename +
-                      '] according to parameters (initialization)')
+        # parse once, apply all tags and render the new basename at the end:
+        name = TaggedFileName.parse(basename)
 
         for tagname in tags:
             if tagname.strip() == '':
                 continue
             if do_remove:
-                new_basename = removing_tag_from_filename(new_basename, tagname)
-                logging.debug('handle_file: set new_basename [' + new_basename + '] when do_remove')
+                name = name.with_tag_removed(tagname)
             elif tagname[0] == '-':
-                new_basename = removing_tag_from_filename(new_basename, tagname[1:])
-                logging.debug('handle_file: set new_basename [' + new_basename + '] when tag starts with a minus')
+                name = name.with_tag_removed(tagname[1:])
             else:
                 # FIXXME: not performance optimized for large number of unique tags in many lists:
                 tag_in_unique_tags, matching_unique_tag_list = \
                     item_contained_in_list_of_lists(tagname, unique_tags)
 
-                if tagname != tag_in_unique_tags:
-                    new_basename = adding_tag_to_filename(new_basename, tagname)
-                    logging.debug('handle_file: set new_basename [' + new_basename +
-                                  '] when tagname != tag_in_unique_tags')
-                else:
+                if tagname == tag_in_unique_tags:
                     # if tag within unique_tags found, and new unique tag is given, remove old tag:
                     # e.g.: unique_tags = (u'yes', u'no') -> if 'no' should be added, remove existing tag 'yes' (and vice versa)
                     # If user enters contradicting tags, only the last one will be applied.
                     # FIXXME: this is an undocumented feature -> please add proper documentation
-
-                    current_filename_tags = extract_tags_from_filename(new_basename)
-                    conflicting_tags = list(set(current_filename_tags).intersection(matching_unique_tag_list))
+                    conflicting_tags = list(set(name.tags).intersection(matching_unique_tag_list))
                     logging.debug("handle_file: found unique tag %s which require old unique tag(s) to be removed: %s" %
                                   (tagname, repr(conflicting_tags)))
                     for conflicting_tag in conflicting_tags:
-                        new_basename = removing_tag_from_filename(new_basename, conflicting_tag)
-                        logging.debug('handle_file: set new_basename [' + new_basename +
-                                      '] when conflicting_tag in conflicting_tags')
-                    new_basename = adding_tag_to_filename(new_basename, tagname)
-                    logging.debug('handle_file: set new_basename [' + new_basename +
-                                  '] after adding_tag_to_filename()')
+                        name = name.with_tag_removed(conflicting_tag)
+                name = name.with_tag_added(tagname)
+
+        new_basename = str(name)
+        logging.debug('handle_file: set new_basename [' + new_basename + ']')
 
         new_filename = os.path.join(dirname, new_basename)
 
@@ -1157,10 +1364,7 @@ def add_tag_to_countdict(tag, tags):
     assert(tag.__class__ == str)
     assert(tags.__class__ == dict)
 
-    if tag in list(tags.keys()):
-        tags[tag] = tags[tag] + 1
-    else:
-        tags[tag] = 1
+    tags[tag] = tags.get(tag, 0) + 1
 
     return tags
 
@@ -1178,214 +1382,1389 @@ def extract_iso_datestamp_from_filename(filename):
         return []
 
 
-def get_files_with_metadata(startdir=os.getcwd(), use_cache=True):
+def list_directory(dirpath):
     """
-    Traverses the file system starting with given directory,
-    returns list: filename and metadata-dict:
+    Lists the entries of one single directory with os.scandir(). The
+    files of the tag index are no part of the archive and are omitted.
+    Entries are sorted by their names so that the result does not
+    depend on the order the file system returns them.
 
-    The result is stored in the global dict as
-    cache_of_files_with_metadata[startdir] with dict elements like:
-      'filename': '2018-03-18 this is a file name -- tag1 tag2.txt',
-      'filetags': ['tag1', 'tag2'],
-      'path': '/this/is -- tag1/the -- tag3/path',
-      'alltags': ['tag1', 'tag2', 'tag3'],
-      'ctime': time.struct_time,
-      'datestamp': ['2018', '03', '18'],
+    @param dirpath: string of a directory
+    @param return: tuple of list of DirEntry of sub-directories and list of DirEntry of files or None if dirpath could not be read
+    """
 
-    @param use_cache: FOR FUTURE USE; default = True
-    @param return: list of filenames and metadata-dict
+    subdir_entries = []
+    file_entries = []
+    try:
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.name.startswith(TAG_INDEX_FILENAME):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    subdir_entries.append(entry)
+                else:
+                    file_entries.append(entry)
+    except OSError as error:
+        logging.debug('list_directory: skipping directory [%s]: %s' % (dirpath, str(error)))
+        return None
+
+    subdir_entries.sort(key=lambda x: x.name)
+    file_entries.sort(key=lambda x: x.name)
+    return subdir_entries, file_entries
+
+
+def scan_directory_tree(startdir, recursive=True, jobs=None):
+    """
+    Traverses the file system starting with startdir using os.scandir()
+    and yields one tuple per directory, top-down like os.walk():
+    (dirpath, list of DirEntry of sub-directories, list of DirEntry of files)
+
+    In contrast to os.walk() plus os.path.islink() and friends on each
+    file name, the DirEntry items carry the file type of the directory
+    listing and cache the result of stat(). Asking them whether or not
+    they are links or for their ctime does not cost any additional
+    system call on most platforms (or one stat() at most).
+
+    Links to directories are listed as sub-directories but they are not
+    followed. Directories that can not be read are skipped.
+
+    With more than one job, sub-directories are listed concurrently on a
+    pool of jobs threads as soon as their parent directory is known.
+    This hides the latency of network file systems. The order of the
+    yielded directories is the same as with one job: depth-first with
+    entries sorted by name.
+
+    @param startdir: string of an existing directory
+    @param recursive: boolean; if False, only startdir itself is listed
+    @param jobs: number of threads listing directories; default: options.jobs
+    @param return: generator of (dirpath, subdir_entries, file_entries)
     """
 
-    global cache_of_files_with_metadata
+    if jobs is None:
+        jobs = options.jobs
 
-    assert(os.path.isdir(startdir))
+    if not recursive or jobs < 2:
+        pending = [startdir]
+        while pending:
+            dirpath = pending.pop()
+            listing = list_directory(dirpath)
+            if listing is None:
+                continue
+            subdir_entries, file_entries = listing
 
-    logging.debug('get_files_with_metadata called with startdir [%s], cached startdirs [%s]' %
-                  (startdir, str(len(list(cache_of_files_with_metadata.keys())))))
+            yield dirpath, subdir_entries, file_entries
 
-    if use_cache and len(cache_of_files_with_metadata) > 0:
-        logging.debug("found " + str(len(cache_of_files_with_metadata)) + " files in cache for files")
-        return cache_of_files_with_metadata
+            if recursive:
+                # reversed so that the directories get popped in listing order:
+                pending.extend(reversed([x.path for x in subdir_entries if not x.is_symlink()]))
 
     else:
+        from concurrent.futures import ThreadPoolExecutor  # for listing directories in parallel
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        try:
+            pending = [(startdir, executor.submit(list_directory, startdir))]
+            while pending:
+                dirpath, future = pending.pop()
+                listing = future.result()
+                if listing is None:
+                    continue
+                subdir_entries, file_entries = listing
 
-        cache = []
-        for root, dirs, files in os.walk(startdir):
+                # submit the sub-directories before handing over the current
+                # one so that the pool keeps on listing in the meantime:
+                children = [(x.path, executor.submit(list_directory, x.path))
+                            for x in subdir_entries if not x.is_symlink()]
 
-            # logging.debug('get_files_with_metadata: root [%s]' % root)  # LOTS of debug output
-            for filename in files:
+                yield dirpath, subdir_entries, file_entries
 
-                absfilename = os.path.abspath(os.path.join(root, filename))
-                # logging.debug('get_files_with_metadata: file [%s]' % absfilename)  # LOTS of debug output
-                path, basename = os.path.split(absfilename)
-                if os.path.islink(absfilename):
-                    # link files do not have ctime and must be dereferenced before. However, they can link to another link file or they can be broken.
-                    # Design decision: ignoring link files alltogether. Their source should speak for themselves.
-                    logging.debug('get_files_with_metadata: file [%s] is link to [%s] and gets ignored here' %
-                                  (absfilename,
-                                   os.path.join(os.path.dirname(absfilename), os.readlink(absfilename))))
-                    continue
-                else:
-                    ctime = time.localtime(os.path.getctime(absfilename))
-
-                cache.append({
-                    'filename': basename,
-                    'filetags': extract_tags_from_filename(basename),
-                    'path': path,
-                    'alltags': extract_tags_from_path(absfilename),
-                    'ctime': ctime,
-                    'datestamp': extract_iso_datestamp_from_filename(basename)
-                })
-
-            # Enable recursive directory traversal for specific options:
-            if not (options.recursive and (options.list_tags_by_alphabet or
-                                           options.list_tags_by_number or
-                                           options.list_unknown_tags or
-                                           options.tag_gardening)):
-                break  # do not loop
-
-        logging.debug("Writing " + str(len(cache)) + " files in cache for directory: " + startdir)
-        if use_cache:
-            cache_of_files_with_metadata[startdir] = cache
-        return cache
+                pending.extend(reversed(children))
+        finally:
+            # the consumer may stop early: do not list what is not needed anymore
+            for dirpath, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
 
 
-def get_tags_from_files_and_subfolders(startdir=os.getcwd(), use_cache=True):
+TAG_INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, parent TEXT, mtime INTEGER, islink INTEGER);
+CREATE INDEX IF NOT EXISTS directories_by_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS files (path TEXT, filename TEXT, filetags TEXT, ctime REAL, islink INTEGER,
+                                  PRIMARY KEY (path, filename));
+CREATE TABLE IF NOT EXISTS cooccurrences (path TEXT, tag TEXT, other TEXT, count INTEGER,
+                                          PRIMARY KEY (path, tag, other));
+'''
+
+
+def get_tag_index_filename(startdir):
     """
-    Traverses the file system starting with given directory,
-    returns dict of all tags (including starttags) of all file.
-    Uses cache_of_files_with_metadata of use_cache is true and
-    cache is populated with same startdir.
+    Returns the file name of the persistent tag index which belongs to
+    startdir. The index is located next to the controlled vocabulary
+    file of the archive or within startdir if there is no such file.
 
-    @param use_cache: FOR FUTURE USE
-    @param return: dict of tags and their number of occurrence
+    @param startdir: string of an existing directory
+    @param return: string with the absolute file name of the tag index
     """
 
-    # add ", starttags=False" to parameters to enable this feature in future
-    starttags = False
+    vocabulary_filename = locate_file_in_cwd_and_parent_directories(startdir, CONTROLLED_VOCABULARY_FILENAME)
+    if vocabulary_filename:
+        return os.path.join(os.path.dirname(os.path.abspath(vocabulary_filename)), TAG_INDEX_FILENAME)
+    else:
+        return os.path.join(os.path.abspath(startdir), TAG_INDEX_FILENAME)
 
-    assert(os.path.isdir(startdir))
 
-    if not starttags:
-        tags = {}
-    else:
-        assert(starttags.__class__ == dict)
-        tags = starttags
+def open_tag_index(index_filename):
+    """
+    Opens (and creates if necessary) the tag index database. Connections
+    are kept open for the rest of the run.
 
-    global cache_of_tags_by_folder
+    @param index_filename: string with the file name of the tag index
+    @param return: sqlite3 connection
+    """
 
-    logging.debug('get_tags_from_files_and_subfolders called with startdir [%s], cached startdirs [%s]' %
-                  (startdir, str(len(list(cache_of_tags_by_folder.keys())))))
+    global tag_index_connections
+
+    if index_filename not in tag_index_connections:
+        safe_import('sqlite3')  # for the persistent tag index
+        logging.debug('open_tag_index: opening tag index [%s]' % index_filename)
+        connection = sqlite3.connect(index_filename)
+        # A journal file next to the index would modify the directory it is located in on
+        # each commit which would cause a re-scan of this directory with each run. The
+        # index is a cache which can be deleted any time. Therefore, keep the journal in memory:
+        connection.execute('PRAGMA journal_mode = MEMORY')
+        if connection.execute('PRAGMA user_version').fetchone()[0] != TAG_INDEX_VERSION:
+            logging.debug('open_tag_index: index was created by a different version; re-building it')
+            connection.executescript('DROP TABLE IF EXISTS directories; DROP TABLE IF EXISTS files; ' +
+                                     'DROP TABLE IF EXISTS cooccurrences;')
+            connection.execute('PRAGMA user_version = %i' % TAG_INDEX_VERSION)
+            connection.commit()
+        connection.executescript(TAG_INDEX_SCHEMA)
+        tag_index_connections[index_filename] = connection
+    return tag_index_connections[index_filename]
+
+
+def remove_directory_from_tag_index(connection, directory):
+    """
+    Removes a directory and everything below it from the tag index.
 
-    if use_cache and startdir in list(cache_of_tags_by_folder.keys()):
-        logging.debug("get_tags_from_files_and_subfolders: found " + str(len(cache_of_tags_by_folder[startdir])) +
-                      " tags in cache for directory: " + startdir)
-        return cache_of_tags_by_folder[startdir]
+    @param connection: sqlite3 connection of the tag index
+    @param directory: string with an absolute directory name
+    """
 
-    elif use_cache and startdir in cache_of_files_with_metadata.keys():
-        logging.debug('get_tags_from_files_and_subfolders: using cache_of_files_with_metadata instead of traversing file system again')
-        cachedata = cache_of_files_with_metadata[startdir]
+    prefix = directory.rstrip(os.sep) + os.sep
+    connection.execute('DELETE FROM directories WHERE path = ? OR substr(path, 1, ?) = ?',
+                       (directory, len(prefix), prefix))
+    connection.execute('DELETE FROM files WHERE path = ? OR substr(path, 1, ?) = ?',
+                       (directory, len(prefix), prefix))
+    connection.execute('DELETE FROM cooccurrences WHERE path = ? OR substr(path, 1, ?) = ?',
+                       (directory, len(prefix), prefix))
 
-        # FIXXME: check if tags are extracted from dirnames as in traversal algorithm below
 
-        for entry in cachedata:
-            for tag in entry['alltags']:
-                tags = add_tag_to_countdict(tag, tags)
+def scan_directory_for_tag_index(directory, known_mtime):
+    """
+    Checks whether directory has changed since it was scanned for the
+    tag index and lists it if so. This does not touch the index and
+    therefore runs on the threads of refresh_tag_index() with --jobs.
 
-    else:
+    @param directory: string with an absolute directory name
+    @param known_mtime: modification time of directory in nanoseconds as stored in the index or None
+    @param return: tuple of (scan time in nanoseconds, modification time in nanoseconds or None if directory vanished, listing or None if unchanged); listing: see list_directory(); unreadable directories are listed as empty
+    """
 
-        for root, dirs, files in os.walk(startdir):
+    scan_time = time.time_ns()
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return scan_time, None, None
+    if mtime == known_mtime:
+        return scan_time, mtime, None
 
-            # logging.debug('get_tags_from_files_and_subfolders: root [%s]' % root)  # LOTS of debug output
+    listing = list_directory(directory) or ([], [])
+    for entry in listing[1]:
+        if not entry.is_symlink():
+            entry.stat()  # the ctime is cached by the DirEntry
+    return scan_time, mtime, listing
 
-            for filename in files:
-                for tag in extract_tags_from_filename(filename):
-                    tags = add_tag_to_countdict(tag, tags)
 
-            for dirname in dirs:
-                for tag in extract_tags_from_filename(dirname):
-                    tags = add_tag_to_countdict(tag, tags)
+def rescan_directory_for_tag_index(connection, directory, mtime, listing):
+    """
+    Replaces the index entries of the files of one single directory with
+    its listing. Sub-directories are registered without modification
+    time so that they get scanned once they are visited.
+
+    @param connection: sqlite3 connection of the tag index
+    @param directory: string with an absolute directory name
+    @param mtime: modification time of directory in nanoseconds or None for scanning it again next time
+    @param listing: tuple of list of DirEntry of sub-directories and list of DirEntry of files, see list_directory()
+    @param return: list of (non-link) sub-directories of directory
+    """
 
-            # Enable recursive directory traversal for specific options:
-            if not (options.recursive and (options.list_tags_by_alphabet or
-                                           options.list_tags_by_number or
-                                           options.list_unknown_tags or
-                                           options.tag_gardening)):
-                break  # do not loop
+    subdirs = []
+    linked_subdirs = []
+    subdir_entries, file_entries = listing
+    subdir_names = [x.name for x in subdir_entries]
+    for entry in subdir_entries:
+        # like os.walk(): links to directories are listed but not followed
+        if entry.is_symlink():
+            linked_subdirs.append(entry.path)
+        else:
+            subdirs.append(entry.path)
+    rows = []
+    for entry in file_entries:
+        islink = entry.is_symlink()
+        rows.append((directory,
+                     entry.name,
+                     BETWEEN_TAG_SEPARATOR.join(extract_tags_from_filename(entry.name)),
+                     None if islink else entry.stat().st_ctime,
+                     int(islink)))
+
+    current_subdirs = set(subdirs + linked_subdirs)
+    known_subdirs = [x[0] for x in connection.execute('SELECT path FROM directories WHERE parent = ?', (directory,))]
+    for known_subdir in known_subdirs:
+        if known_subdir not in current_subdirs:
+            remove_directory_from_tag_index(connection, known_subdir)
+
+    for subdir in subdirs + linked_subdirs:
+        connection.execute('INSERT OR IGNORE INTO directories (path, parent, mtime, islink) VALUES (?, ?, NULL, ?)',
+                           (subdir, directory, int(subdir in linked_subdirs)))
+        connection.execute('UPDATE directories SET islink = ? WHERE path = ?',
+                           (int(subdir in linked_subdirs), subdir))
+
+    # Renaming a file equals removing the old name and adding the new one:
+    known_filenames = set(x[0] for x in connection.execute('SELECT filename FROM files WHERE path = ?', (directory,)))
+    current_filenames = set(x[1] for x in rows)
+    known_subdir_names = set(os.path.basename(x) for x in known_subdirs)
+    update_tag_cooccurrences_in_tag_index(
+        connection, directory,
+        [x for x in current_filenames if x not in known_filenames],
+        [x for x in known_filenames if x not in current_filenames],
+        [x for x in subdir_names if x not in known_subdir_names],
+        [x for x in known_subdir_names if x not in set(subdir_names)])
+
+    connection.execute('DELETE FROM files WHERE path = ?', (directory,))
+    connection.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?)', rows)
+    connection.execute('INSERT OR REPLACE INTO directories (path, parent, mtime, islink) VALUES (?, ?, ?, 0)',
+                       (directory, os.path.dirname(directory), mtime))
+
+    return subdirs
+
+
+def update_tag_cooccurrences_in_tag_index(connection, directory, added_files, removed_files,
+                                          added_subdirs, removed_subdirs):
+    """
+    Applies the difference of the co-occurrences of the tags of the
+    added and removed names to the ones of directory in the tag index.
+    Pairs whose count drops to zero are removed. The work is
+    proportional to the number of changed names, not to the number of
+    files of directory.
+
+    @param connection: sqlite3 connection of the tag index
+    @param directory: string with an absolute directory name
+    @param added_files: list of file names which are new in directory
+    @param removed_files: list of file names which are gone from directory
+    @param added_subdirs: list of names of new sub-directories
+    @param removed_subdirs: list of names of sub-directories which are gone
+    """
 
-    logging.debug("get_tags_from_files_and_subfolders: Writing " + str(len(list(tags.keys()))) +
-                  " tags in cache for directory: " + startdir)
-    if use_cache:
-        cache_of_tags_by_folder[startdir] = tags
-    return tags
+    delta = count_tag_cooccurrences([extract_tags_from_filename(x) for x in added_files],
+                                    [extract_tags_from_filename(x) for x in added_subdirs])
+    for tag, others in count_tag_cooccurrences([extract_tags_from_filename(x) for x in removed_files],
+                                               [extract_tags_from_filename(x) for x in removed_subdirs]).items():
+        for other, count in others.items():
+            delta.setdefault(tag, {})[other] = delta.get(tag, {}).get(other, 0) - count
 
+    changes = [(count, directory, tag, other) for tag, others in delta.items()
+               for other, count in others.items() if count]
+    if not changes:
+        return
+    connection.executemany('INSERT OR IGNORE INTO cooccurrences VALUES (?, ?, ?, 0)',
+                           [(path, tag, other) for count, path, tag, other in changes])
+    connection.executemany('UPDATE cooccurrences SET count = count + ? WHERE path = ? AND tag = ? AND other = ?',
+                           changes)
+    if any(x[0] < 0 for x in changes):
+        connection.execute('DELETE FROM cooccurrences WHERE path = ? AND count <= 0', (directory,))
 
-def find_similar_tags(tag, tags):
-    """
-    Returns a list of entries of tags that are similar to tag (but not same as tag)
 
-    @param tag: a (unicode) string that represents a tag
-    @param tags: a list of (unicode) strings
-    @param return: list of tags that are similar to tag
+def refresh_tag_index(connection, startdir, recursive):
+    """
+    Brings the tag index up to date for startdir (and all of its
+    sub-directories if recursive is set). Only directories whose
+    modification time differs from the one stored in the index get
+    re-scanned; unchanged directories cost one stat() call.
+
+    Renaming, adding or removing a file changes the modification time
+    of its directory. Therefore, tags within file names stay in sync.
+    On file systems with coarse timestamps, a change within the same
+    tick as the previous scan does not change the modification time.
+    Like git does for its index, the modification time of directories
+    changed less than TAG_INDEX_MTIME_GRANULARITY seconds before they
+    were scanned is not stored: they are scanned again next time.
+
+    Directories are visited level by level. With --jobs, the directories
+    of one level are checked and listed on a pool of threads while the
+    index is only modified by the calling thread.
+
+    @param connection: sqlite3 connection of the tag index
+    @param startdir: string of an existing directory
+    @param recursive: boolean; if True, sub-directories are refreshed as well
+    @param return: number of directories that had to be re-scanned
     """
 
-    assert(tag.__class__ == str)
-    assert(tags.__class__ == list)
+    num_rescanned = 0
+    num_visited = 0
+    executor = None
+    if recursive and options.jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor  # for listing directories in parallel
+        executor = ThreadPoolExecutor(max_workers=options.jobs)
+    try:
+        pending = [os.path.abspath(startdir)]
+        while pending:
+            known_mtimes = []
+            for directory in pending:
+                row = connection.execute('SELECT mtime FROM directories WHERE path = ?', (directory,)).fetchone()
+                known_mtimes.append(row[0] if row else None)
+            if executor:
+                results = executor.map(scan_directory_for_tag_index, pending, known_mtimes)
+            else:
+                results = map(scan_directory_for_tag_index, pending, known_mtimes)
+
+            subdirs = []
+            for directory, (scan_time, mtime, listing) in zip(pending, results):
+                num_visited += 1
+                if mtime is None:
+                    logging.debug('refresh_tag_index: directory [%s] vanished; removing it from the index' % directory)
+                    remove_directory_from_tag_index(connection, directory)
+                elif listing is None:
+                    subdirs.extend(x[0] for x in connection.execute(
+                        'SELECT path FROM directories WHERE parent = ? AND islink = 0', (directory,)))
+                else:
+                    # logging.debug('refresh_tag_index: re-scanning [%s]' % directory)  # LOTS of debug output
+                    if scan_time - mtime < TAG_INDEX_MTIME_GRANULARITY * 10**9:
+                        mtime = None
+                    subdirs.extend(rescan_directory_for_tag_index(connection, directory, mtime, listing))
+                    num_rescanned += 1
+            pending = subdirs if recursive else []
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+
+    connection.commit()
+    logging.debug('refresh_tag_index: re-scanned %i of %i directories below [%s]' %
+                  (num_rescanned, num_visited, startdir))
+    return num_rescanned
+
+
+def get_refreshed_tag_index(startdir, recursive):
+    """
+    Returns the connection to the tag index of startdir which is
+    refreshed (once per run) for startdir.
 
-    similar_tags = difflib.get_close_matches(tag, tags, n=999, cutoff=0.7)
-    close_but_not_exact_matches = []
+    @param startdir: string of an existing directory
+    @param recursive: boolean; if True, sub-directories are refreshed as well
+    @param return: sqlite3 connection
+    """
 
-    # omit exact matches   FIXXME: this can be done in one eloquent line -> refactor
-    for match in similar_tags:
-        if match != tag:
-            close_but_not_exact_matches.append(match)
+    global refreshed_tag_index_scopes
 
-    return close_but_not_exact_matches
+    startdir = os.path.abspath(startdir)
+    index_filename = get_tag_index_filename(startdir)
+    connection = open_tag_index(index_filename)
+    if (index_filename, startdir, True) not in refreshed_tag_index_scopes and \
+       (index_filename, startdir, recursive) not in refreshed_tag_index_scopes:
+        refresh_tag_index(connection, startdir, recursive)
+        refreshed_tag_index_scopes.add((index_filename, startdir, recursive))
+    return connection
 
 
-def print_tag_dict(tag_dict_reference, vocabulary=False, sort_index=0,
-                   print_similar_vocabulary_tags=False, print_only_tags_with_similar_tags=False):
+def get_tag_index_scope_condition(column, startdir, recursive):
     """
-    Takes a dictionary which holds tag names and their occurrence and prints it to stdout.
-    Tags that appear also in the vocabulary get marked in the output.
+    Returns the SQL condition and its parameters that restrict column to
+    startdir (and its sub-directories if recursive is set).
 
-    @param tag_dict: a dictionary holding tags and their occurrence number
-    @param vocabulary: array of tags from controlled vocabulary or False
+    @param column: string with the name of the column holding directory names
+    @param startdir: string with an absolute directory name
+    @param recursive: boolean
+    @param return: tuple of SQL condition string and tuple of parameters
     """
 
-    tag_dict = {}
-    tag_dict = tag_dict_reference
-
-    # determine maximum length of strings for formatting:
-    if len(tag_dict) > 0:
-        maxlength_tags = max(len(s) for s in list(tag_dict.keys())) + \
-            len(HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE)
-        maxlength_count = len(str(abs(max(tag_dict.values()))))
+    if recursive:
+        prefix = startdir.rstrip(os.sep) + os.sep
+        return '(' + column + ' = ? OR substr(' + column + ', 1, ?) = ?)', (startdir, len(prefix), prefix)
     else:
-        maxlength_tags = len(HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE)
-        maxlength_count = 5
+        return column + ' = ?', (startdir,)
 
-    if maxlength_count < 5:
-        maxlength_count = 5
 
-    hint_for_being_in_vocabulary = ''
-    similar_tags = ''
-    if vocabulary:
-        print("\n  (Tags marked with \"" + HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE.strip() +
-              "\" appear in your vocabulary.)")
-    print("\n {0:{1}} : {2:{3}}".format('count', maxlength_count, 'tag', maxlength_tags))
-    print(" " + '-' * (maxlength_tags + maxlength_count + 7))
-    for tuple in sorted(list(tag_dict.items()), key=operator.itemgetter(sort_index)):
-        # sort dict of (tag, count) according to sort_index
+def get_tag_index_scan_order_key(path, filename):
+    """
+    Returns the sort key which orders the files of the tag index like
+    scan_directory_tree() lists them: depth-first with the entries of
+    each directory sorted by name and the files of a directory in front
+    of the ones of its sub-directories. Sorting by the path as a string
+    would put "dir a" in front of "dir/sub" since " " < "/".
+
+    @param path: string with the directory of the file
+    @param filename: string with the name of the file
+    @param return: tuple of the list of path components and filename
+    """
 
-        if vocabulary and tuple[0] in vocabulary:
-            hint_for_being_in_vocabulary = HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE
-        else:
-            hint_for_being_in_vocabulary = ''
+    return path.split(os.sep), filename
+
+
+class FileCatalog(object):
+    """
+    Columnar storage of the metadata of many files as returned by
+    get_files_with_metadata().
+
+    Instead of one dict per file, each property is held in one column
+    for all files: tags are interned to integer IDs and stored in flat
+    arrays with the offsets of each file, directories are shared
+    references and ctime is stored as epoch float. The alltags and
+    datestamp of a file are derived from its path and file name on
+    access.
+
+    The catalog is a sequence of read-only FileRecord views which
+    behave like the metadata-dicts used before:
+
+    >>> catalog = FileCatalog()
+    >>> catalog.append(catalog.add_directory('/this/is -- tag3'), 'a file -- tag1.txt', ['tag1'], 0.0)
+    >>> catalog[0]['alltags']
+    ['tag3', 'tag1']
+    """
+
+    def __init__(self):
+        self.tag_ids = {}  # dict of tag -> ID
+        self.tag_names = []  # list of tags; index = ID
+        self.directory_ids = {}  # dict of path -> ID
+        self.directories = []  # list of paths; index = ID
+        self.filenames = []
+        self.file_directories = array('I')  # directory ID of each file
+        self.ctimes = array('d')  # ctime of each file in seconds since the epoch
+        self.file_tag_ids = array('I')  # tag IDs of all files, one after another
+        self.file_tag_offsets = array('I', [0])  # file i has file_tag_ids[offsets[i]:offsets[i + 1]]
+
+    def add_directory(self, path):
+        """
+        @param path: string with the absolute path of a directory
+        @param return: integer ID of the directory
+        """
+
+        directory_id = self.directory_ids.get(path)
+        if directory_id is None:
+            directory_id = self.directory_ids[path] = len(self.directories)
+            self.directories.append(path)
+        return directory_id
+
+    def get_tag_id(self, tag):
+        """
+        @param tag: string with a tag
+        @param return: integer ID of the tag
+        """
+
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self.tag_ids[tag] = len(self.tag_names)
+            self.tag_names.append(tag)
+        return tag_id
+
+    def append(self, directory_id, filename, filetags, ctime):
+        """
+        @param directory_id: integer ID of the directory as returned by add_directory()
+        @param filename: string with the basename of the file
+        @param filetags: list of tags of the file name
+        @param ctime: float of the ctime in seconds since the epoch
+        """
+
+        self.filenames.append(filename)
+        self.file_directories.append(directory_id)
+        self.ctimes.append(ctime)
+        self.file_tag_ids.extend(self.get_tag_id(x) for x in filetags)
+        self.file_tag_offsets.append(len(self.file_tag_ids))
+
+    def get_filetags(self, position):
+        """
+        @param position: integer index of the file
+        @param return: list of tags of the file name
+        """
+
+        tag_names = self.tag_names
+        return [tag_names[x] for x in
+                self.file_tag_ids[self.file_tag_offsets[position]:self.file_tag_offsets[position + 1]]]
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [FileRecord(self, x) for x in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('FileCatalog index out of range')
+        return FileRecord(self, position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield FileRecord(self, position)
+
+
+class FileRecord(Mapping):
+    """
+    Read-only dict-like view of one file of a FileCatalog with the keys
+    of the metadata-dicts of get_files_with_metadata(). The values are
+    created on access.
+    """
+
+    __slots__ = ('catalog', 'position')
+
+    KEYS = ('filename', 'filetags', 'path', 'alltags', 'ctime', 'datestamp')
+
+    def __init__(self, catalog, position):
+        self.catalog = catalog
+        self.position = position
+
+    def __getitem__(self, key):
+        catalog = self.catalog
+        if key == 'filename':
+            return catalog.filenames[self.position]
+        elif key == 'filetags':
+            return catalog.get_filetags(self.position)
+        elif key == 'path':
+            return catalog.directories[catalog.file_directories[self.position]]
+        elif key == 'alltags':
+            return list(merge_path_tags(get_path_tags_of_directory(self['path']), self['filetags']))
+        elif key == 'ctime':
+            return time.localtime(catalog.ctimes[self.position])
+        elif key == 'datestamp':
+            return extract_iso_datestamp_from_filename(catalog.filenames[self.position])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return 'FileRecord(' + repr(dict(self)) + ')'
+
+
+def import_numpy():
+    """
+    NumPy is an optional dependency: it speeds up the statistics of
+    TagMatrix but filetags works without it.
+
+    @param return: the numpy module or None if it is not installed
+    """
+
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class TagMatrix(object):
+    """
+    Boolean file×tag matrix for statistics over many files like the
+    ones of --tag-gardening: the number of files per tag, of files with
+    any tag of a tag group, and of files sharing tags.
+
+    With NumPy, the matrix is stored sparse as two arrays of file and tag
+    positions of all set cells and the statistics are computed as
+    vectorized bincounts. Without NumPy, each tag column is an array of
+    the positions of its files. Bit sets held in Python integers (bit
+    i = file i) are built in one pass only for the tags which are
+    combined. Setting bits of a growing integer one by one would copy
+    it each time and take quadratic time.
+
+    >>> matrix = TagMatrix([['a', 'b'], ['b'], []], use_numpy=False)
+    >>> matrix.counts()
+    {'a': 1, 'b': 2}
+    >>> matrix.count_files_with_any(['a', 'b', 'unknown'])
+    2
+    """
+
+    def __init__(self, rows, use_numpy=None):
+        """
+        @param rows: iterable with one list of tags per file
+        @param use_numpy: boolean; None for using NumPy if it is installed
+        """
+
+        self.tag_ids = {}  # dict of tag -> column
+        self.tags = []  # list of tags; index = column
+        self.number_of_files = 0
+        file_positions = array('I')
+        tag_positions = array('I')
+        for tags in rows:
+            # a tag given twice for one file is counted once:
+            for tag in dict.fromkeys(tags):
+                tag_id = self.tag_ids.get(tag)
+                if tag_id is None:
+                    tag_id = self.tag_ids[tag] = len(self.tags)
+                    self.tags.append(tag)
+                file_positions.append(self.number_of_files)
+                tag_positions.append(tag_id)
+            self.number_of_files += 1
+
+        self.numpy = import_numpy() if use_numpy is not False else None
+        if use_numpy and not self.numpy:
+            logging.warning('NumPy is not installed; tag statistics are computed without it')
+        logging.debug('TagMatrix: %i files, %i tags, %i tagged cells, NumPy: %s' %
+                      (self.number_of_files, len(self.tags), len(tag_positions), bool(self.numpy)))
+
+        if self.numpy:
+            self.file_positions = self.numpy.array(file_positions, dtype=self.numpy.intp)
+            self.tag_positions = self.numpy.array(tag_positions, dtype=self.numpy.intp)
+            self.column_sums = self.numpy.bincount(self.tag_positions, minlength=len(self.tags))
+        else:
+            self.file_positions = file_positions
+            self.tag_positions = tag_positions
+            self.columns = [array('I') for tag in self.tags]  # list of file positions per tag
+            for file_position, tag_id in zip(file_positions, tag_positions):
+                self.columns[tag_id].append(file_position)
+            self.column_sums = [len(x) for x in self.columns]
+
+    def get_files_with_any(self, tags):
+        """
+        @param tags: list of tags
+        @param return: NumPy boolean array of the files or integer bit set without NumPy
+        """
+
+        tag_ids = [self.tag_ids[x] for x in tags if x in self.tag_ids]
+        if self.numpy:
+            files = self.numpy.zeros(self.number_of_files, dtype=bool)
+            files[self.file_positions[self.numpy.isin(self.tag_positions, tag_ids)]] = True
+            return files
+        bitmap = bytearray((self.number_of_files + 7) // 8)
+        for tag_id in tag_ids:
+            for file_position in self.columns[tag_id]:
+                bitmap[file_position >> 3] |= 1 << (file_position & 7)
+        return int.from_bytes(bitmap, 'little')
+
+    def count_files_with_any(self, tags):
+        """
+        @param tags: list of tags
+        @param return: integer; number of files with at least one of the tags
+        """
+
+        files = self.get_files_with_any(tags)
+        if self.numpy:
+            return int(files.sum())
+        return bin(files).count('1')
+
+    def count_files_without_tags(self):
+        """
+        @param return: integer; number of files without any tag
+        """
+
+        return self.number_of_files - self.count_files_with_any(self.tags)
+
+    def counts(self):
+        """
+        @param return: dict of tag -> number of files with tag in order of first occurrence
+        """
+
+        return {tag: int(count) for tag, count in zip(self.tags, self.column_sums)}
+
+    def top(self, number):
+        """
+        @param number: integer; maximum number of tags to return
+        @param return: list of (tag, number of files) with the most frequent tags first; ties in order of first occurrence
+        """
+
+        if self.numpy:
+            ranking = self.numpy.argsort(-self.numpy.asarray(self.column_sums, dtype=self.numpy.int64),
+                                         kind='stable')[:number]
+        else:
+            ranking = sorted(range(len(self.tags)), key=lambda x: -self.column_sums[x])[:number]
+        return [(self.tags[x], int(self.column_sums[x])) for x in ranking]
+
+    def cooccurrence(self, tags):
+        """
+        @param tags: list of tags
+        @param return: dict of each other tag -> number of files having it together with all of tags
+        """
+
+        if not all(x in self.tag_ids for x in tags):
+            return {}
+        if self.numpy:
+            files = self.numpy.ones(self.number_of_files, dtype=bool)
+            for tag in tags:
+                files &= self.get_files_with_any([tag])
+            sums = self.numpy.bincount(self.tag_positions[files[self.file_positions]], minlength=len(self.tags))
+        else:
+            files = set(range(self.number_of_files))
+            for tag in tags:
+                files.intersection_update(self.columns[self.tag_ids[tag]])
+            sums = [0] * len(self.tags)
+            for file_position, tag_id in zip(self.file_positions, self.tag_positions):
+                if file_position in files:
+                    sums[tag_id] += 1
+        return {tag: int(count) for tag, count in zip(self.tags, sums) if count and tag not in tags}
+
+
+def get_files_with_metadata_from_tag_index(startdir, recursive):
+    """
+    Returns the same FileCatalog as get_files_with_metadata() but reads
+    it from the (refreshed) tag index.
+
+    @param startdir: string of an existing directory
+    @param recursive: boolean; if True, files of sub-directories are returned as well
+    @param return: FileCatalog
+    """
+
+    startdir = os.path.abspath(startdir)
+    connection = get_refreshed_tag_index(startdir, recursive)
+    condition, parameters = get_tag_index_scope_condition('path', startdir, recursive)
+
+    rows = connection.execute('SELECT filename, filetags, path, ctime FROM files WHERE islink = 0 AND ' +
+                              condition, parameters).fetchall()
+    rows.sort(key=lambda x: get_tag_index_scan_order_key(x[2], x[0]))
+
+    catalog = FileCatalog()
+    for filename, filetags, path, ctime in rows:
+        catalog.append(catalog.add_directory(path), filename,
+                       filetags.split(BETWEEN_TAG_SEPARATOR) if filetags else [], ctime)
+    return catalog
+
+
+def get_tags_from_tag_index(startdir, recursive):
+    """
+    Returns the same dict of tags and their number of occurrence as
+    get_tags_from_files_and_subfolders() but reads them from the
+    (refreshed) tag index: tags of the file names and tags of the
+    names of the sub-directories.
+
+    @param startdir: string of an existing directory
+    @param recursive: boolean; if True, sub-directories are taken into account as well
+    @param return: dict of tags and their number of occurrence
+    """
+
+    startdir = os.path.abspath(startdir)
+    connection = get_refreshed_tag_index(startdir, recursive)
+
+    tags = {}
+    condition, parameters = get_tag_index_scope_condition('path', startdir, recursive)
+    for (filetags,) in connection.execute('SELECT filetags FROM files WHERE filetags != \'\' AND ' + condition,
+                                          parameters):
+        for tag in filetags.split(BETWEEN_TAG_SEPARATOR):
+            tags = add_tag_to_countdict(tag, tags)
+
+    condition, parameters = get_tag_index_scope_condition('parent', startdir, recursive)
+    for (dirname,) in connection.execute('SELECT path FROM directories WHERE ' + condition, parameters):
+        for tag in extract_tags_from_filename(os.path.basename(dirname)):
+            tags = add_tag_to_countdict(tag, tags)
+
+    return tags
+
+
+def count_tag_cooccurrences(tags_of_files, tags_of_subdirs=[], of_tags=None):
+    """
+    Counts how often each pair of tags is shared by the files of one
+    directory. The count of a tag with itself is its number of
+    occurrences which includes the names of the sub-directories like
+    get_tags_from_files_and_subfolders() does.
+
+    @param tags_of_files: list of lists of tags of the files
+    @param tags_of_subdirs: list of lists of tags of the names of the sub-directories
+    @param of_tags: collection of tags whose pairs are counted; None for all tags. The count of each tag with itself is always counted.
+    @param return: dict of tag -> dict of other tag -> count
+    """
+
+    cooccurrences = {}
+    for tags in tags_of_files:
+        tags = list(dict.fromkeys(tags))
+        for tag in tags:
+            others = cooccurrences.setdefault(tag, {})
+            if of_tags is None or tag in of_tags:
+                for other in tags:
+                    others[other] = others.get(other, 0) + 1
+            else:
+                others[tag] = others.get(tag, 0) + 1
+    for tags in tags_of_subdirs:
+        for tag in dict.fromkeys(tags):
+            others = cooccurrences.setdefault(tag, {})
+            others[tag] = others.get(tag, 0) + 1
+    return cooccurrences
+
+
+def get_tag_cooccurrences(directory, of_tags=None):
+    """
+    Returns the co-occurrences of the tags of the files of directory
+    (not recursive). With --index, they are read from the tag index
+    where they are updated with the changed file names of each
+    re-scanned directory. Otherwise, they are counted from the file
+    system. The result is cached for the rest of the run.
+
+    @param directory: string of an existing directory
+    @param of_tags: list of tags whose pairs are returned; None for all tags. The count of each tag with itself is always returned.
+    @param return: tuple of dict of tag -> dict of other tag -> count (see count_tag_cooccurrences()) and list of tags sorted by their number of occurrences, ties alphabetically
+    """
+
+    directory = os.path.abspath(directory)
+    key = (directory, None if of_tags is None else frozenset(of_tags))
+    if key in cache_of_tag_cooccurrences:
+        return cache_of_tag_cooccurrences[key]
+
+    cooccurrences = {}
+    if options.use_index:
+        connection = get_refreshed_tag_index(directory, recursive=False)
+        if of_tags is None:
+            condition, parameters = '', ()
+        else:
+            condition = ' AND (tag = other OR tag IN (' + ', '.join('?' * len(key[1])) + '))'
+            parameters = tuple(key[1])
+        for tag, other, count in connection.execute('SELECT tag, other, count FROM cooccurrences WHERE path = ?' +
+                                                    condition, (directory,) + parameters):
+            cooccurrences.setdefault(tag, {})[other] = count
+    else:
+        for dirpath, subdir_entries, file_entries in scan_directory_tree(directory, recursive=False):
+            cooccurrences = count_tag_cooccurrences([extract_tags_from_filename(x.name) for x in file_entries],
+                                                    [extract_tags_from_filename(x.name) for x in subdir_entries],
+                                                    key[1])
+
+    tags_by_frequency = sorted(cooccurrences, key=lambda x: (-cooccurrences[x][x], x))
+    cache_of_tag_cooccurrences[key] = (cooccurrences, tags_by_frequency)
+    return cache_of_tag_cooccurrences[key]
+
+
+def get_files_of_directory_from_tag_index(directory, recursive):
+    """
+    Returns the same list of file names as get_files_of_directory() but
+    reads them from the (refreshed) tag index.
+
+    @param directory: string of an existing directory
+    @param recursive: boolean; if True, files of sub-directories are returned with their path
+    @param return: list of file names
+    """
+
+    directory = os.path.abspath(directory)
+    connection = get_refreshed_tag_index(directory, recursive)
+    condition, parameters = get_tag_index_scope_condition('path', directory, recursive)
+
+    rows = connection.execute('SELECT path, filename FROM files WHERE ' + condition, parameters).fetchall()
+    rows.sort(key=lambda x: get_tag_index_scan_order_key(x[0], x[1]))
+
+    files = []
+    for path, filename in rows:
+        if recursive:
+            files.append(os.path.join(path, filename))
+        else:
+            files.append(filename)
+    return files
+
+
+def get_files_with_metadata(startdir=os.getcwd(), use_cache=True):
+    """
+    Traverses the file system starting with given directory,
+    returns FileCatalog: sequence of read-only metadata-dicts.
+
+    The result is stored in the global dict as
+    cache_of_files_with_metadata[startdir] with dict elements like:
+      'filename': '2018-03-18 this is a file name -- tag1 tag2.txt',
+      'filetags': ['tag1', 'tag2'],
+      'path': '/this/is -- tag1/the -- tag3/path',
+      'alltags': ['tag1', 'tag2', 'tag3'],
+      'ctime': time.struct_time,
+      'datestamp': ['2018', '03', '18'],
+
+    @param use_cache: FOR FUTURE USE; default = True
+    @param return: FileCatalog of filenames and metadata
+    """
+
+    global cache_of_files_with_metadata
+
+    assert(os.path.isdir(startdir))
+
+    logging.debug('get_files_with_metadata called with startdir [%s], cached startdirs [%s]' %
+                  (startdir, str(len(list(cache_of_files_with_metadata.keys())))))
+
+    # Enable recursive directory traversal for specific options:
+    recursive = options.recursive and (options.list_tags_by_alphabet or
+                                       options.list_tags_by_number or
+                                       options.list_unknown_tags or
+                                       options.tag_gardening)
+
+    if use_cache and startdir in cache_of_files_with_metadata:
+        logging.debug("found " + str(len(cache_of_files_with_metadata[startdir])) + " files in cache for files")
+        return cache_of_files_with_metadata[startdir]
+
+    elif options.use_index:
+        cache = get_files_with_metadata_from_tag_index(startdir, recursive)
+
+    else:
+
+        cache = FileCatalog()
+        for path, subdir_entries, file_entries in scan_directory_tree(os.path.abspath(startdir), recursive):
+
+            # logging.debug('get_files_with_metadata: path [%s]' % path)  # LOTS of debug output
+            directory_id = cache.add_directory(path)
+            for entry in file_entries:
+
+                # logging.debug('get_files_with_metadata: file [%s]' % entry.path)  # LOTS of debug output
+                if entry.is_symlink():
+                    # link files do not have ctime and must be dereferenced before. However, they can link to another link file or they can be broken.
+                    # Design decision: ignoring link files alltogether. Their source should speak for themselves.
+                    logging.debug('get_files_with_metadata: file [%s] is a link and gets ignored here' % entry.path)
+                    continue
+
+                cache.append(directory_id, entry.name, extract_tags_from_filename(entry.name), entry.stat().st_ctime)
+
+    logging.debug("Writing " + str(len(cache)) + " files in cache for directory: " + startdir)
+    if use_cache:
+        cache_of_files_with_metadata[startdir] = cache
+    return cache
+
+
+def get_tags_from_files_and_subfolders(startdir=os.getcwd(), use_cache=True):
+    """
+    Traverses the file system starting with given directory,
+    returns dict of all tags (including starttags) of all file.
+    Uses cache_of_files_with_metadata of use_cache is true and
+    cache is populated with same startdir.
+
+    @param use_cache: FOR FUTURE USE
+    @param return: dict of tags and their number of occurrence
+    """
+
+    # add ", starttags=False" to parameters to enable this feature in future
+    starttags = False
+
+    assert(os.path.isdir(startdir))
+
+    if not starttags:
+        tags = {}
+    else:
+        assert(starttags.__class__ == dict)
+        tags = starttags
+
+    global cache_of_tags_by_folder
+
+    logging.debug('get_tags_from_files_and_subfolders called with startdir [%s], cached startdirs [%s]' %
+                  (startdir, str(len(list(cache_of_tags_by_folder.keys())))))
+
+    # Enable recursive directory traversal for specific options:
+    recursive = options.recursive and (options.list_tags_by_alphabet or
+                                       options.list_tags_by_number or
+                                       options.list_unknown_tags or
+                                       options.tag_gardening)
+
+    if use_cache and startdir in list(cache_of_tags_by_folder.keys()):
+        logging.debug("get_tags_from_files_and_subfolders: found " + str(len(cache_of_tags_by_folder[startdir])) +
+                      " tags in cache for directory: " + startdir)
+        return cache_of_tags_by_folder[startdir]
+
+    elif use_cache and startdir in cache_of_files_with_metadata.keys():
+        logging.debug('get_tags_from_files_and_subfolders: using cache_of_files_with_metadata instead of traversing file system again')
+        cachedata = cache_of_files_with_metadata[startdir]
+
+        # FIXXME: check if tags are extracted from dirnames as in traversal algorithm below
+
+        for entry in cachedata:
+            for tag in entry['alltags']:
+                tags = add_tag_to_countdict(tag, tags)
+
+    elif options.use_index:
+        tags = get_tags_from_tag_index(startdir, recursive)
+
+    else:
+
+        for root, subdir_entries, file_entries in scan_directory_tree(startdir, recursive):
+
+            # logging.debug('get_tags_from_files_and_subfolders: root [%s]' % root)  # LOTS of debug output
+
+            for entry in file_entries:
+                for tag in extract_tags_from_filename(entry.name):
+                    tags = add_tag_to_countdict(tag, tags)
+
+            for entry in subdir_entries:
+                for tag in extract_tags_from_filename(entry.name):
+                    tags = add_tag_to_countdict(tag, tags)
+
+    logging.debug("get_tags_from_files_and_subfolders: Writing " + str(len(list(tags.keys()))) +
+                  " tags in cache for directory: " + startdir)
+    if use_cache:
+        cache_of_tags_by_folder[startdir] = tags
+    return tags
+
+
+class TagSimilarityIndex(object):
+    """
+    Finds the tags of a list that are similar to a given tag with the
+    same results as difflib.get_close_matches(tag, tags, n=999,
+    cutoff=0.7) but without comparing each pair of tags.
+
+    The tags are indexed by their bigrams including a start and an end
+    marker. Only tags sharing at least two bigrams (counting repeated
+    ones separately) and having a suitable length get compared with
+    difflib. This does not miss any match: the M matching characters
+    of a difflib ratio of 2M/T >= 0.7 in T characters in total
+    cannot be spread over blocks of single characters without leaving
+    at least M+1 characters unmatched, which would result in a ratio
+    below 2/3; each additional unmatched character requires another
+    shared bigram. For cutoffs of 2/3 and below, all tags of suitable
+    length are compared.
+
+    The results are cached per tag.
+    """
+
+    def __init__(self, tags, cutoff=0.7):
+        """
+        @param tags: list of strings
+        @param cutoff: float; minimum ratio of difflib.SequenceMatcher for similar tags
+        """
+
+        safe_import('difflib')  # for the ratios of similar tags
+        self.tags = tags
+        self.cutoff = cutoff
+        self.min_shared_bigrams = 2 if cutoff > 2 / 3 else 0
+        self.postings = {}  # dict of (bigram, number of occurrence) -> list of positions in tags
+        for position, tag in enumerate(tags):
+            for bigram in self.get_bigrams(tag):
+                self.postings.setdefault(bigram, []).append(position)
+        self.cache = {}  # dict of tag -> list of (ratio, similar tag), the most similar first
+
+    @staticmethod
+    def get_bigrams(tag):
+        """
+        @param tag: string
+        @param return: list of (bigram, number of its occurrence in tag)
+        """
+
+        padded = '\0' + tag + '\0'
+        occurrences = {}
+        bigrams = []
+        for position in range(len(padded) - 1):
+            bigram = padded[position:position + 2]
+            occurrences[bigram] = occurrences.get(bigram, 0) + 1
+            bigrams.append((bigram, occurrences[bigram]))
+        return bigrams
+
+    def get_candidates(self, tag):
+        """
+        @param tag: string
+        @param return: iterable of positions of tags that might be similar to tag
+        """
+
+        if not self.min_shared_bigrams or not tag:
+            return range(len(self.tags))
+        shared_bigrams = {}
+        for bigram in self.get_bigrams(tag):
+            for position in self.postings.get(bigram, []):
+                shared_bigrams[position] = shared_bigrams.get(position, 0) + 1
+        return [position for position, number in shared_bigrams.items() if number >= self.min_shared_bigrams]
+
+    def find_similar_tags(self, tag):
+        """
+        @param tag: a (unicode) string that represents a tag
+        @param return: list of tags that are similar to tag (but not same as tag), the most similar first
+        """
+
+        return [other for ratio, other in self.get_matches(tag)[:999] if other != tag]
+
+    def get_matches(self, tag):
+        """
+        @param tag: a (unicode) string that represents a tag
+        @param return: list of (ratio, similar tag) including tag itself if indexed, the most similar first
+        """
+
+        if tag in self.cache:
+            return self.cache[tag]
+
+        # 2 * min(len) / (len(tag) + len(other)) >= cutoff; with some slack for rounding:
+        min_length = self.cutoff * len(tag) / (2 - self.cutoff) - 1e-9
+        max_length = len(tag) * (2 - self.cutoff) / self.cutoff + 1e-9 if self.cutoff else float('inf')
+
+        # same checks as difflib.get_close_matches():
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(tag)
+        matches = []
+        for position in self.get_candidates(tag):
+            other = self.tags[position]
+            if not min_length <= len(other) <= max_length:
+                continue
+            matcher.set_seq1(other)
+            if matcher.real_quick_ratio() >= self.cutoff and \
+               matcher.quick_ratio() >= self.cutoff and \
+               matcher.ratio() >= self.cutoff:
+                matches.append((matcher.ratio(), other))
+
+        self.cache[tag] = sorted(matches, reverse=True)
+        return self.cache[tag]
+
+    def find_similar_tags_of_many(self, tags, jobs=1):
+        """
+        @param tags: list of strings
+        @param jobs: integer; number of processes
+        @param return: dict of tag -> list of similar tags
+        """
+
+        self.get_matches_of_many(tags, jobs)
+        return {tag: self.find_similar_tags(tag) for tag in tags}
+
+    def get_matches_of_many(self, tags, jobs=1):
+        """
+        Looks up the matches of many tags at once and caches them.
+        With more than one job, the tags are split up into chunks which
+        are processed by a pool of processes, each holding a copy of the
+        index. The results do not depend on the number of jobs.
+
+        @param tags: list of strings
+        @param jobs: integer; number of processes
+        @param return: dict of tag -> list of (ratio, similar tag)
+        """
+
+        pending = [x for x in dict.fromkeys(tags) if x not in self.cache]
+        if jobs > 1 and len(pending) >= jobs * SIMILAR_TAGS_PER_CHUNK:
+            from concurrent.futures import ProcessPoolExecutor  # for comparing tags on all cores
+            number_of_chunks = jobs * 4
+            chunks = [pending[x::number_of_chunks] for x in range(number_of_chunks)]
+            logging.debug('get_matches_of_many: comparing %i tags in %i chunks with %i processes' %
+                          (len(pending), number_of_chunks, jobs))
+            with ProcessPoolExecutor(max_workers=jobs, initializer=initialize_tag_similarity_worker,
+                                     initargs=(self.tags, self.cutoff)) as executor:
+                for chunk, results in zip(chunks, executor.map(get_matches_of_chunk, chunks)):
+                    self.cache.update(zip(chunk, results))
+        return {tag: self.get_matches(tag) for tag in tags}
+
+
+def initialize_tag_similarity_worker(tags, cutoff):
+    """
+    Creates the TagSimilarityIndex of a worker process of
+    TagSimilarityIndex.get_matches_of_many().
+
+    @param tags: list of strings
+    @param cutoff: float
+    """
+
+    global tag_similarity_worker_index
+    tag_similarity_worker_index = TagSimilarityIndex(tags, cutoff)
+
+
+def get_matches_of_chunk(chunk):
+    """
+    Runs in a worker process of TagSimilarityIndex.get_matches_of_many().
+
+    @param chunk: list of tags
+    @param return: list of lists of (ratio, similar tag)
+    """
+
+    return [tag_similarity_worker_index.get_matches(tag) for tag in chunk]
+
+
+class SimilarTagsCache(object):
+    """
+    Holds the similar tags of all tags seen so far: for each tag, the
+    other tags with a difflib ratio of at least cutoff and their ratio.
+    Since the ratio of two tags does not depend on any other tag, the
+    similar tags within any list of known tags are found by filtering.
+
+    When new tags show up, only their pairs are computed: the new tags
+    are compared to all tags and the known tags are compared to an
+    index of the new tags only.
+
+    The pairs are kept across runs in a JSON file in CACHE_DIRECTORY
+    which is shared by all archives. When it holds more than size
+    tags, the least recently used ones are dropped when saving. Tags
+    of other archives or of other sub-directories therefore survive
+    runs which do not use them.
+    """
+
+    VERSION = 2  # increase when the format of the file changes
+
+    def __init__(self, filename=None, cutoff=0.7, size=SIMILAR_TAGS_CACHE_SIZE):
+        """
+        @param filename: string with the file name of the cache or None for not keeping it across runs
+        @param cutoff: float; minimum ratio of difflib.SequenceMatcher for similar tags
+        @param size: integer; maximum number of tags kept when saving
+        """
+
+        self.filename = filename
+        self.cutoff = cutoff
+        self.size = size
+        self.matches = {}  # dict of tag -> list of (ratio, similar tag) including tag itself, the most similar first
+        self.last_used = {}  # dict of tag -> day of the last run which used it; days avoid re-writing the file on each run
+        self.modified = False
+        if filename and os.path.isfile(filename):
+            self.load()
+
+    def load(self):
+        safe_import('json')  # for the cache of similar tags
+        try:
+            with open(self.filename, encoding='utf-8') as cache_file:
+                content = json.load(cache_file)
+            if content['version'] == self.VERSION and content['cutoff'] == self.cutoff:
+                self.matches = {tag: [(ratio, other) for ratio, other in matches]
+                                for tag, matches in content['matches'].items()}
+                self.last_used = {tag: content['last_used'][tag] for tag in self.matches}
+            logging.debug('SimilarTagsCache: read similar tags of %i tags from "%s"' %
+                          (len(self.matches), self.filename))
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.warning('Ignoring the unreadable cache "' + self.filename + '": ' + str(error))
+            self.matches = {}
+            self.last_used = {}
+
+    def update(self, tags, jobs=1):
+        """
+        Adds the similar tags of tags which are not known yet.
+
+        @param tags: list of strings
+        @param jobs: integer; number of processes, see TagSimilarityIndex.get_matches_of_many()
+        """
+
+        tags = list(dict.fromkeys(tags))
+        today = int(time.time()) // 86400
+        for tag in tags:
+            if self.last_used.get(tag) != today:
+                self.last_used[tag] = today
+                self.modified = True
+        new_tags = [x for x in tags if x not in self.matches]
+        if not new_tags:
+            return
+
+        known_tags = list(self.matches)
+        logging.debug('SimilarTagsCache: comparing %i new tags to %i known tags' % (len(new_tags), len(known_tags)))
+        new_matches = TagSimilarityIndex(known_tags + new_tags, self.cutoff).get_matches_of_many(new_tags, jobs)
+        if known_tags:
+            for tag, matches in TagSimilarityIndex(new_tags, self.cutoff).get_matches_of_many(known_tags, jobs).items():
+                if matches:
+                    self.matches[tag] = sorted(self.matches[tag] + matches, reverse=True)
+        self.matches.update(new_matches)
+        self.modified = True
+
+    def find_similar_tags(self, tag, tags):
+        """
+        @param tag: a (unicode) string that represents a known tag
+        @param tags: set of known tags to compare with
+        @param return: list of tags that are similar to tag (but not same as tag), the most similar first
+        """
+
+        matches = [x for x in self.matches[tag] if x[1] in tags][:999]  # like difflib.get_close_matches()
+        return [other for ratio, other in matches if other != tag]
+
+    def save(self):
+        """
+        Drops the least recently used tags beyond size and writes the cache.
+        """
+
+        if len(self.matches) > self.size:
+            by_age = sorted(self.matches, key=lambda tag: self.last_used[tag], reverse=True)
+            dropped_tags = set(by_age[self.size:])
+            self.matches = {tag: [x for x in matches if x[1] not in dropped_tags]
+                            for tag, matches in self.matches.items() if tag not in dropped_tags}
+            self.last_used = {tag: self.last_used[tag] for tag in self.matches}
+            self.modified = True
+        if not self.filename or not self.modified:
+            return
+
+        safe_import('json')  # for the cache of similar tags
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(self.filename + '.tmp', 'w', encoding='utf-8') as cache_file:
+                json.dump({'version': self.VERSION, 'cutoff': self.cutoff, 'matches': self.matches,
+                           'last_used': self.last_used}, cache_file)
+            os.replace(self.filename + '.tmp', self.filename)
+            self.modified = False
+        except OSError as error:
+            logging.warning('Could not write the cache "' + self.filename + '": ' + str(error))
+
+
+def get_similar_tags_cache():
+    """
+    @param return: the SimilarTagsCache of this run
+    """
+
+    global similar_tags_cache
+    if similar_tags_cache is None:
+        similar_tags_cache = SimilarTagsCache(None if options.no_cache else
+                                              os.path.join(CACHE_DIRECTORY, SIMILAR_TAGS_CACHE_FILENAME))
+    return similar_tags_cache
+
+
+def update_similar_tags_cache(tags, jobs=1):
+    """
+    Makes sure that the similar tags of all tags are known, computing
+    the missing ones with jobs processes.
+
+    Callers comparing many tags compute the returned frozenset once and
+    hand it to find_similar_tags() for each tag.
+
+    @param tags: a list of (unicode) strings without duplicates
+    @param jobs: integer; number of processes
+    @param return: frozenset of tags for find_similar_tags()
+    """
+
+    get_similar_tags_cache().update(tags, jobs)
+    return frozenset(tags)
+
+
+def find_similar_tags(tag, tags):
+    """
+    Returns a list of entries of tags that are similar to tag (but not same as tag)
+
+    @param tag: a (unicode) string that represents a tag
+    @param tags: a list of (unicode) strings or the frozenset returned by update_similar_tags_cache()
+    @param return: list of tags that are similar to tag
+    """
+
+    assert(tag.__class__ == str)
+    assert(tags.__class__ in [list, frozenset])
+
+    if tags.__class__ == list:
+        tags = update_similar_tags_cache(tags)
+    if tag not in tags:
+        get_similar_tags_cache().update([tag])
+    return get_similar_tags_cache().find_similar_tags(tag, tags)
+
+
+def print_tag_dict(tag_dict_reference, vocabulary=False, sort_index=0,
+                   print_similar_vocabulary_tags=False, print_only_tags_with_similar_tags=False):
+    """
+    Takes a dictionary which holds tag names and their occurrence and prints it to stdout.
+    Tags that appear also in the vocabulary get marked in the output.
+
+    @param tag_dict: a dictionary holding tags and their occurrence number
+    @param vocabulary: array of tags from controlled vocabulary or False
+    """
+
+    tag_dict = {}
+    tag_dict = tag_dict_reference
+
+    # determine maximum length of strings for formatting:
+    if len(tag_dict) > 0:
+        maxlength_tags = max(len(s) for s in list(tag_dict.keys())) + \
+            len(HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE)
+        maxlength_count = len(str(abs(max(tag_dict.values()))))
+    else:
+        maxlength_tags = len(HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE)
+        maxlength_count = 5
+
+    if maxlength_count < 5:
+        maxlength_count = 5
+
+    hint_for_being_in_vocabulary = ''
+    similar_tags = ''
+    if vocabulary:
+        print("\n  (Tags marked with \"" + HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE.strip() +
+              "\" appear in your vocabulary.)")
+    print("\n {0:{1}} : {2:{3}}".format('count', maxlength_count, 'tag', maxlength_tags))
+    print(" " + '-' * (maxlength_tags + maxlength_count + 7))
+    if vocabulary and print_similar_vocabulary_tags:
+        tags_for_comparing = list(set(tag_dict.keys()).union(set(vocabulary)))  # unified elements of both lists
+        tags_for_comparing = update_similar_tags_cache(tags_for_comparing, options.jobs)
+    for tuple in sorted(list(tag_dict.items()), key=operator.itemgetter(sort_index)):
+        # sort dict of (tag, count) according to sort_index
+
+        if vocabulary and tuple[0] in vocabulary:
+            hint_for_being_in_vocabulary = HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE
+        else:
+            hint_for_being_in_vocabulary = ''
 
         similar_tags_list = []
         if vocabulary and print_similar_vocabulary_tags:
-            tags_for_comparing = list(set(tag_dict.keys()).union(set(vocabulary)))  # unified elements of both lists
             similar_tags_list = find_similar_tags(tuple[0], tags_for_comparing)
             if similar_tags_list:
                 similar_tags = '      (similar to:  ' + ', '.join(similar_tags_list) + ')'
@@ -1422,6 +2801,9 @@ def print_tag_set(tag_set, vocabulary=False, print_similar_vocabulary_tags=False
         print("\n  (Tags marked with \"" + HINT_FOR_BEING_IN_VOCABULARY_TEMPLATE.strip() +
               "\" appear in your vocabulary.)\n")
 
+    if vocabulary and print_similar_vocabulary_tags:
+        tags_for_comparing = list(tag_set.union(set(vocabulary)))  # unified elements of both lists
+        tags_for_comparing = update_similar_tags_cache(tags_for_comparing, options.jobs)
     for tag in sorted(tag_set):
 
         if vocabulary and tag in vocabulary:
@@ -1430,7 +2812,6 @@ def print_tag_set(tag_set, vocabulary=False, print_similar_vocabulary_tags=False
             hint_for_being_in_vocabulary = ''
 
         if vocabulary and print_similar_vocabulary_tags:
-            tags_for_comparing = list(tag_set.union(set(vocabulary)))  # unified elements of both lists
             similar_tags_list = find_similar_tags(tag, tags_for_comparing)
             if similar_tags_list:
                 similar_tags = '      (similar to:  ' + ', '.join(similar_tags_list) + ')'
@@ -1480,7 +2861,8 @@ def handle_tag_gardening(vocabulary):
     """
 
     files_with_metadata = get_files_with_metadata(startdir=os.getcwd())  # = cache_of_files_with_metadata of current dir
-    tag_dict = get_tags_from_files_and_subfolders(startdir=os.getcwd())
+    tag_matrix = TagMatrix(x['alltags'] for x in files_with_metadata)
+    tag_dict = tag_matrix.counts()  # = get_tags_from_files_and_subfolders() with cache_of_files_with_metadata
     if not tag_dict:
         print("\nNo file containing tags found in this folder hierarchy.\n")
         return
@@ -1499,16 +2881,12 @@ def handle_tag_gardening(vocabulary):
         else:
             return str(round(100*fraction/total, 1)) + '%'
 
-    files_without_alltags = [x for x in files_with_metadata if not x['alltags']]
-    num_files_without_alltags = len(files_without_alltags)
-
-    files_without_filetags = [x for x in files_with_metadata if not x['filetags']]
-    num_files_without_filetags = len(files_without_filetags)
+    num_files_without_alltags = tag_matrix.count_files_without_tags()
 
-    num_files_with_alltags = number_of_files - len(files_without_alltags)
+    num_files_with_filetags = len([x for x in files_with_metadata if x['filetags']])
+    num_files_without_filetags = number_of_files - num_files_with_filetags
 
-    files_with_filetags = [x for x in files_with_metadata if x['filetags']]
-    num_files_with_filetags = len(files_with_filetags)
+    num_files_with_alltags = number_of_files - num_files_without_alltags
 
     print("\nNumber of files without tags including pathtags: " + str(num_files_without_alltags) +
           "   (" + str_percentage(num_files_without_alltags, number_of_files) + " of total files)")
@@ -1519,7 +2897,7 @@ def handle_tag_gardening(vocabulary):
     print("Number of files with filetags:                   " + str(num_files_with_filetags) +
           "   (" + str_percentage(num_files_with_filetags, number_of_files) + " of total files)")
 
-    top_10_tags = sorted(tag_dict.items(), key=lambda x:x[1], reverse=True)[:10]  # e.g.: [('v', 5), ('tag1', 4), ('tag4', 4)]
+    top_10_tags = tag_matrix.top(10)  # e.g.: [('v', 5), ('tag1', 4), ('tag4', 4)]
     if len(top_10_tags) > 0:
         print('\nTop 10 tags:')
         longest_tag = len(max([x[0] for x in top_10_tags], key=len))
@@ -1553,10 +2931,7 @@ def handle_tag_gardening(vocabulary):
                 if taggroup == UNIQUE_TAG_TESTSTRINGS:
                     continue
                 if len(set(tag_dict.keys()).intersection(set(taggroup))) > 0:
-                    files_with_any_tag_from_taggroup = [x for x in
-                                                        files_with_metadata if
-                                                        len(set(x['alltags']).intersection(set(taggroup))) > 0]
-                    num_files_with_any_tag_from_taggroup = len(files_with_any_tag_from_taggroup)
+                    num_files_with_any_tag_from_taggroup = tag_matrix.count_files_with_any(taggroup)
                     print('\nTag group ' + str(taggroup) + ":\n   Number of files with tag from tag group: " +
                           str(num_files_with_any_tag_from_taggroup) +
                           "   (" + str_percentage(num_files_with_any_tag_from_taggroup, num_files_with_alltags) +
@@ -1564,8 +2939,7 @@ def handle_tag_gardening(vocabulary):
 
                     longest_tagname = max(taggroup, key=len)
                     for tag in taggroup:
-                        files_with_tag_from_taggroup = [x for x in files_with_metadata if tag in x['alltags']]
-                        num_files_with_tag_from_taggroup = len(files_with_tag_from_taggroup)
+                        num_files_with_tag_from_taggroup = tag_dict.get(tag, 0)
                         if num_files_with_tag_from_taggroup > 0:
                             print('   {:<{}}  •  {:>{}} tagged file(s)   = {:>5} of tag group'.format(
                                 tag,
@@ -1586,6 +2960,7 @@ def handle_tag_gardening(vocabulary):
     if vocabulary:
         print("\nTags which have similar other tags are probably typos or plural/singular forms of others:\n  (first for tags not in vocabulary, second for vocaulary tags)")
         tags_for_comparing = list(set(tag_dict.keys()).union(set(vocabulary)))  # unified elements of both lists
+        tags_for_comparing = update_similar_tags_cache(tags_for_comparing, options.jobs)
         only_similar_tags_by_alphabet_dict = {key: value for key, value in list(tag_dict.items())
                                               if find_similar_tags(key, tags_for_comparing)}
 
@@ -1594,6 +2969,7 @@ def handle_tag_gardening(vocabulary):
     else:
         print("\nTags which have similar other tags are probably typos or plural/singular forms of others:")
         tags_for_comparing = list(set(tag_dict.keys()))
+        tags_for_comparing = update_similar_tags_cache(tags_for_comparing, options.jobs)
         only_similar_tags_by_alphabet_dict = {key: value for key, value in list(tag_dict.items())
                                               if find_similar_tags(key, tags_for_comparing)}
         print_tag_dict(only_similar_tags_by_alphabet_dict, vocabulary, sort_index=0, print_similar_vocabulary_tags=True)
@@ -1673,34 +3049,34 @@ def locate_file_in_cwd_and_parent_directories(startfile, filename):
         return False
 
 
-def locate_and_parse_controlled_vocabulary(startfile):
+def locate_controlled_vocabulary(startfile):
 
     """This method is looking for files named
-    CONTROLLED_VOCABULARY_FILENAME in the directory of startfile and parses
-    it. Each line contains a tag which gets read in for tab
-    completion.
-
-    @param startfile: file whose location is the starting point of the search
-    @param return: either False or a list of found tag strings
+    CONTROLLED_VOCABULARY_FILENAME in the directory of startfile and
+    its parent directories. On Windows, lnk-files linking to such a file
+    are followed.
+
+    @param startfile: file whose location is the starting point of the search; if False, the working directory is taken
+    @param return: either False or the file name of the controlled vocabulary
 
     """
 
-    logging.debug('locate_and_parse_controlled_vocabulary: called with startfile: "' +
+    logging.debug('locate_controlled_vocabulary: called with startfile: "' +
                   str(startfile) + '"')
-    logging.debug('locate_and_parse_controlled_vocabulary: called in cwd: ' + str(os.getcwd()))
+    logging.debug('locate_controlled_vocabulary: called in cwd: ' + str(os.getcwd()))
     if startfile:
         filename = locate_file_in_cwd_and_parent_directories(startfile, CONTROLLED_VOCABULARY_FILENAME)
     else:
         filename = locate_file_in_cwd_and_parent_directories(os.getcwd(), CONTROLLED_VOCABULARY_FILENAME)
 
     if filename:
-        logging.debug('locate_and_parse_controlled_vocabulary: locate_file_in_cwd_and_parent_directories returned: ' + filename)
+        logging.debug('locate_controlled_vocabulary: locate_file_in_cwd_and_parent_directories returned: ' + filename)
     else:
-        logging.debug('locate_and_parse_controlled_vocabulary: locate_file_in_cwd_and_parent_directories did NOT find any filename')
+        logging.debug('locate_controlled_vocabulary: locate_file_in_cwd_and_parent_directories did NOT find any filename')
 
     if IS_WINDOWS:
         # searching for and handling of lnk files:
-        logging.debug('locate_and_parse_controlled_vocabulary: this is Windows: ' +
+        logging.debug('locate_controlled_vocabulary: this is Windows: ' +
                       'also look out for lnk-files that link to .filetags files ...')
         if startfile:
             lnk_filename = locate_file_in_cwd_and_parent_directories(startfile,
@@ -1710,69 +3086,170 @@ def locate_and_parse_controlled_vocabulary(startfile):
                                                                      CONTROLLED_VOCABULARY_FILENAME + '.lnk')
 
         if lnk_filename and filename:
-            logging.debug('locate_and_parse_controlled_vocabulary: this is Windows: ' +
+            logging.debug('locate_controlled_vocabulary: this is Windows: ' +
                           'both (non-lnk and lnk) .filetags found. Taking the one with the longer path')
             if os.path.dirname(lnk_filename) > os.path.dirname(filename) and is_nonbroken_link(lnk_filename):
-                logging.debug('locate_and_parse_controlled_vocabulary: this is Windows: ' +
+                logging.debug('locate_controlled_vocabulary: this is Windows: ' +
                               'taking the lnk .filetags')
                 filename = lnk_filename
             elif not is_nonbroken_link(lnk_filename):
-                logging.debug('locate_and_parse_controlled_vocabulary: this is Windows: ' +
+                logging.debug('locate_controlled_vocabulary: this is Windows: ' +
                               'taking the non-lnk .filetags since the found lnk is a broken link')
         elif lnk_filename and not filename:
-            logging.debug('locate_and_parse_controlled_vocabulary: this is Windows: ' +
+            logging.debug('locate_controlled_vocabulary: this is Windows: ' +
                           'only a lnk of .filetags was found')
             filename = lnk_filename
         else:
-            logging.debug('locate_and_parse_controlled_vocabulary: this is Windows: ' +
+            logging.debug('locate_controlled_vocabulary: this is Windows: ' +
                           '.filetags (non-lnk) was found')
 
         if filename and is_lnk_file(filename) and os.path.isfile(get_link_source_file(filename)):
-            logging.debug('locate_and_parse_controlled_vocabulary: this is Windows: ' +
+            logging.debug('locate_controlled_vocabulary: this is Windows: ' +
                           'set filename to source file for lnk .filetags')
             filename = get_link_source_file(filename)
 
-    global unique_tags
-    global do_not_suggest_tags
+    return filename
+
+
+def parse_controlled_vocabulary(lines):
+    """
+    Parses the lines of a controlled vocabulary. Each line contains a
+    tag. Multiple tags in one line are mutually exclusive. Lines starting
+    with DONOTSUGGEST_PREFIX list tags which are never suggested.
+    Everything after a '#' is a comment.
+
+    This does not touch the file system or any global variable.
+
+    @param lines: iterable of strings like the lines of a file
+    @param return: tuple of list of tags, list of lists of mutually exclusive tags and list of lower-case tags not to suggest
+    """
+
+    tags = []
+    unique_tag_groups = []
+    donotsuggest = []
+    for rawline in lines:
+
+        if rawline.strip().lower().startswith(DONOTSUGGEST_PREFIX):
+            # parse and save do not suggest tags:
+            line = rawline[len(DONOTSUGGEST_PREFIX):].strip().lower()
+            for tag in line.split(BETWEEN_TAG_SEPARATOR):
+                donotsuggest.append(tag)
+        else:
+
+            # remove everyting after the first hash character (which is a comment separator)
+            line = rawline.strip().split('#')[0].strip()  # split and take everything before the first '#' as new "line"
+
+            if len(line) == 0:
+                # nothing left, line consisted only of a comment or was empty
+                continue
+
+            if BETWEEN_TAG_SEPARATOR in line:
+                ## if multiple tags are in one line, they are mutually exclusive: only has can be set via filetags
+                logging.debug('parse_controlled_vocabulary: found unique tags: %s' %
+                              (line))
+                unique_tag_groups.append(line.split(BETWEEN_TAG_SEPARATOR))
+                for tag in line.split(BETWEEN_TAG_SEPARATOR):
+                    # *also* append unique tags to general tag list:
+                    tags.append(tag)
+            else:
+                tags.append(line)
+
+    return tags, unique_tag_groups, donotsuggest
+
+
+def get_vocabulary_cache_filename(filename):
+    """
+    @param filename: string of a controlled vocabulary file
+    @param return: string of the file name of its compiled cache within CACHE_DIRECTORY
+    """
+
+    safe_import('zlib')  # for short names of cache files; hashlib takes longer to import
+    path = os.path.abspath(filename).encode('utf-8', 'surrogateescape')
+    return os.path.join(CACHE_DIRECTORY, VOCABULARY_CACHE_SUBDIRECTORY, '%08x.json' % zlib.crc32(path))
+
+
+def read_controlled_vocabulary(filename):
+    """
+    Reads and parses a controlled vocabulary file like
+    parse_controlled_vocabulary() does.
+
+    The result is kept in a compiled cache within CACHE_DIRECTORY
+    holding the tags, the groups of mutually exclusive tags and the tags
+    not to suggest. The cache is used as long as the modification time
+    and the size of the vocabulary file are unchanged. This replaces
+    parsing large vocabularies line by line with a single read of JSON.
+
+    @param filename: string of an existing controlled vocabulary file
+    @param return: tuple of list of tags, list of lists of mutually exclusive tags and list of lower-case tags not to suggest
+    """
+
+    path = os.path.abspath(filename)
+    stat = os.stat(path)  # before reading: a change while reading makes the cache outdated, not wrong
+    cache_filename = None if options.no_cache else get_vocabulary_cache_filename(path)
+
+    if cache_filename and os.path.isfile(cache_filename):
+        safe_import('json')  # for the compiled vocabulary cache
+        try:
+            with open(cache_filename, encoding='utf-8') as cache_file:
+                content = json.load(cache_file)
+            if content['version'] == VOCABULARY_CACHE_VERSION and content['filename'] == path and \
+               content['mtime'] == stat.st_mtime_ns and content['size'] == stat.st_size:
+                logging.debug('read_controlled_vocabulary: using the compiled vocabulary "%s"' % cache_filename)
+                return content['tags'], content['unique_tags'], content['do_not_suggest_tags']
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.debug('read_controlled_vocabulary: ignoring the unreadable cache "%s": %s' %
+                          (cache_filename, str(error)))
+
+    safe_import('codecs')  # for handling Unicode content in .filetags
+    with codecs.open(path, encoding='utf-8') as filehandle:
+        tags, unique_tag_groups, donotsuggest = parse_controlled_vocabulary(filehandle)
+
+    if cache_filename:
+        safe_import('json')  # for the compiled vocabulary cache
+        temporary_filename = cache_filename + '.%i.tmp' % os.getpid()
+        try:
+            os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+            with open(temporary_filename, 'w', encoding='utf-8') as cache_file:
+                json.dump({'version': VOCABULARY_CACHE_VERSION, 'filename': path,
+                           'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'tags': tags,
+                           'unique_tags': unique_tag_groups, 'do_not_suggest_tags': donotsuggest}, cache_file)
+            os.replace(temporary_filename, cache_filename)
+        except OSError as error:
+            # no warning: this would be repeated on each invocation with a read-only cache directory
+            logging.debug('read_controlled_vocabulary: could not write the cache "%s": %s' %
+                          (cache_filename, str(error)))
+
+    return tags, unique_tag_groups, donotsuggest
+
+
+def locate_and_parse_controlled_vocabulary(startfile):
+
+    """This method is looking for files named
+    CONTROLLED_VOCABULARY_FILENAME in the directory of startfile and parses
+    it. Each line contains a tag which gets read in for tab
+    completion. Mutually exclusive tags are added to unique_tags and
+    tags not to suggest to do_not_suggest_tags.
+
+    @param startfile: file whose location is the starting point of the search
+    @param return: either False or a list of found tag strings
+
+    """
+
+    filename = locate_controlled_vocabulary(startfile)
 
     if filename:
         logging.debug('locate_and_parse_controlled_vocabulary: .filetags found: ' + filename)
         if os.path.isfile(filename):
             logging.debug('locate_and_parse_controlled_vocabulary: found controlled vocabulary')
 
-            tags = []
-            with codecs.open(filename, encoding='utf-8') as filehandle:
-                logging.debug('locate_and_parse_controlled_vocabulary: reading controlled vocabulary in [%s]' %
-                              filename)
-                global controlled_vocabulary_filename
-                controlled_vocabulary_filename = filename
-                for rawline in filehandle:
-
-                    if rawline.strip().lower().startswith(DONOTSUGGEST_PREFIX):
-                        # parse and save do not suggest tags:
-                        line = rawline[len(DONOTSUGGEST_PREFIX):].strip().lower()
-                        for tag in line.split(BETWEEN_TAG_SEPARATOR):
-                            do_not_suggest_tags.append(tag)
-                    else:
-
-                        # remove everyting after the first hash character (which is a comment separator)
-                        line = rawline.strip().split('#')[0].strip()  # split and take everything before the first '#' as new "line"
-
-                        if len(line) == 0:
-                            # nothing left, line consisted only of a comment or was empty
-                            continue
-
-                        if BETWEEN_TAG_SEPARATOR in line:
-                            ## if multiple tags are in one line, they are mutually exclusive: only has can be set via filetags
-                            logging.debug('locate_and_parse_controlled_vocabulary: found unique tags: %s' %
-                                          (line))
-                            unique_tags.append(line.split(BETWEEN_TAG_SEPARATOR))
-                            for tag in line.split(BETWEEN_TAG_SEPARATOR):
-                                # *also* append unique tags to general tag list:
-                                tags.append(tag)
-                        else:
-                            tags.append(line)
+            logging.debug('locate_and_parse_controlled_vocabulary: reading controlled vocabulary in [%s]' %
+                          filename)
+            global controlled_vocabulary_filename
+            controlled_vocabulary_filename = filename
+            tags, unique_tag_groups, donotsuggest = read_controlled_vocabulary(filename)
 
+            unique_tags.extend(unique_tag_groups)
+            do_not_suggest_tags.extend(donotsuggest)
             logging.debug('locate_and_parse_controlled_vocabulary: controlled vocabulary has %i tags' %
                           len(tags))
             logging.debug('locate_and_parse_controlled_vocabulary: controlled vocabulary has %i groups of unique tags' %
@@ -1797,6 +3274,8 @@ def print_tag_shortcut_with_numbers(tag_list, tags_get_added=True, tags_get_link
     @param return: -
     """
 
+    safe_import('colorama')  # for colorful output
+
     if tags_get_added:
         if len(tag_list) < 9:
             hint_string = "Previously used tags in this directory:"
@@ -1910,6 +3389,38 @@ def get_upto_nine_keys_of_dict_with_highest_value(mydict, list_of_tags_to_omit=[
     return sorted(complete_list[:9])
 
 
+def get_upto_nine_suggested_tags(directory, tags_of_files):
+    """
+    Returns up to nine tags for the shortcuts of ask_for_tags() when
+    tagging files of directory: tags which share the most files with
+    tags_of_files come first, followed by the most frequent tags of
+    directory.
+
+    Only the co-occurrences of tags_of_files and the most frequent tags
+    are looked up so that the time does not grow with the number of
+    files or tags of the directory.
+
+    @param directory: string of an existing directory
+    @param tags_of_files: list of tags the files to tag have in common
+    @param return: list of up to nine tags
+    """
+
+    cooccurrences, tags_by_frequency = get_tag_cooccurrences(directory, tags_of_files)
+
+    scores = {}
+    for tag in tags_of_files:
+        # sorted so that ties do not depend on the order of the files or of the index:
+        for other, count in sorted(cooccurrences.get(tag, {}).items()):
+            scores[other] = scores.get(other, 0) + count
+    # enough candidates for nine tags even if all omitted tags are among them:
+    for tag in tags_by_frequency[:9 + len(tags_of_files) + len(do_not_suggest_tags)]:
+        scores.setdefault(tag, 0)
+
+    return get_upto_nine_keys_of_dict_with_highest_value(
+        {tag: (score, cooccurrences[tag][tag]) for tag, score in scores.items()},
+        tags_of_files, omit_filetags_donotsuggest_tags=True)
+
+
 def _get_tag_visual(tags_for_visual=None):
     """
     Returns a visual representation of a tag. If the optional tags_for_visual
@@ -1919,6 +3430,8 @@ def _get_tag_visual(tags_for_visual=None):
     @param return: string with a multi-line representation of a visual tag
     """
 
+    safe_import('colorama')  # for colorful output
+
     if not tags_for_visual:
         tags = " ? "
     else:
@@ -1946,6 +3459,9 @@ def ask_for_tags(vocabulary, upto9_tags_for_shortcuts, tags_for_visual=None):
     @param return: list of up to top nine keys according to the rank of their values
     """
 
+    safe_import('readline')  # for tag completion when reading tags from stdin
+    safe_import('colorama')  # for colorful output
+
     completionhint = ''
     if vocabulary and len(vocabulary) > 0:
 
@@ -1970,104 +3486,830 @@ def ask_for_tags(vocabulary, upto9_tags_for_shortcuts, tags_for_visual=None):
     print(_get_tag_visual(tags_for_visual))
     print("                     ")
 
-    if len(upto9_tags_for_shortcuts) > 0:
-        print_tag_shortcut_with_numbers(upto9_tags_for_shortcuts,
-                                        tags_get_added=(not options.remove and not options.tagfilter),
-                                        tags_get_linked=options.tagfilter)
+    if len(upto9_tags_for_shortcuts) > 0:
+        print_tag_shortcut_with_numbers(upto9_tags_for_shortcuts,
+                                        tags_get_added=(not options.remove and not options.tagfilter),
+                                        tags_get_linked=options.tagfilter)
+
+    logging.debug("interactive mode: asking for tags ...")
+    while True:
+        entered_tags = input(colorama.Style.DIM + 'Tags: ' + colorama.Style.RESET_ALL).strip()
+        if not options.tagfilter or not entered_tags:
+            break
+        try:
+            # filtering accepts boolean queries: ask again instead of aborting on typos
+            parse_tag_query(entered_tags)
+            break
+        except ValueError as error:
+            print(colorama.Fore.RED + str(error) + colorama.Style.RESET_ALL +
+                  ' Please use tags, AND, OR, NOT, -tag, and parentheses.')
+    tags_from_userinput = extract_tags_from_argument(entered_tags)
+
+    if not tags_from_userinput:
+        logging.info("no tags given, exiting.")
+        sys.stdout.flush()
+        sys.exit(0)
+    else:
+        if len(upto9_tags_for_shortcuts) > 0:
+            # check if user entered number shortcuts for tags to be removed:
+            tags_from_userinput = check_for_possible_shortcuts_in_entered_tags(
+                tags_from_userinput, upto9_tags_for_shortcuts)
+        return tags_from_userinput
+
+
+def get_files_of_directory(directory):
+    """
+    Lists the files of the given directory and returns a list of its files.
+
+    @param directory: string of an existing directory
+    @param return: list of file names of given directory
+    """
+
+    if options.use_index:
+        logging.debug('get_files_of_directory(' + directory + ') called and reading the tag index ...')
+        return get_files_of_directory_from_tag_index(directory, options.recursive)
+
+    files = []
+    logging.debug('get_files_of_directory(' + directory + ') called and traversing file system ...')
+    for dirpath, subdir_entries, file_entries in scan_directory_tree(directory, options.recursive):
+        if len(files) % 5000 == 0 and len(files) > 0:
+            # while debugging a large hierarchy scan, I'd like to print out some stuff in-between scanning
+            logging.info('found ' + str(len(files)) + ' files so far ... counting ...')
+        if options.recursive:
+            files.extend([x.path for x in file_entries])
+        else:
+            files.extend([x.name for x in file_entries])
+    logging.debug('get_files_of_directory(' + directory + ') finished with ' + str(len(files)) + ' items')
+
+    return files
+
+
+def build_inverted_tag_index(files):
+    """
+    Parses the tags of each file once and returns an inverted index:
+    for each tag, the set of positions of the files within the given
+    list which contain this tag (its posting list).
+
+    @param files: array of file names
+    @param return: dict of tag -> set of integer positions within files
+    """
+
+    inverted_tag_index = {}
+    for position, filename in enumerate(files):
+        for tag in extract_tags_from_filename(filename):
+            inverted_tag_index.setdefault(tag, set()).add(position)
+    return inverted_tag_index
+
+
+def get_files_and_inverted_tag_index_of_directory(directory):
+    """
+    Returns the files of the directory like get_files_of_directory()
+    along with their inverted tag index. Both are derived once per
+    directory and cached in cache_of_inverted_tag_index.
+
+    @param directory: string of an existing directory
+    @param return: tuple of list of file names and dict of tag -> set of positions
+    """
+
+    global cache_of_inverted_tag_index
+    key = (directory, options.recursive)
+    if key not in cache_of_inverted_tag_index:
+        files = get_files_of_directory(directory)
+        cache_of_inverted_tag_index[key] = (files, build_inverted_tag_index(files))
+        logging.debug('get_files_and_inverted_tag_index_of_directory: indexed %i files with %i tags' %
+                      (len(files), len(cache_of_inverted_tag_index[key][1])))
+    return cache_of_inverted_tag_index[key]
+
+
+def filter_files_matching_tags(allfiles, tags, inverted_tag_index=None):
+    """
+    Returns a list of file names that contain all given tags.
+
+    The posting lists of the tags are intersected starting with the
+    smallest one. Therefore, filtering for a rare tag only touches the
+    few files having that tag. The order of allfiles is kept.
+
+    @param allfiles: array of file names
+    @param tags: array of tags
+    @param inverted_tag_index: dict of tag -> set of positions in allfiles; gets derived if not given
+    @param return: list of file names that contain all tags
+    """
+
+    if not tags:
+        return list(allfiles)
+
+    if inverted_tag_index is None:
+        inverted_tag_index = build_inverted_tag_index(allfiles)
+
+    posting_lists = sorted([inverted_tag_index.get(tag, set()) for tag in set(tags)], key=len)
+    matching_positions = posting_lists[0]
+    for posting_list in posting_lists[1:]:
+        if not matching_positions:
+            break
+        # set.intersection() iterates over the smaller of both sets:
+        matching_positions = matching_positions.intersection(posting_list)
+
+    return [allfiles[position] for position in sorted(matching_positions)]
+
+
+TAG_QUERY_OPERATORS = {'AND': 'and', 'OR': 'or', 'NOT': 'not'}
+TAG_QUERY_TOKEN_REGEX = re.compile(r'[()]|[^\s()]+')
+
+
+def parse_tag_query(query):
+    """
+    Parses a boolean tag query into an expression tree. Tags which
+    follow each other are combined with AND. Operators are
+    upper-case words so that lower-case tags like "or" stay usable:
+
+        car (red OR blue) -draft
+        car AND NOT draft
+        (car OR bike) AND (red OR blue)
+
+    NOT (or a leading "-") binds stronger than AND which binds stronger
+    than OR. Parentheses group sub-expressions.
+
+    The resulting tree consists of tuples: ('tag', tag), ('not', expression),
+    ('and', list of expressions), ('or', list of expressions).
+
+    @param query: string containing the query
+    @param return: tuple holding the expression tree
+    """
+
+    tokens = TAG_QUERY_TOKEN_REGEX.findall(query)
+    position = 0
+
+    def peek():
+        if position < len(tokens):
+            return tokens[position]
+        return None
+
+    def next_token():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        operands = [parse_and()]
+        while peek() == 'OR':
+            next_token()
+            operands.append(parse_and())
+        return operands[0] if len(operands) == 1 else ('or', operands)
+
+    def parse_and():
+        operands = [parse_not()]
+        while peek() is not None and peek() not in ['OR', ')']:
+            if peek() == 'AND':
+                next_token()
+            operands.append(parse_not())
+        return operands[0] if len(operands) == 1 else ('and', operands)
+
+    def parse_not():
+        token = peek()
+        if token == 'NOT':
+            next_token()
+            return ('not', parse_not())
+        if token is not None and token.startswith('-') and len(token) > 1:
+            # "-tag" is a short form for "NOT tag": strip the minus and parse the rest
+            tokens[position] = token[1:]
+            return ('not', parse_not())
+        return parse_operand()
+
+    def parse_operand():
+        token = peek()
+        if token is None:
+            raise ValueError('The query "' + query + '" ends unexpectedly.')
+        next_token()
+        if token == '(':
+            expression = parse_or()
+            if peek() != ')':
+                raise ValueError('The query "' + query + '" lacks a closing parenthesis.')
+            next_token()
+            return expression
+        if token == ')' or token in TAG_QUERY_OPERATORS or token == '-':
+            raise ValueError('The query "' + query + '" contains an unexpected "' + token + '".')
+        return ('tag', token)
+
+    if not tokens:
+        raise ValueError('The query is empty.')
+    expression = parse_or()
+    if peek() is not None:
+        raise ValueError('The query "' + query + '" contains an unexpected "' + peek() + '".')
+    return expression
+
+
+def evaluate_tag_query(expression, inverted_tag_index, number_of_files):
+    """
+    Evaluates an expression tree of parse_tag_query() with set algebra
+    over the posting lists of an inverted tag index.
+
+    Operands of AND are intersected starting with the smallest one.
+    Negated operands of AND are subtracted instead of being complemented
+    so that the set of all files is only derived for queries like "NOT foo"
+    or "foo OR NOT bar".
+
+    @param expression: tuple holding the expression tree
+    @param inverted_tag_index: dict of tag -> set of positions in the list of files
+    @param number_of_files: integer with the length of the list of files
+    @param return: set of positions of matching files
+    """
+
+    operator = expression[0]
+
+    if operator == 'tag':
+        return inverted_tag_index.get(expression[1], set())
+
+    elif operator == 'not':
+        return set(range(number_of_files)) - evaluate_tag_query(expression[1], inverted_tag_index, number_of_files)
+
+    elif operator == 'or':
+        result = set()
+        for operand in expression[1]:
+            result = result.union(evaluate_tag_query(operand, inverted_tag_index, number_of_files))
+        return result
+
+    assert(operator == 'and')
+    positives = [x for x in expression[1] if x[0] != 'not']
+    negatives = [x[1] for x in expression[1] if x[0] == 'not']
+    if positives:
+        positive_sets = sorted([evaluate_tag_query(x, inverted_tag_index, number_of_files) for x in positives], key=len)
+        result = positive_sets[0]
+        for positive_set in positive_sets[1:]:
+            if not result:
+                return set()
+            result = result.intersection(positive_set)
+    else:
+        result = set(range(number_of_files))
+    for negative in negatives:
+        if not result:
+            break
+        result = result - evaluate_tag_query(negative, inverted_tag_index, number_of_files)
+    return result
+
+
+def filter_files_matching_tag_query(allfiles, query, inverted_tag_index=None):
+    """
+    Returns a list of file names that match the given boolean tag query
+    (see parse_tag_query()). The order of allfiles is kept.
+
+    @param allfiles: array of file names
+    @param query: string containing the query
+    @param inverted_tag_index: dict of tag -> set of positions in allfiles; gets derived if not given
+    @param return: list of file names that match the query
+    """
+
+    expression = parse_tag_query(query)
+    if inverted_tag_index is None:
+        inverted_tag_index = build_inverted_tag_index(allfiles)
+    matching_positions = evaluate_tag_query(expression, inverted_tag_index, len(allfiles))
+    return [allfiles[position] for position in sorted(matching_positions)]
+
+
+def assert_tagfilter_directory_may_be_replaced(directory):
+    """
+    Aborts if the user-defined tagfilter directory has content and
+    --overwrite is not given.
+
+    @param directory: the directory to use as starting directory
+    """
+
+    if options.tagtrees_directory and os.path.isdir(directory) and os.listdir(directory) and not options.overwrite:
+        error_exit(13, 'The given tagtrees directory ' + directory +
+                   ' is not empty. Aborting here instead ' +
+                   'of removing its content without asking. Please free it up yourself and try again.')
+
+
+def assert_empty_tagfilter_directory(directory):
+    """
+    Creates non-existent tagfilter directory or deletes and re-creates it.
+
+    @param directory: the directory to use as starting directory
+    """
+
+    assert_tagfilter_directory_may_be_replaced(directory)
+
+    if not os.path.isdir(directory):
+        logging.debug('creating non-existent tagfilter directory "%s" ...' % str(directory))
+        if not options.dryrun:
+            os.makedirs(directory)
+    else:
+        # FIXXME 2018-04-04: I guess this is never reached because this script does never rm -r on that directory: check it and add overwrite parameter
+        logging.debug('found old tagfilter directory "%s"; deleting directory ...' % str(directory))
+        if not options.dryrun:
+            safe_import('shutil')  # for removing directories with shutil.rmtree()
+            shutil.rmtree(directory)
+            logging.debug('re-creating tagfilter directory "%s" ...' % str(directory))
+            os.makedirs(directory)
+    if not options.dryrun:
+        assert(os.path.isdir(directory))
+
+
+def get_common_tags_from_files(files):
+    """
+    Returns a list of tags that are common (intersection) for all files.
+
+    @param files: array of file names
+    @param return: list of tags
+    """
+
+    list_of_tags_per_file = []
+    for currentfile in files:
+        list_of_tags_per_file.append(set(extract_tags_from_filename(currentfile)))
+
+    return list(set.intersection(*list_of_tags_per_file))
+
+
+def plan_tagtrees(files, tags_of_files, maxdepth, ignore_nontagged, nontagged_subdir, link_missing_mutual_tagged_items,
+                  ordering=TAGTREES_ORDERINGS[0], frequent_tagsets=None):
+    """
+    Computes the directories and links of a tagtrees hierarchy without
+    touching the file system. See generate_tagtrees() for the meaning of
+    the parameters.
+
+    If two files share the same basename (when --recursive is used), the
+    first one is linked and the others are reported.
+
+    With the "canonical" ordering, only the sorted combinations of tags
+    get directories: "a/b" but not "b/a". With "canonical-aliases",
+    each non-canonical directory whose parent is canonical becomes a
+    relative symbolic link to its canonical counterpart: "b/a" links
+    to "../a/b". Since "a/b/c" can be reached via aliases from any order
+    like "c/b/a" → "b/c/a" → "a/b/c", all orders can be browsed.
+
+    @param files: list of file names
+    @param tags_of_files: list of lists of tags; one list for each element of files
+    @param ordering: one of TAGTREES_ORDERINGS
+    @param frequent_tagsets: set of sorted tuples of tags of find_frequent_tagsets(); if given, directories of two or more tags are only planned for those
+    @param return: tuple of set of directories and dict of link -> source file name; both relative to the tagtrees root
+    """
+
+    safe_import('itertools')  # for calculating permutations of tagtrees
+
+    directories = set()
+    links = {}
+    tag_directories = set()  # tuples of tags of directories deeper than one level
+
+    def add_link(source, destination):
+        if destination in links:
+            if links[destination] != source:
+                logging.warning('File \"' + source + '\" is already linked: \"' + destination +
+                                '\". You must have used the recursive option and the sub-tree you\'re ' +
+                                'generating a tagtree from has two times the same filename. ' +
+                                'I stick with the first one.')
+            return
+        links[destination] = source
+
+    if nontagged_subdir:
+        directories.add(nontagged_subdir)
+
+    # links need absolute sources; resolving them as strings saves one stat() per file:
+    working_directory = os.getcwd()
+
+    for filename, tags_of_currentfile in zip(files, tags_of_files):
+
+        filename, dirname, basename, basename_without_lnk = \
+            split_up_filename_pure(os.path.join(working_directory, filename))
+
+        if len(tags_of_currentfile) == 0:
+            # current file has no tags. It gets linked to the
+            # nontagged_subdir folder (if set) or to the tagtrees root.
+            # This is somewhat handy to find files which are - you
+            # guessed right - not tagged yet ;-)
+            if ignore_nontagged:
+                logging.debug('plan_tagtrees: file "' + filename +
+                              '" has no tags and will be ignored because of command line switch.')
+            elif nontagged_subdir:
+                add_link(filename, os.path.join(nontagged_subdir, basename))
+            else:
+                add_link(filename, basename)
+            continue
+
+        # a tag given twice would result in directories like "a/a":
+        tags_of_currentfile = list(dict.fromkeys(tags_of_currentfile))
+
+        # We *have* to iterate over the depth as well because when a
+        # file has only one tag and the maxdepth is more than one, we
+        # would forget the tagtree directories for this single tag.
+        for currentdepth in range(1, maxdepth+1):
+            if ordering == 'permutations':
+                tagsequences = itertools.permutations(tags_of_currentfile, currentdepth)
+            else:
+                tagsequences = itertools.combinations(sorted(set(tags_of_currentfile)), currentdepth)
+            for tagsequence in tagsequences:
+                if currentdepth > 1 and frequent_tagsets is not None and \
+                   tuple(sorted(tagsequence)) not in frequent_tagsets:
+                    continue
+                current_directory = os.path.join(*tagsequence)
+                if currentdepth > 1:
+                    tag_directories.add(tagsequence)
+                directories.add(current_directory)
+                add_link(filename, os.path.join(current_directory, basename))
+
+        if link_missing_mutual_tagged_items:
+            for unique_tagset in unique_tags:
+
+                # Oh yes, I do wish I had solved the default teststring issue in
+                # a cleaner way. Ignore it here hard-coded.
+                if unique_tagset == ['teststring1', 'teststring2']:
+                    continue
+
+                # When there is no intersection between the item tags and the
+                # current unique_tagset, link the item to a no-$unique_tagset directory:
+                if not set(tags_of_currentfile).intersection(set(unique_tagset)):
+                    no_uniqueset_tag_found_dir = 'no-' + ("-").join(unique_tagset)  # example: "no-draft-final"
+                    directories.add(no_uniqueset_tag_found_dir)
+                    add_link(filename, os.path.join(no_uniqueset_tag_found_dir, basename))
+
+    if ordering == 'canonical-aliases':
+        for tagsequence in tag_directories:
+            # each tag except the last one could have been browsed last:
+            for position in range(len(tagsequence) - 1):
+                parent = tagsequence[:position] + tagsequence[position+1:]
+                alias = os.path.join(*(parent + (tagsequence[position],)))
+                links[alias] = os.path.join(*(['..'] * len(parent) + list(tagsequence)))
+
+    logging.debug('plan_tagtrees: planned %i directories and %i links' % (len(directories), len(links)))
+    return directories, links
+
+
+def estimate_tagtrees(tags_of_files, maxdepth, ignore_nontagged, nontagged_subdir, link_missing_mutual_tagged_items,
+                      ordering=TAGTREES_ORDERINGS[0], frequent_tagsets=None):
+    """
+    Computes the number of directories and links plan_tagtrees() is
+    going to plan without building the plan itself. The links of a file
+    only depend on its number of tags: k!/(k-d)! for each depth d with
+    permutations and k!/(d!(k-d)!) with combinations. Directories are
+    shared between files: they are counted as distinct sets of tags
+    which get multiplied by the number of their orders for permutations.
+
+    The numbers are exact unless --recursive finds several files with
+    the same basename: only the first one is linked then.
+
+    With frequent_tagsets, the combinations of the tags of each file
+    have to be checked one by one. Therefore, its runtime grows like
+    the one of the planning but without its memory consumption.
+
+    @param tags_of_files: list of lists of tags; one list for each file
+    @param frequent_tagsets: set of sorted tuples of tags of find_frequent_tagsets() or None
+    @param return: tuple of number of directories and number of links
+    """
+
+    safe_import('itertools')  # for calculating combinations of tagtrees
+
+    tagsets = set()  # distinct sets of tags as sorted tuples
+    no_uniqueset_directories = set()
+    num_of_links = 0
+
+    for tags_of_currentfile in tags_of_files:
+
+        if len(tags_of_currentfile) == 0:
+            if not ignore_nontagged:
+                num_of_links += 1
+            continue
+
+        sorted_tags = sorted(set(tags_of_currentfile))
+        number_of_tags = len(sorted_tags)
+        for currentdepth in range(1, min(maxdepth, number_of_tags) + 1):
+            if currentdepth > 1 and frequent_tagsets is not None:
+                combinations = [x for x in itertools.combinations(sorted_tags, currentdepth) if x in frequent_tagsets]
+                orders = math.factorial(currentdepth) if ordering == 'permutations' else 1
+                num_of_links += len(combinations) * orders
+                tagsets.update(combinations)
+                continue
+            if ordering == 'permutations':
+                num_of_links += math.factorial(number_of_tags) // math.factorial(number_of_tags - currentdepth)
+            else:
+                num_of_links += math.factorial(number_of_tags) // \
+                    (math.factorial(currentdepth) * math.factorial(number_of_tags - currentdepth))
+            tagsets.update(itertools.combinations(sorted_tags, currentdepth))
+
+        if link_missing_mutual_tagged_items:
+            for unique_tagset in unique_tags:
+                if unique_tagset == ['teststring1', 'teststring2']:
+                    continue
+                if not set(tags_of_currentfile).intersection(set(unique_tagset)):
+                    no_uniqueset_directories.add('no-' + ("-").join(unique_tagset))
+                    num_of_links += 1
+
+    if ordering == 'permutations':
+        num_of_directories = sum(math.factorial(len(x)) for x in tagsets)
+    else:
+        num_of_directories = len(tagsets)
+        if ordering == 'canonical-aliases':
+            num_of_links += sum(len(x) - 1 for x in tagsets)
+    num_of_directories += len(no_uniqueset_directories)
+    if nontagged_subdir:
+        num_of_directories += 1
+
+    return num_of_directories, num_of_links
+
+
+def find_frequent_tagsets(tags_of_files, maxdepth, min_files):
+    """
+    Returns all combinations of tags which are shared by at least
+    min_files files. The combinations are derived level by level like
+    the Apriori algorithm for frequent itemsets does: a combination of
+    d tags is only counted when all of its sub-combinations of d-1 tags
+    are frequent. Therefore, rare tags and their combinations are
+    dropped early instead of enumerating all combinations of all files.
+
+    @param tags_of_files: list of lists of tags; one list for each file
+    @param maxdepth: integer with the maximum number of tags per combination or None for no limit
+    @param min_files: integer with the minimum number of files sharing a combination
+    @param return: set of sorted tuples of tags
+    """
+
+    safe_import('itertools')  # for calculating combinations of tags
+
+    counts = {}
+    for tags_of_currentfile in tags_of_files:
+        for tag in set(tags_of_currentfile):
+            counts[(tag,)] = counts.get((tag,), 0) + 1
+    frequent_level = set(x for x in counts if counts[x] >= min_files)
+    frequent_tagsets = set(frequent_level)
+
+    # only frequent tags can be part of frequent combinations:
+    candidates_of_files = [sorted(x for x in set(tags_of_currentfile) if (x,) in frequent_level)
+                           for tags_of_currentfile in tags_of_files]
+
+    depth = 1
+    while frequent_level and (maxdepth is None or depth < maxdepth):
+        depth += 1
+        candidates_of_files = [x for x in candidates_of_files if len(x) >= depth]
+        counts = {}
+        for candidates in candidates_of_files:
+            for combination in itertools.combinations(candidates, depth):
+                if all(combination[:position] + combination[position+1:] in frequent_level
+                       for position in range(depth)):
+                    counts[combination] = counts.get(combination, 0) + 1
+        frequent_level = set(x for x in counts if counts[x] >= min_files)
+        frequent_tagsets.update(frequent_level)
+        logging.debug('find_frequent_tagsets: %i combinations of %i tags are shared by at least %i files' %
+                      (len(frequent_level), depth, min_files))
+
+    return frequent_tagsets
+
+
+def choose_tagtrees_depth(estimate, maxdepth, max_links):
+    """
+    Returns the deepest depth whose tagtrees fit into max_links.
+
+    @param estimate: function returning a tuple of number of directories and links for a given depth
+    @param maxdepth: integer with the upper limit of the depth or None for no limit
+    @param max_links: integer with the maximum number of links
+    @param return: integer with the chosen depth
+    """
 
-    logging.debug("interactive mode: asking for tags ...")
-    entered_tags = input(colorama.Style.DIM + 'Tags: ' + colorama.Style.RESET_ALL).strip()
-    tags_from_userinput = extract_tags_from_argument(entered_tags)
+    depth = 1
+    previous_num_of_links = estimate(1)[1]
+    while maxdepth is None or depth < maxdepth:
+        num_of_links = estimate(depth + 1)[1]
+        if num_of_links > max_links or num_of_links == previous_num_of_links:
+            # too large or deeper levels do not add anything any more
+            break
+        depth += 1
+        previous_num_of_links = num_of_links
+    logging.info('Chose tagtrees depth %i for at most %i links' % (depth, max_links))
+    return depth
 
-    if not tags_from_userinput:
-        logging.info("no tags given, exiting.")
-        sys.stdout.flush()
-        sys.exit(0)
+
+def materialize_tagtrees(directory, directories, links):
+    """
+    Empties the tagtrees directory and creates the directories and
+    links of plan_tagtrees() within it. With --tagtrees-staged, they are
+    created in a staging directory which replaces the tagtrees directory
+    when it is complete.
+
+    @param directory: the tagtrees root directory
+    @param directories: set of directories relative to directory
+    @param links: dict of link -> source file name; links relative to directory
+    """
+
+    if options.tagtrees_staged and not options.dryrun:
+        assert_tagfilter_directory_may_be_replaced(directory)
+        staging_directory = os.path.normpath(os.path.abspath(directory)) + TAGTREES_STAGING_SUFFIX
+        if os.path.isdir(staging_directory):
+            logging.debug('materialize_tagtrees: removing staging directory of an aborted run')
+            safe_import('shutil')  # for removing directories with shutil.rmtree()
+            shutil.rmtree(staging_directory)
+        os.makedirs(staging_directory)
+        create_tagtrees_directories_and_links(staging_directory, directories, links)
+        replace_tagtrees_directory(directory, staging_directory)
     else:
-        if len(upto9_tags_for_shortcuts) > 0:
-            # check if user entered number shortcuts for tags to be removed:
-            tags_from_userinput = check_for_possible_shortcuts_in_entered_tags(
-                tags_from_userinput, upto9_tags_for_shortcuts)
-        return tags_from_userinput
+        assert_empty_tagfilter_directory(directory)
+        if options.dryrun:
+            return
+        create_tagtrees_directories_and_links(directory, directories, links)
 
+    # a manifest of a previous incremental run does not match any more:
+    manifest_filename = get_tagtrees_manifest_filename(directory)
+    if os.path.isfile(manifest_filename):
+        os.remove(manifest_filename)
 
-def get_files_of_directory(directory):
+
+def replace_tagtrees_directory(directory, staging_directory):
     """
-    Lists the files of the given directory and returns a list of its files.
+    Replaces the tagtrees directory by the completely built staging
+    directory. The old tagtrees are renamed aside and removed by a
+    background thread so that the user does not have to wait for it.
+    Python waits for this thread before exiting.
 
-    @param directory: string of an existing directory
-    @param return: list of file names of given directory
+    Directories can not be exchanged atomically in a portable way. There
+    are two renames instead: the directory is missing for the short moment
+    in-between but it is never observed half-built.
+
+    @param directory: the tagtrees root directory
+    @param staging_directory: the sibling directory holding the new tagtrees
     """
 
-    files = []
-    logging.debug('get_files_of_directory(' + directory + ') called and traversing file system ...')
-    for (dirpath, dirnames, filenames) in os.walk(directory):
-        if len(files) % 5000 == 0 and len(files) > 0:
-            # while debugging a large hierarchy scan, I'd like to print out some stuff in-between scanning
-            logging.info('found ' + str(len(files)) + ' files so far ... counting ...')
-        if options.recursive:
-            files.extend([os.path.join(dirpath, x) for x in filenames])
+    safe_import('shutil')  # for removing directories with shutil.rmtree()
+    old_directory = os.path.normpath(os.path.abspath(directory)) + TAGTREES_OLD_SUFFIX
+    if os.path.isdir(old_directory):
+        logging.debug('replace_tagtrees_directory: removing old tagtrees of an interrupted run')
+        shutil.rmtree(old_directory)
+
+    if os.path.lexists(directory):
+        try:
+            os.rename(directory, old_directory)
+        except OSError as error:
+            # e.g., Windows does not rename directories which are opened by a file browser:
+            logging.warning('Could not rename the old tagtrees "' + directory + '" (' + str(error) +
+                            '). Deleting them before renaming the new ones.')
+            assert_empty_tagfilter_directory(directory)
+            os.rmdir(directory)
+    os.rename(staging_directory, directory)
+    logging.debug('replace_tagtrees_directory: replaced "' + directory + '"')
+
+    if os.path.isdir(old_directory):
+        import threading  # for removing the old tagtrees in the background
+        thread = threading.Thread(target=shutil.rmtree, args=(old_directory,), kwargs={'ignore_errors': True},
+                                  name='filetags tagtrees removal')
+        thread.start()
+        tagtrees_removal_threads.append(thread)
+
+
+def create_tagtrees_directories_and_links(directory, directories, links):
+    """
+    Executes a plan of plan_tagtrees(): creates the directories level by
+    level and then the links. With --jobs, the directories of one level
+    and all links are created in parallel on a pool of worker threads.
+    This hides the latency of network shares and keeps the I/O queue of
+    SSDs busy. Creating lnk files on Windows uses COM objects which
+    are not shared between threads: they are created one after another.
+
+    @param directory: the tagtrees root directory
+    @param directories: set of directories relative to directory
+    @param links: dict of link -> source file name; links relative to directory
+    """
+
+    def create_directory(current_directory):
+        path = os.path.join(directory, current_directory)
+        try:
+            # the parent was created in the level before:
+            os.mkdir(path)
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            # a nested directory like the one of --tagtrees-handle-no-tag "a/b":
+            os.makedirs(path, exist_ok=True)
+
+    def create_tagtrees_link(destination):
+        source = links[destination]
+        destination = os.path.join(directory, destination)
+        if os.path.isabs(source):
+            create_link(source, destination)
+        elif IS_WINDOWS:
+            # aliases of --tagtrees-ordering canonical-aliases: lnk files need absolute targets
+            create_link(os.path.normpath(os.path.join(os.path.dirname(destination), source)), destination)
         else:
-            files.extend(filenames)
-            break
-    logging.debug('get_files_of_directory(' + directory + ') finished with ' + str(len(files)) + ' items')
+            # aliases of --tagtrees-ordering canonical-aliases: always relative symbolic links
+            os.symlink(source, destination)
 
-    return files
+    levels = {}
+    for current_directory in directories:
+        levels.setdefault(current_directory.count(os.sep), []).append(current_directory)
+
+    jobs = 1 if IS_WINDOWS else options.jobs
+    start = time.time()
+    if jobs < 2:
+        for level in sorted(levels):
+            for current_directory in sorted(levels[level]):
+                create_directory(current_directory)
+        for destination in sorted(links):
+            create_tagtrees_link(destination)
+    else:
+        from concurrent.futures import ThreadPoolExecutor  # for creating links in parallel
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for level in sorted(levels):
+                # consuming the results waits for the level and re-raises errors:
+                list(executor.map(create_directory, sorted(levels[level])))
+            list(executor.map(create_tagtrees_link, sorted(links)))
+    delta = time.time() - start
 
+    logging.info('Created %i directories and %i links in %.2f seconds with %i job(s) (%i links per second)' %
+                 (len(directories), len(links), delta, jobs, len(links) / max(delta, 0.001)))
 
-def filter_files_matching_tags(allfiles, tags):
-    """
-    Returns a list of file names that contain all given tags.
 
-    @param allfiles: array of file names
-    @param tags: array of tags
-    @param return: list of file names that contain all tags
+def get_tagtrees_manifest_filename(directory):
+    """
+    @param directory: the tagtrees root directory
+    @param return: file name of the manifest of --tagtrees-incremental which is located next to directory
     """
 
-    return [x for x in allfiles if set(extract_tags_from_filename(x)).issuperset(set(tags))]
+    return os.path.normpath(os.path.abspath(directory)) + TAGTREES_MANIFEST_SUFFIX
 
 
-def assert_empty_tagfilter_directory(directory):
+def read_tagtrees_manifest(directory):
     """
-    Creates non-existent tagfilter directory or deletes and re-creates it.
+    Reads the directories and links which were written by the previous
+    incremental run.
 
-    @param directory: the directory to use as starting directory
+    @param directory: the tagtrees root directory
+    @param return: tuple of set of directories and dict of link -> source file name or None if there is no valid manifest
     """
 
-    if options.tagtrees_directory and os.path.isdir(directory) and os.listdir(directory) and not options.overwrite:
-        error_exit(13, 'The given tagtrees directory ' + directory +
-                   ' is not empty. Aborting here instead ' +
-                   'of removing its content without asking. Please free it up yourself and try again.')
+    manifest_filename = get_tagtrees_manifest_filename(directory)
+    if not os.path.isdir(directory) or not os.path.isfile(manifest_filename):
+        return None
+    safe_import('json')  # for the manifest of incremental tagtrees
+    try:
+        with open(manifest_filename, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        return set(manifest['directories']), dict(manifest['links'])
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        logging.warning('Ignoring the unreadable tagtrees manifest "' + manifest_filename + '": ' + str(error))
+        return None
 
-    if not os.path.isdir(directory):
-        logging.debug('creating non-existent tagfilter directory "%s" ...' % str(directory))
-        if not options.dryrun:
-            os.makedirs(directory)
-    else:
-        # FIXXME 2018-04-04: I guess this is never reached because this script does never rm -r on that directory: check it and add overwrite parameter
-        logging.debug('found old tagfilter directory "%s"; deleting directory ...' % str(directory))
-        if not options.dryrun:
-            safe_import('shutil')  # for removing directories with shutil.rmtree()
-            shutil.rmtree(directory)
-            logging.debug('re-creating tagfilter directory "%s" ...' % str(directory))
-            os.makedirs(directory)
-    if not options.dryrun:
-        assert(os.path.isdir(directory))
 
+def write_tagtrees_manifest(directory, directories, links):
+    """
+    Writes the directories and links of the tagtrees for the next
+    incremental run. The manifest is replaced atomically so that an
+    aborted run never leaves a truncated manifest behind.
 
-def get_common_tags_from_files(files):
+    @param directory: the tagtrees root directory
+    @param directories: set of directories relative to directory
+    @param links: dict of link -> source file name; links relative to directory
     """
-    Returns a list of tags that are common (intersection) for all files.
 
-    @param files: array of file names
-    @param return: list of tags
+    safe_import('json')  # for the manifest of incremental tagtrees
+    manifest_filename = get_tagtrees_manifest_filename(directory)
+    with open(manifest_filename + '.tmp', 'w', encoding='utf-8') as manifest_file:
+        json.dump({'directories': sorted(directories), 'links': links}, manifest_file)
+    os.replace(manifest_filename + '.tmp', manifest_filename)
+
+
+def update_tagtrees(directory, directories, links, previous):
+    """
+    Applies the difference between the planned tagtrees and the ones of
+    the previous run: stale links are removed, empty stale directories
+    are pruned and missing directories and links are created. Finally,
+    the manifest for the next run is written.
+
+    Only links and directories recorded in the manifest of the previous
+    run are removed. Anything else within the tagtrees directory is
+    left untouched.
+
+    @param directory: the tagtrees root directory
+    @param directories: set of directories relative to directory
+    @param links: dict of link -> source file name; links relative to directory
+    @param previous: tuple of directories and links as returned by read_tagtrees_manifest()
     """
 
-    list_of_tags_per_file = []
-    for currentfile in files:
-        list_of_tags_per_file.append(set(extract_tags_from_filename(currentfile)))
+    previous_directories, previous_links = previous
 
-    return list(set.intersection(*list_of_tags_per_file))
+    stale_links = [x for x in previous_links if links.get(x) != previous_links[x]]
+    stale_directories = previous_directories - directories
+    missing_directories = directories - previous_directories
+    missing_links = [x for x in links if previous_links.get(x) != links[x]]
+
+    logging.info('Updating tagtrees: removing %i links and %i directories, creating %i directories and %i links' %
+                 (len(stale_links), len(stale_directories), len(missing_directories), len(missing_links)))
+    if options.dryrun:
+        return
+
+    for destination in stale_links:
+        destination = os.path.join(directory, destination)
+        for candidate in [destination, destination + '.lnk'] if IS_WINDOWS else [destination]:
+            try:
+                os.remove(candidate)
+            except FileNotFoundError:
+                pass
+    # sorting in reverse order removes sub-directories before their parents:
+    for current_directory in sorted(stale_directories, reverse=True):
+        try:
+            os.rmdir(os.path.join(directory, current_directory))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logging.debug('update_tagtrees: keeping non-empty directory "' + current_directory + '"')
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    create_tagtrees_directories_and_links(directory, missing_directories,
+                                          {x: links[x] for x in missing_links})
+
+    write_tagtrees_manifest(directory, directories, links)
 
 
 def generate_tagtrees(directory, maxdepth, ignore_nontagged, nontagged_subdir, link_missing_mutual_tagged_items, filtertags=None):
@@ -2140,27 +4382,33 @@ def generate_tagtrees(directory, maxdepth, ignore_nontagged, nontagged_subdir, l
     @param ignore_nontagged: (bool) if True, non-tagged items are ignored and not linked
     @param nontagged_subdir: (string) holds a string containing the sub-directory name to link non-tagged items to
     @param link_missing_mutual_tagged_items: (bool) if True, any item that has a missing tag of any unique_tags entry is linked to a separate directory which is auto-generated from the unique_tags set names
-    @param filtertags: (list) if options.tagfilter is used, this list holds the tags to filter for (AND)
+    @param filtertags: (list) if options.tagfilter is used, this list holds the tags to filter for (AND) or the words of a boolean query
     """
 
-    assert_empty_tagfilter_directory(directory)
-
     # The boolean ignore_nontagged must be "False" when nontagged_subdir holds a value:
     # valid combinations:
     assert((ignore_nontagged and not nontagged_subdir) or
            (not ignore_nontagged and (not nontagged_subdir or type(nontagged_subdir)==str)))
 
-    # Extract the variables nontagged_item_dest_dir from the valid combinations
-    # of nontagged_subdir and ignore_nontagged:
-    nontagged_item_dest_dir = False  # ignore non-tagged items
-    if nontagged_subdir:
-        nontagged_item_dest_dir = os.path.join(directory, nontagged_subdir)
-        assert_empty_tagfilter_directory(nontagged_item_dest_dir)
-    elif not ignore_nontagged:
-        nontagged_item_dest_dir = directory
+    # Incremental updates require the manifest of a previous run. Without
+    # it, the tagtrees are built from scratch with all the checks of a
+    # full build and the manifest is written for the next run:
+    previous_tagtrees = None
+    if options.tagtrees_incremental:
+        previous_tagtrees = read_tagtrees_manifest(directory)
+        if previous_tagtrees is None:
+            logging.info('No manifest of previous tagtrees found in "' + directory + '"; creating them from scratch')
+
+    current_directory = os.path.realpath(os.getcwd())
+    tagtrees_directory = os.path.realpath(directory)
+    if previous_tagtrees is None and \
+       (current_directory == tagtrees_directory or current_directory.startswith(tagtrees_directory + os.sep)):
+        error_exit(11, 'You\'ve tried to generate tagtrees within the tagtrees directory "' + directory + '" itself. ' +
+                   'This would be a pity because filetags deletes and re-creates this directory. ' +
+                   'Please change to the directory holding your files and try again.')
 
     try:
-        files = get_files_of_directory(os.getcwd())
+        files, inverted_tag_index = get_files_and_inverted_tag_index_of_directory(os.getcwd())
     except FileNotFoundError:
         error_exit(11, 'When trying to look for files, I could not even find the current working directory. ' + \
                    'Could it be the case that you\'ve tried to generate tagtrees within the directory "' + directory + '"? ' + \
@@ -2171,165 +4419,78 @@ def generate_tagtrees(directory, maxdepth, ignore_nontagged, nontagged_subdir, l
 
     if filtertags:
         logging.debug('generate_tagtrees: filtering tags ...')
-        files = filter_files_matching_tags(files, filtertags)
+        files = filter_files_matching_tag_query(files, BETWEEN_TAG_SEPARATOR.join(filtertags), inverted_tag_index)
 
     if len(files) == 0 and not options.recursive:
         error_exit(10, 'There is no single file in the current directory "' + os.getcwd() + '". I can\'t create ' + \
                 'tagtrees from nothing. You gotta give me at least something to work with here, dude.')
 
+    logging.info('Creating tagtrees and their links. It may take a while …  ' +
+                 '(exponentially with respect to number of tags)')
+
+    # this generates a list whose elements (the tags) corresponds to
+    # the filenames in the files list:
+    tags_of_files = [extract_tags_from_filename(x) for x in files]
+
     # If a controlled vocabulary file is found for the directory where the tagtree
     # should be generated for, we link this file to the resulting tagtrees root
     # directory as well. This way, adding tags using tag completion also works for
     # the linked items.
     controlled_vocabulary_filename = locate_file_in_cwd_and_parent_directories(os.getcwd(),
                                                                                CONTROLLED_VOCABULARY_FILENAME)
+
+    frequent_tagsets = None
+    if options.tagtrees_min_files > 1:
+        frequent_tagsets = find_frequent_tagsets(tags_of_files, maxdepth, options.tagtrees_min_files)
+
+    # Check the size of the tagtrees before anything is planned or touched:
+    def estimate(depth):
+        num_of_directories, num_of_links = estimate_tagtrees(tags_of_files, depth, ignore_nontagged, nontagged_subdir,
+                                                             link_missing_mutual_tagged_items, options.tagtrees_ordering,
+                                                             frequent_tagsets)
+        if controlled_vocabulary_filename:
+            num_of_links += 1
+        return num_of_directories, num_of_links
+
+    if options.tagtrees_auto_depth:
+        maxdepth = choose_tagtrees_depth(estimate, maxdepth, options.tagtrees_max_links)
+    num_of_directories, num_of_links = estimate(maxdepth)
+    logging.info('Tagtrees of depth %i will consist of %i directories and %i links' %
+                 (maxdepth, num_of_directories, num_of_links))
+    if options.tagtrees_max_links is not None and num_of_links > options.tagtrees_max_links:
+        error_exit(24, 'Tagtrees of depth ' + str(maxdepth) + ' would consist of ' + str(num_of_links) +
+                   ' links which is more than the maximum of ' + str(options.tagtrees_max_links) +
+                   ' given by --tagtrees-max-links. Nothing was modified. ' +
+                   'Please choose a smaller depth or use --tagtrees-auto-depth.')
+
+    # Firstly, the whole hierarchy is planned in memory. Only then,
+    # the file system is touched: either by creating everything from
+    # scratch or by applying the difference to the previous run.
+    directories, links = plan_tagtrees(files, tags_of_files, maxdepth, ignore_nontagged,
+                                       nontagged_subdir, link_missing_mutual_tagged_items,
+                                       options.tagtrees_ordering, frequent_tagsets)
+
     if controlled_vocabulary_filename:
         logging.debug('generate_tagtrees: I found controlled_vocabulary_filename "' +
                       controlled_vocabulary_filename +
                       '" which I\'m going to link to the tagtrees folder')
-        if not options.dryrun:
-            create_link(os.path.abspath(controlled_vocabulary_filename),
-                        os.path.join(directory,
-                                     CONTROLLED_VOCABULARY_FILENAME))
-
+        links[CONTROLLED_VOCABULARY_FILENAME] = os.path.abspath(controlled_vocabulary_filename)
     else:
         logging.debug('generate_tagtrees: I did not find a controlled_vocabulary_filename')
 
-    logging.info('Creating tagtrees and their links. It may take a while …  ' +
-                 '(exponentially with respect to number of tags)')
-
-    tags = get_tags_from_files_and_subfolders(startdir=os.getcwd(), use_cache=True)
-
-    # Here, we define a small helper function within a function. Cool,
-    # heh? Bet many folks are not aware of those nifty things I know of ;-P
-    def create_tagtrees_dir(basedirectory, tagpermutation):
-        "Creates (empty) directories of the tagtrees directory structure"
-
-        current_directory = os.path.join(basedirectory, *[x for x in tagpermutation])  # flatten out list of permutations to elements
-        # logging.debug('generate_tagtrees: mkdir ' + current_directory)
-        if not options.dryrun and not os.path.exists(current_directory):
-            os.makedirs(current_directory)
-
-    # this generates a list whose elements (the tags) corresponds to
-    # the filenames in the files list:
-    tags_of_files = [extract_tags_from_filename(x) for x in files]
-
-    # Firstly, let's iterate over the files, create tagtree
-    # directories according to the set of tags from the current file
-    # to avoid empty tagtree directories. Then we're going to link the
-    # file to its tagtree directories. I'm confident that this is
-    # going to be great.
-
-    num_of_links = 0
-    for currentfile in enumerate(files):
-
-        tags_of_currentfile = tags_of_files[currentfile[0]]
-        filename, dirname, \
-            basename, basename_without_lnk = split_up_filename(currentfile[1])
-
-        logging.debug('generate_tagtrees: handling file "' + filename + '" …')
-
-        if len(tags_of_currentfile) == 0:
-            # current file has no tags. It gets linked to the
-            # nontagged_item_dest_dir folder (if set). This is somewhat handy to find files
-            # which are - you guessed right - not tagged yet ;-)
-
-            if ignore_nontagged:
-                logging.debug('generate_tagtrees: file "' + filename +
-                              '" has no tags and will be ignores because of command line switch.')
-            else:
-                logging.debug('generate_tagtrees: file "' + filename +
-                              '" has no tags. Linking to "' +
-                              nontagged_item_dest_dir + '"')
-                if not options.dryrun:
-                    try:
-                        create_link(filename, os.path.join(nontagged_item_dest_dir, basename))
-                    except FileExistsError:
-                        logging.warning('Untagged file \"' + filename +
-                                        '\" is already linked: \"' +
-                                        os.path.join(nontagged_item_dest_dir, basename) +
-                                        '\". You must have used the recursive ' +
-                                        'option and the sub-tree you\'re generating a ' +
-                                        'tagtree from has two times the ' +
-                                        'same filename. I stick with the first one.')
-                num_of_links += 1
-
-        else:
-
-            # Here we go: current file has at least one tag. Create
-            # its tagtree directories and link the file:
-
-            # logging.debug('generate_tagtrees: permutations for file: "' + filename + '"')
-            for currentdepth in range(1, maxdepth+1):
-                # logging.debug('generate_tagtrees: currentdepth: ' + str(currentdepth))
-                for tagpermutation in itertools.permutations(tags_of_currentfile, currentdepth):
-
-                    # WHAT I THOUGHT:
-                    # Creating the directories does not require to iterate
-                    # over the different level of depth because
-                    # "os.makedirs()" is able to create all parent folders
-                    # that are necessary. This spares us a loop.
-                    # WHAT I LEARNED:
-                    # We *have* to iterate over the depth as well
-                    # because when a file has only one tag and the
-                    # maxdepth is more than one, we are forgetting
-                    # to create all those tagtree directories for this
-                    # single tag. Therefore: we need to depth-loop for
-                    # creating the directories as well. Bummer.
-                    create_tagtrees_dir(directory, tagpermutation)
-
-                    current_directory = os.path.join(directory, *[x for x in tagpermutation])  ## flatten out list of permutations to elements
-                    # logging.debug('generate_tagtrees: linking file in ' + current_directory)
-                    if not options.dryrun:
-                        try:
-                            create_link(filename, os.path.join(current_directory, basename))
-                        except FileExistsError:
-                            logging.warning('Tagged file \"' + filename +
-                                            '\" is already linked: \"' +
-                                            os.path.join(current_directory, basename) +
-                                            '\". You must have used the recursive ' +
-                                            'option and the sub-tree you\'re generating ' +
-                                            'a tagtree from has two times the same ' +
-                                            'filename. I stick with the first one.')
-                    num_of_links += 1
-
-            if link_missing_mutual_tagged_items:
-                for unique_tagset in unique_tags:
-
-                    # Oh yes, I do wish I had solved the default teststring issue in
-                    # a cleaner way. Ignore it here hard-coded.
-                    if unique_tagset == ['teststring1', 'teststring2']:
-                        continue
-
-                    # When there is no intersection between the item tags and the current unique_tagset ...
-                    if not set(tags_of_currentfile).intersection(set(unique_tagset)):
-
-                        # ... generate a no-$unique_tagset directory ...
-                        no_uniqueset_tag_found_dir = os.path.join(directory,
-                                                                  'no-' + ("-").join(unique_tagset))  # example: "no-draft-final"
-                        if not os.path.isdir(no_uniqueset_tag_found_dir):
-                            logging.debug('generate_tagtrees: creating non-existent no_uniqueset_tag_found_dir "%s" ...' %
-                                          str(no_uniqueset_tag_found_dir))
-                            if not options.dryrun:
-                                os.makedirs(no_uniqueset_tag_found_dir)
-
-                        # ... and link the item into it:
-                        if not options.dryrun:
-                            try:
-                                create_link(filename, os.path.join(no_uniqueset_tag_found_dir, basename))
-                            except FileExistsError:
-                                logging.warning('Tagged file \"' + filename + '\" is already linked: \"' +
-                                                os.path.join(no_uniqueset_tag_found_dir, basename) +
-                                                '\". I stick with the first one.')
-                        num_of_links += 1
-
+    if previous_tagtrees is not None:
+        update_tagtrees(directory, directories, links, previous_tagtrees)
+    else:
+        materialize_tagtrees(directory, directories, links)
+        if options.tagtrees_incremental and not options.dryrun:
+            write_tagtrees_manifest(directory, directories, links)
 
     # Brag about how brave I was. And: it also shows the user why the
     # runtime was that long. The number of links grows exponentially
     # with the number of tags. Keep this in mind when tempering with
     # the maxdepth!
-    logging.info('Number of links created in "' + directory + '" for the ' + str(len(files)) + ' files: ' +
-                 str(num_of_links) + '  (tagtrees depth is ' + str(maxdepth) + ')')
+    logging.info('Number of links in "' + directory + '" for the ' + str(len(files)) + ' files: ' +
+                 str(len(links)) + '  (tagtrees depth is ' + str(maxdepth) + ')')
 
 
 def start_filebrowser(directory):
@@ -2344,6 +4505,7 @@ def start_filebrowser(directory):
         return
 
     safe_import('subprocess')
+    safe_import('platform')
     current_platform = platform.system()
     logging.debug('platform.system() is: [' + current_platform + ']')
     if current_platform == 'Linux':
@@ -2442,6 +4604,8 @@ def handle_option_tagtrees(filtertags=None):
                           repr(options.tagtrees_handle_no_tag) + "]")
 
     chosen_maxdepth = DEFAULT_TAGTREES_MAXDEPTH
+    if options.tagtrees_auto_depth and not options.tagtrees_depth:
+        chosen_maxdepth = None  # no upper limit: choose depth according to --tagtrees-max-links
     if options.tagtrees_depth:
         chosen_maxdepth = options.tagtrees_depth[0]
         logging.debug('User overrides the default tagtrees depth to: ' +
@@ -2474,7 +4638,420 @@ def handle_option_tagtrees(filtertags=None):
     successful_exit()
 
 
+def forget_directory_caches(directory):
+    """
+    Removes the entries of directory from the caches which hold files
+    and tags of directories.
+
+    @param directory: string of an absolute directory
+    """
+
+    cache_of_files_with_metadata.pop(directory, None)
+    cache_of_tags_by_folder.pop(directory, None)
+    for key in [x for x in cache_of_tag_cooccurrences if x[0] == directory]:
+        del cache_of_tag_cooccurrences[key]
+    for recursive in [False, True]:
+        cache_of_inverted_tag_index.pop((directory, recursive), None)
+    cache_of_directory_mtimes.pop(directory, None)
+
+
+def validate_directory_caches(directory, recursive):
+    """
+    Drops the cached files and tags of directory if they might be
+    outdated. Renaming, adding or removing files changes the
+    modification time of their directory. Therefore, the caches of a
+    single directory stay valid as long as its modification time stays
+    the same.
+
+    Sub-directories are not checked: recursive requests are answered
+    from scratch or, with --index, from the tag index which re-scans
+    changed directories only.
+
+    @param directory: string of an absolute directory
+    @param recursive: boolean; if True, sub-directories are part of the request
+    """
+
+    refreshed_tag_index_scopes.clear()
+    if recursive:
+        forget_directory_caches(directory)
+        return
+
+    mtime = os.stat(directory).st_mtime_ns
+    if cache_of_directory_mtimes.get(directory) != mtime:
+        forget_directory_caches(directory)
+        cache_of_directory_mtimes[directory] = mtime
+
+
+class FileTagger(object):
+    """
+    Programmatic interface for adding and removing tags, filtering and
+    listing files without any command line. Long-running programs like
+    indexing services or --daemon create FileTagger objects once and
+    use them for many operations:
+
+      tagger = FileTagger.for_file('/photos/a.jpg')
+      new_files, errors = tagger.tag(['/photos/a.jpg'], ['foo', '-bar'])
+      files = tagger.filter('/photos', 'foo (red OR blue)', recursive=True)
+      tags = tagger.list_tags('/photos', recursive=True)
+
+    A FileTagger holds the controlled vocabulary of one .filetags file:
+    its tags, the groups of mutually exclusive tags and the tags not to
+    suggest. The file is parsed again when it has changed.
+
+    Parsed file names and the files and tags of directories are cached
+    for all FileTagger objects of the process (see
+    validate_directory_caches()). Options like --index or --jobs apply
+    to all operations; without any command line, they have their
+    default values.
+    """
+
+    def __init__(self, vocabulary_filename=None):
+        """
+        @param vocabulary_filename: string of the controlled vocabulary file or None for an empty vocabulary
+        """
+
+        self.vocabulary_filename = vocabulary_filename
+        self.vocabulary_version = None  # (modification time, size) of the parsed file
+        self.vocabulary = []
+        self.unique_tags = [UNIQUE_TAG_TESTSTRINGS]
+        self.do_not_suggest_tags = []
+        self.refresh_vocabulary()
+
+    @classmethod
+    def for_file(cls, startfile):
+        """
+        Returns a FileTagger with the controlled vocabulary of startfile
+        (see locate_controlled_vocabulary()).
+
+        @param startfile: file or directory whose location is the starting point of the search
+        @param return: FileTagger
+        """
+
+        return cls(locate_controlled_vocabulary(startfile) or None)
+
+    def refresh_vocabulary(self):
+        """
+        Parses the controlled vocabulary if its file has been changed
+        (or removed) since it was parsed last time.
+
+        @param return: True if the vocabulary got parsed
+        """
+
+        if not self.vocabulary_filename:
+            return False
+        try:
+            stat = os.stat(self.vocabulary_filename)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version == self.vocabulary_version:
+            return False
+
+        logging.debug('FileTagger: parsing controlled vocabulary [%s]' % self.vocabulary_filename)
+        tags, unique_tag_groups, donotsuggest = [], [], []
+        if version:
+            tags, unique_tag_groups, donotsuggest = read_controlled_vocabulary(self.vocabulary_filename)
+        self.vocabulary = tags
+        self.unique_tags = [UNIQUE_TAG_TESTSTRINGS] + unique_tag_groups
+        self.do_not_suggest_tags = donotsuggest
+        self.vocabulary_version = version
+        return True
+
+    def activate(self, **option_values):
+        """
+        Sets the global vocabulary variables and options the functions
+        of filetags work with. deactivate() restores them.
+
+        @param option_values: options to set like recursive=True
+        @param return: the previous state for deactivate()
+        """
+
+        global unique_tags
+        global do_not_suggest_tags
+        global controlled_vocabulary_filename
+
+        state = (unique_tags, do_not_suggest_tags, controlled_vocabulary_filename, vars(options).copy())
+        unique_tags = self.unique_tags
+        do_not_suggest_tags = self.do_not_suggest_tags
+        controlled_vocabulary_filename = self.vocabulary_filename or ''
+        vars(options).update(option_values)
+        return state
+
+    def deactivate(self, state):
+        """
+        @param state: the return value of activate()
+        """
+
+        global unique_tags
+        global do_not_suggest_tags
+        global controlled_vocabulary_filename
+
+        unique_tags, do_not_suggest_tags, controlled_vocabulary_filename, option_values = state
+        vars(options).update(option_values)
+
+    def tag(self, files, tags, do_remove=False, dryrun=False):
+        """
+        Adds or removes tags like the command line does. Links with the
+        same basename as their source file are handled like
+        handle_file_and_optional_link() does.
+
+        @param files: list of file names, preferably absolute ones
+        @param tags: list of tags; with do_remove False, tags starting with "-" get removed
+        @param do_remove: boolean which defines if tags should be added (False) or removed (True)
+        @param dryrun: boolean which defines if files should be changed (False) or not (True)
+        @param return: tuple of list of the resulting file names and list of error messages
+        """
+
+        global list_of_link_directories
+        global max_file_length
+
+        files = [os.path.abspath(x) for x in files]
+        new_files = []
+        errors = []
+        if not files:
+            return new_files, errors
+
+        state = self.activate(dryrun=dryrun)
+        try:
+            max_file_length = max(len(x) for x in files)
+            for filename in files:
+                if not os.path.exists(filename):
+                    errors.append('File "' + filename + '" does not exist.')
+                elif is_broken_link(filename):
+                    errors.append('File "' + filename + '" is a broken link.')
+                else:
+                    num_errors, new_filename = handle_file_and_optional_link(filename, tags, do_remove,
+                                                                             False, dryrun)
+                    list_of_link_directories = []
+                    if num_errors:
+                        errors.append('Could not handle file "' + filename + '".')
+                    elif new_filename:
+                        new_files.append(new_filename)
+        finally:
+            self.deactivate(state)
+        return new_files, errors
+
+    def untag(self, files, tags, dryrun=False):
+        """
+        Removes tags; see tag().
+        """
+
+        return self.tag(files, tags, do_remove=True, dryrun=dryrun)
+
+    def filter(self, directory, query, recursive=False):
+        """
+        @param directory: string of an existing directory
+        @param query: string with a tag query (see parse_tag_query()); raises ValueError if invalid
+        @param recursive: boolean; if True, files of sub-directories are included
+        @param return: list of absolute file names matching the query
+        """
+
+        directory = os.path.abspath(directory)
+        parse_tag_query(query)  # raises ValueError before anything gets scanned
+        state = self.activate(recursive=recursive)
+        try:
+            validate_directory_caches(directory, recursive)
+            files, inverted_tag_index = get_files_and_inverted_tag_index_of_directory(directory)
+            files = filter_files_matching_tag_query(files, query, inverted_tag_index)
+            return [os.path.join(directory, x) for x in files]
+        finally:
+            if recursive:
+                # recursive results are cached under the same key as non-recursive ones:
+                forget_directory_caches(directory)
+            self.deactivate(state)
+
+    def list_tags(self, directory, recursive=False):
+        """
+        @param directory: string of an existing directory
+        @param recursive: boolean; if True, tags of sub-directories are included
+        @param return: dict of tags and their number of occurrence like --ln
+        """
+
+        directory = os.path.abspath(directory)
+        # recursive listings are limited to the list options:
+        state = self.activate(recursive=recursive, list_tags_by_number=True)
+        try:
+            validate_directory_caches(directory, recursive)
+            return dict(get_tags_from_files_and_subfolders(startdir=directory))
+        finally:
+            if recursive:
+                forget_directory_caches(directory)
+            self.deactivate(state)
+
+
+def get_file_tagger(startfile):
+    """
+    Returns the FileTagger of the controlled vocabulary of startfile
+    from cache_of_file_taggers with its vocabulary refreshed.
+
+    @param startfile: file or directory whose location is the starting point of the search
+    @param return: FileTagger
+    """
+
+    filename = locate_controlled_vocabulary(startfile) or None
+    if filename in cache_of_file_taggers:
+        cache_of_file_taggers[filename].refresh_vocabulary()
+    else:
+        cache_of_file_taggers[filename] = FileTagger(filename)
+    return cache_of_file_taggers[filename]
+
+
+def handle_daemon_request(request):
+    """
+    Serves one request of --daemon. Requests are dicts like:
+      {"command": "tag", "files": ["/a/file.jpg"], "tags": ["foo", "-bar"], "dryrun": false}
+      {"command": "untag", "files": ["/a/file -- foo.jpg"], "tags": ["foo"]}
+      {"command": "filter", "directory": "/a", "query": "foo -bar", "recursive": true}
+      {"command": "list", "directory": "/a", "recursive": true}
+      {"command": "stop"}
+
+    Options given on the command line of the daemon (like --index)
+    apply to all requests; "recursive" and "dryrun" apply to the
+    request only.
+
+    @param request: dict decoded from one line of JSON
+    @param return: dict with 'ok' and the result or an 'error' message
+    """
+
+    logging.debug('handle_daemon_request: ' + repr(request))
+    try:
+        command = request.get('command')
+        recursive = bool(request.get('recursive', False))
+
+        if command in ['tag', 'untag']:
+            for key in ['files', 'tags']:
+                if not isinstance(request.get(key), list) or not all(isinstance(x, str) for x in request[key]):
+                    return {'ok': False, 'error': 'Malformed request: "' + key + '" has to be a list of strings.'}
+            files = [os.path.abspath(x) for x in request['files']]
+            if not files:
+                return {'ok': False, 'error': 'Please add at least one file name'}
+            new_files, errors = get_file_tagger(files[0]).tag(files, request['tags'], command == 'untag',
+                                                              bool(request.get('dryrun', False)))
+            response = {'ok': not errors, 'files': new_files}
+            if errors:
+                response['error'] = ' '.join(errors)
+            return response
+
+        elif command in ['filter', 'list']:
+            directory = os.path.abspath(request['directory'])
+            if not os.path.isdir(directory):
+                return {'ok': False, 'error': 'Directory "' + directory + '" does not exist.'}
+            if command == 'filter':
+                return {'ok': True, 'files': get_file_tagger(directory).filter(directory, request['query'], recursive)}
+            else:
+                return {'ok': True, 'tags': get_file_tagger(directory).list_tags(directory, recursive)}
+
+        elif command == 'stop':
+            return {'ok': True}
+
+        else:
+            return {'ok': False, 'error': 'Unknown command "' + str(command) + '".'}
+
+    except (KeyError, TypeError, AttributeError) as error:
+        return {'ok': False, 'error': 'Malformed request: ' + repr(error)}
+    except ValueError as error:
+        return {'ok': False, 'error': str(error)}
+    except OSError as error:
+        return {'ok': False, 'error': str(error)}
+    except SystemExit as error:
+        # error_exit() has logged the reason already:
+        return {'ok': False, 'error': 'Request failed with error code ' + str(error.code) + '.'}
+    except Exception as error:
+        # a failing request must never stop the daemon:
+        logging.exception('handle_daemon_request: unexpected error')
+        return {'ok': False, 'error': 'Request failed: ' + repr(error)}
+
+
+def serve_daemon(socket_filename):
+    """
+    Listens on the Unix socket socket_filename and serves requests
+    until a "stop" request arrives. Each line of a connection holds one
+    request in JSON (see handle_daemon_request()) which is answered
+    by one line of JSON. Requests are handled one after another.
+
+    The socket is only accessible by the current user. A left-over
+    socket of a daemon that is not running anymore gets replaced.
+
+    @param socket_filename: string of the file name of the socket
+    """
+
+    safe_import('socket')  # for the Unix socket of --daemon
+    safe_import('json')  # for the requests of --daemon
+
+    if os.path.exists(socket_filename):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_filename)
+        except OSError:
+            logging.debug('serve_daemon: removing left-over socket ' + socket_filename)
+            os.remove(socket_filename)
+        else:
+            error_exit(29, 'Another filetags daemon is listening on "' + socket_filename + '" already.')
+        finally:
+            probe.close()
+    elif os.path.dirname(socket_filename):
+        os.makedirs(os.path.dirname(socket_filename), exist_ok=True)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # the socket is created with the permissions of the umask:
+        previous_umask = os.umask(0o177)
+        try:
+            server.bind(socket_filename)
+        finally:
+            os.umask(previous_umask)
+        server.listen()
+        logging.info('filetags daemon listening on "' + socket_filename + '" ...')
+
+        stop = False
+        while not stop:
+            connection, address = server.accept()
+            with connection, connection.makefile('rb') as requests:
+                for line in requests:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line.decode('utf-8'))
+                    except ValueError as error:
+                        response = {'ok': False, 'error': 'Request is no valid JSON: ' + str(error)}
+                    else:
+                        if not isinstance(request, dict):
+                            response = {'ok': False, 'error': 'Request is no JSON object.'}
+                        else:
+                            response = handle_daemon_request(request)
+                            stop = stop or request.get('command') == 'stop'
+                    try:
+                        connection.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                    except OSError as error:
+                        logging.debug('serve_daemon: client went away: ' + str(error))
+                        break
+                    if stop:
+                        break
+    finally:
+        server.close()
+        if os.path.exists(socket_filename):
+            os.remove(socket_filename)
+    logging.info('filetags daemon stopped.')
+
+
+def log_parse_cache_statistics():
+    """
+    Logs how many basenames were answered from the cache of
+    TaggedFileName.parse() in verbose mode.
+    """
+
+    lookups = parse_cache_statistics['hits'] + parse_cache_statistics['misses']
+    if lookups:
+        logging.debug('parse cache: %i hits, %i misses, hit rate %.1f%%, %i of at most %i basenames cached' %
+                      (parse_cache_statistics['hits'], parse_cache_statistics['misses'],
+                       100.0 * parse_cache_statistics['hits'] / lookups,
+                       len(cache_of_parsed_basenames), options.parse_cache_size))
+
+
 def successful_exit():
+    if similar_tags_cache:
+        similar_tags_cache.save()
+    log_parse_cache_statistics()
     logging.debug("successfully finished.")
     sys.stdout.flush()
     sys.exit(0)
@@ -2483,16 +5060,57 @@ def successful_exit():
 def main():
     """Main function"""
 
+    global options
+    global TTY_HEIGHT
+    global TTY_WIDTH
+    options = parser.parse_args()
+
     if options.version:
         print(os.path.basename(sys.argv[0]) + " version " + PROG_VERSION_DATE)
         sys.exit(0)
 
     handle_logging()
+    TTY_HEIGHT, TTY_WIDTH = get_terminal_size()
 
     if options.verbose and options.quiet:
         error_exit(1, "Options \"--verbose\" and \"--quiet\" found. " +
                    "This does not make any sense, you silly fool :-)")
 
+    if options.jobs < 1:
+        error_exit(22, "The number of jobs has to be at least one.")
+
+    if options.parse_cache_size < 0:
+        error_exit(28, "The size of the parse cache must not be negative.")
+
+    if options.tagtrees_min_files < 1:
+        error_exit(26, "The minimum number of files for tagtrees directories has to be at least one.")
+
+    if options.tagtrees_staged and options.tagtrees_incremental:
+        error_exit(27, "Incremental tagtrees are updated in place. Please don't combine " +
+                   "\"--tagtrees-staged\" with \"--tagtrees-incremental\".")
+
+    if options.daemon_socket:
+        if IS_WINDOWS:
+            error_exit(31, "The daemon requires Unix sockets which are not available on Windows.")
+        if options.files or options.tags or options.interactive or options.tagfilter or options.query or \
+           options.tagtrees or options.tag_gardening or options.list_tags_by_number or \
+           options.list_tags_by_alphabet or options.list_unknown_tags:
+            error_exit(30, "Please don't use the daemon option together with files or any other action.")
+        serve_daemon(options.daemon_socket)
+        successful_exit()
+
+    if options.tagtrees_auto_depth and options.tagtrees_max_links is None:
+        error_exit(25, "Option \"--tagtrees-auto-depth\" requires a budget given by \"--tagtrees-max-links\".")
+
+    if options.query:
+        if options.interactive or options.tags:
+            error_exit(23, "Please don't use the query option together with tagging options.")
+        try:
+            parse_tag_query(options.query)
+        except ValueError as error:
+            error_exit(23, str(error))
+        options.tagfilter = True
+
     # interactive mode and tags are given
     if options.interactive and options.tags:
         error_exit(3, "I found option \"--tag\" and option \"--interactive\". \n" +
@@ -2533,7 +5151,7 @@ def main():
 
     files = extract_filenames_from_argument(options.files)
 
-    if platform.system() == 'Windows' and len(files)==1:
+    if IS_WINDOWS and len(files)==1:
         # Windows CLI does not resolve wildcard globbing: https://github.com/novoid/filetags/issues/25
         # Therefore, filetags has to do the business proper(TM) operating systems usually
         # does: converting file globs to lists of files:
@@ -2603,6 +5221,13 @@ def main():
     elif options.tagtrees and not options.tagfilter:
         handle_option_tagtrees()
 
+    elif options.query:
+        # non-interactive filtering: the query was validated above
+        tags_from_userinput = extract_tags_from_argument(options.query.strip())
+        chosen_tagtrees_dir = TAGFILTER_DIRECTORY
+        if options.tagtrees_directory:
+            chosen_tagtrees_dir = options.tagtrees_directory[0]
+
     elif options.interactive or not options.tags:
 
         tags_for_visual = None
@@ -2684,11 +5309,8 @@ def main():
                 logging.debug('files[0] = ' + files[0])
                 logging.debug('startdir = ' + os.path.dirname(os.path.abspath(os.path.basename(files[0]))))
                 upto9_tags_for_shortcuts = sorted(
-                    get_upto_nine_keys_of_dict_with_highest_value(
-                        get_tags_from_files_and_subfolders(
-                            startdir=os.path.dirname(
-                                os.path.abspath(os.path.basename(files[0])))),
-                        tags_intersection_of_files, omit_filetags_donotsuggest_tags=True))
+                    get_upto_nine_suggested_tags(os.path.dirname(os.path.abspath(os.path.basename(files[0]))),
+                                                 tags_intersection_of_files))
                 logging.debug('derived upto9_tags_for_shortcuts')
             logging.debug('derived vocabulary with %i entries' % len(vocabulary))  # using default vocabulary which was generate above
 
@@ -2720,7 +5342,9 @@ def main():
 
     if options.tagfilter and not files and not options.tagtrees:
         assert_empty_tagfilter_directory(chosen_tagtrees_dir)
-        files = filter_files_matching_tags(get_files_of_directory(os.getcwd()), tags_from_userinput)
+        files, inverted_tag_index = get_files_and_inverted_tag_index_of_directory(os.getcwd())
+        files = filter_files_matching_tag_query(files, BETWEEN_TAG_SEPARATOR.join(tags_from_userinput),
+                                                inverted_tag_index)
     elif options.tagfilter and not files and options.tagtrees:
         # the combination of tagtrees and tagfilter requires user input of tags which was done above
         handle_option_tagtrees(tags_from_userinput)
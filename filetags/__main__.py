@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Allows "python3 -m filetags ..." which starts faster than running
+# filetags/__init__.py as a script: Python caches the compiled
+# bytecode of imported modules but compiles scripts on each start.
+
+import sys
+import logging
+
+sys.argv[0] = 'filetags'  # instead of the path of this file in the help and --version
+from filetags import main
+
+try:
+    main()
+except KeyboardInterrupt:
+    logging.info("Received KeyboardInterrupt")
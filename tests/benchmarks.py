@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# invoke benchmarks using following command line:
+# ~/src/filetags % PYTHONPATH=".:" tests/benchmarks.py
+#
+# In contrast to the unit tests, the benchmarks do not assert
+# anything. They generate test data within a temporary directory and
+# print their measurements to stdout.
+
+import os
+import sys
+import time
+import tempfile
+import logging
+import tracemalloc
+import random
+import difflib
+import subprocess
+import threading
+from shutil import rmtree
+
+import filetags
+
+NUMBER_OF_DIRECTORIES = 50
+FILES_PER_DIRECTORY = 200
+LINKS_PER_DIRECTORY = 20
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class SyscallCounter(object):
+    """
+    Counts the calls of the functions of the os module that result in
+    system calls for examining the file system. Calls of DirEntry.stat()
+    are counted when they are not answered from the cache of the
+    DirEntry.
+
+    This is a pure Python replacement for "strace -c" which is not
+    available on all platforms.
+    """
+
+    COUNTED_FUNCTIONS = ['stat', 'lstat', 'readlink', 'listdir', 'mkdir', 'symlink', 'link', 'remove', 'rmdir']
+
+    def __init__(self):
+        self.counts = {}
+        self.originals = {}
+
+    def __enter__(self):
+        self.counts = {name: 0 for name in self.COUNTED_FUNCTIONS + ['scandir', 'DirEntry.stat']}
+        for name in self.COUNTED_FUNCTIONS:
+            self.originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self.originals[name]))
+        self.originals['scandir'] = os.scandir
+        os.scandir = self._scandir
+        return self
+
+    def __exit__(self, *args):
+        for name, function in self.originals.items():
+            setattr(os, name, function)
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def _wrap(self, name, function):
+        def counting_function(*args, **kwargs):
+            self.counts[name] += 1
+            return function(*args, **kwargs)
+        return counting_function
+
+    def _scandir(self, *args, **kwargs):
+        self.counts['scandir'] += 1
+        return CountingScandirIterator(self.originals['scandir'](*args, **kwargs), self)
+
+
+class CountingScandirIterator(object):
+
+    def __init__(self, iterator, counter):
+        self.iterator = iterator
+        self.counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.iterator.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return CountingDirEntry(next(self.iterator), self.counter)
+
+    def close(self):
+        self.iterator.close()
+
+
+class CountingDirEntry(object):
+
+    def __init__(self, entry, counter):
+        self.entry = entry
+        self.counter = counter
+        self.name = entry.name
+        self.path = entry.path
+        self.stat_cached = set()
+
+    def __fspath__(self):
+        return self.path
+
+    def is_dir(self, follow_symlinks=True):
+        return self.entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        return self.entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self.entry.is_symlink()
+
+    def inode(self):
+        return self.entry.inode()
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks not in self.stat_cached:
+            self.counter.counts['DirEntry.stat'] += 1
+            self.stat_cached.add(follow_symlinks)
+        return self.entry.stat(follow_symlinks=follow_symlinks)
+
+
+def create_test_hierarchy():
+    """
+    Creates NUMBER_OF_DIRECTORIES directories with FILES_PER_DIRECTORY
+    tagged files and LINKS_PER_DIRECTORY symbolic links each.
+
+    @param return: the temporary directory holding the hierarchy
+    """
+
+    tempdir = tempfile.mkdtemp(prefix='filetags_benchmark_')
+    for directory_number in range(NUMBER_OF_DIRECTORIES):
+        directory = os.path.join(tempdir, 'directory %03i -- dirtag%i' % (directory_number, directory_number % 7))
+        os.makedirs(directory)
+        for file_number in range(FILES_PER_DIRECTORY):
+            filename = '2018-03-18 file %04i -- tag%i tag%i.txt' % (file_number, file_number % 13, file_number % 17)
+            with open(os.path.join(directory, filename), 'w') as outputhandle:
+                outputhandle.write('benchmark')
+        if hasattr(os, 'symlink'):
+            for link_number in range(LINKS_PER_DIRECTORY):
+                os.symlink(os.path.join(directory, '2018-03-18 file %04i -- tag%i tag%i.txt' %
+                                        (link_number, link_number % 13, link_number % 17)),
+                           os.path.join(directory, 'link %04i -- linktag.txt' % link_number))
+        # like an archive that was not modified just now (see filetags.TAG_INDEX_MTIME_GRANULARITY):
+        os.utime(directory, (time.time() - 60, time.time() - 60))
+    return tempdir
+
+
+def os_walk_get_files_with_metadata(startdir):
+    """
+    The traversal of get_files_with_metadata() as it was implemented
+    with os.walk() before the scandir-based scanner was introduced. It
+    is kept here as a reference for the benchmark.
+    """
+
+    cache = []
+    for root, dirs, files in os.walk(startdir):
+        for filename in files:
+            absfilename = os.path.abspath(os.path.join(root, filename))
+            path, basename = os.path.split(absfilename)
+            if os.path.islink(absfilename):
+                logging.debug('file [%s] is link to [%s] and gets ignored here' %
+                              (absfilename, os.path.join(os.path.dirname(absfilename), os.readlink(absfilename))))
+                continue
+            else:
+                ctime = time.localtime(os.path.getctime(absfilename))
+            cache.append({
+                'filename': basename,
+                'filetags': filetags.extract_tags_from_filename(basename),
+                'path': path,
+                'alltags': filetags.extract_tags_from_path(absfilename),
+                'ctime': ctime,
+                'datestamp': filetags.extract_iso_datestamp_from_filename(basename)
+            })
+    return cache
+
+
+def split_path_extract_tags_from_path(path):
+    """
+    The implementation of extract_tags_from_path() before the tags of
+    directories got cached: each component of the path is parsed for
+    each file. It is kept here as a reference for the benchmark.
+    """
+
+    tags = []
+    head, tail = os.path.split(os.path.abspath(path))
+    components = [tail]
+    while tail:
+        head, tail = os.path.split(head)
+        components.insert(0, tail)
+    for item in components:
+        for currentitemtag in filetags.extract_tags_from_filename(item):
+            if currentitemtag not in tags:
+                tags.append(currentitemtag)
+    return tags
+
+
+def measure(description, function, *args):
+    """
+    Runs function with args while counting system calls and prints the
+    results as one line.
+
+    @param return: the return value of function
+    """
+
+    start = time.time()
+    with SyscallCounter() as counter:
+        result = function(*args)
+    delta = time.time() - start
+    details = ', '.join('%s: %i' % (name, count) for name, count in sorted(counter.counts.items()) if count)
+    print('  {:<45s} {:>9,d} calls  {:>7.3f}s   ({})'.format(description, counter.total(), delta, details))
+    return result
+
+
+def benchmark_scanner(tempdir):
+
+    print('\nTraversal of %i directories with %i files and %i links each:\n' %
+          (NUMBER_OF_DIRECTORIES, FILES_PER_DIRECTORY, LINKS_PER_DIRECTORY))
+
+    filetags.options.recursive = True
+    filetags.options.tag_gardening = True  # enables recursive traversal in get_files_with_metadata()
+
+    legacy = measure('os.walk() + islink/readlink/getctime', os_walk_get_files_with_metadata, tempdir)
+    scanned = measure('scan_directory_tree() with DirEntry data',
+                      filetags.get_files_with_metadata, tempdir, False)
+    assert len(legacy) == len(scanned)
+
+    for jobs in [4, 16]:
+        filetags.options.jobs = jobs
+        filetags.cache_of_files_with_metadata = {}
+        parallel = measure('scan_directory_tree() with --jobs %i' % jobs,
+                           filetags.get_files_with_metadata, tempdir, False)
+        assert [x['filename'] for x in parallel] == [x['filename'] for x in scanned]
+    filetags.options.jobs = filetags.DEFAULT_JOBS
+
+
+def benchmark_split_up_filename(tempdir):
+
+    files = [os.path.join(root, filename) for root, dirs, filenames in os.walk(tempdir) for filename in filenames]
+    print('\nSplitting up %i file names:\n' % len(files))
+
+    resolved = measure('split_up_filename() with exists/abspath', lambda: [filetags.split_up_filename(x) for x in files])
+    pure = measure('split_up_filename_pure()', lambda: [filetags.split_up_filename_pure(x) for x in files])
+    assert resolved == pure
+
+
+def benchmark_path_tags(tempdir):
+
+    files = [os.path.join(root, 'level -- deep%i' % level, filename)
+             for root, dirs, filenames in os.walk(tempdir) for filename in filenames for level in range(3)]
+    print('\nPath tags of %i file names:\n' % len(files))
+
+    filetags.cache_of_path_tags = {}
+    parsed = measure('parsing each path component per file', lambda: [split_path_extract_tags_from_path(x) for x in files])
+    cached = measure('tags of directories cached', lambda: [filetags.extract_tags_from_path(x) for x in files])
+    assert parsed == cached
+
+
+def benchmark_file_catalog(tempdir):
+
+    print('\nMemory of the metadata of %i files:\n' % (NUMBER_OF_DIRECTORIES * FILES_PER_DIRECTORY))
+
+    def measure_memory(description, function, *args):
+        tracemalloc.start()
+        result = function(*args)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('  {:<45s} {:>9,d} bytes  {:>7,d} bytes per file'.format(description, size, size // len(result)))
+        return result
+
+    filetags.options.recursive = True
+    filetags.options.tag_gardening = True
+    dicts = measure_memory('list of metadata-dicts', os_walk_get_files_with_metadata, tempdir)
+    catalog = measure_memory('FileCatalog', filetags.get_files_with_metadata, tempdir, False)
+    def sort_key(metadata):
+        return metadata['path'], metadata['filename']
+    assert sorted((dict(x) for x in catalog), key=sort_key) == sorted(dicts, key=sort_key)
+
+
+def benchmark_tag_matrix(tempdir):
+
+    filetags.options.recursive = True
+    filetags.options.tag_gardening = True
+    files_with_metadata = filetags.get_files_with_metadata(tempdir, False)
+    tags = sorted(set(tag for x in files_with_metadata for tag in x['alltags']))
+    taggroups = [tags[number:number + 3] for number in range(0, len(tags), 3)]
+    print('\nGardening statistics of %i files for %i tags in %i tag groups:\n' %
+          (len(files_with_metadata), len(tags), len(taggroups)))
+
+    def list_comprehensions():
+        return ([len([x for x in files_with_metadata if set(x['alltags']).intersection(set(taggroup))])
+                 for taggroup in taggroups],
+                [len([x for x in files_with_metadata if tag in x['alltags']]) for tag in tags])
+
+    def tag_matrix():
+        matrix = filetags.TagMatrix(x['alltags'] for x in files_with_metadata)
+        counts = matrix.counts()
+        return ([matrix.count_files_with_any(taggroup) for taggroup in taggroups],
+                [counts[tag] for tag in tags])
+
+    compared = measure('list comprehensions per tag group and tag', list_comprehensions)
+    vectorized = measure('TagMatrix (NumPy: %s)' % bool(filetags.import_numpy()), tag_matrix)
+    assert compared == vectorized
+
+
+def benchmark_tag_matrix_scaling():
+
+    print('\nBuilding a TagMatrix without NumPy for growing numbers of files:\n')
+
+    for number_of_files in [20000, 80000, 320000]:
+        rows = [['group%i' % (number % 13), 'tag%i' % (number % 1009), 'item%i' % (number % 50000)]
+                for number in range(number_of_files)]
+
+        def count_with_dict():
+            counts = {}
+            for tags in rows:
+                for tag in tags:
+                    counts[tag] = counts.get(tag, 0) + 1
+            return counts
+
+        def tag_matrix():
+            matrix = filetags.TagMatrix(rows, use_numpy=False)
+            matrix.count_files_without_tags()
+            return matrix.counts()
+
+        counted = measure('dict of counts for %i files' % number_of_files, count_with_dict)
+        built = measure('TagMatrix for %i files' % number_of_files, tag_matrix)
+        assert counted == built
+
+
+def benchmark_suggestions(tempdir):
+
+    directory = os.path.join(tempdir, sorted(os.listdir(tempdir))[0])
+    tags_of_files = ['tag1', 'tag2']
+    print('\nShortcut suggestions for %i invocations within a directory of %i files:\n' %
+          (100, len(os.listdir(directory))))
+
+    filetags.options.recursive = False
+
+    def frequent_tags():
+        result = []
+        for number in range(100):
+            filetags.cache_of_tags_by_folder = {}
+            result.append(filetags.get_upto_nine_keys_of_dict_with_highest_value(
+                filetags.get_tags_from_files_and_subfolders(directory), tags_of_files,
+                omit_filetags_donotsuggest_tags=True))
+        return result
+
+    def suggested_tags():
+        result = []
+        for number in range(100):
+            filetags.cache_of_tag_cooccurrences = {}
+            filetags.refreshed_tag_index_scopes = set()
+            result.append(filetags.get_upto_nine_suggested_tags(directory, tags_of_files))
+        return result
+
+    measure('tag dict re-built per invocation', frequent_tags)
+    filetags.options.use_index = True
+    try:
+        suggested_tags()  # creates the index
+        os.utime(directory, (time.time() - 60, time.time() - 60))
+        suggested_tags()  # stores the modification time which is not recent any more
+        measure('co-occurrences read from --index', suggested_tags)
+        start = time.time()
+        filetags.get_upto_nine_suggested_tags(directory, tags_of_files)
+        print('  {:<45s} {:>9.1f} µs'.format('one cached lookup', (time.time() - start) * 1e6))
+        filename = sorted(x for x in os.listdir(directory) if x != filetags.TAG_INDEX_FILENAME)[0]
+        os.rename(os.path.join(directory, filename), os.path.join(directory, 'renamed -- tag1 newtag.txt'))
+        filetags.cache_of_tag_cooccurrences = {}
+        filetags.refreshed_tag_index_scopes = set()
+        renamed = measure('one invocation after renaming one file', filetags.get_upto_nine_suggested_tags,
+                          directory, tags_of_files)
+        filetags.options.use_index = False
+        filetags.cache_of_tag_cooccurrences = {}
+        assert renamed == filetags.get_upto_nine_suggested_tags(directory, tags_of_files)
+        os.rename(os.path.join(directory, 'renamed -- tag1 newtag.txt'), os.path.join(directory, filename))
+    finally:
+        filetags.options.use_index = False
+        for connection in filetags.tag_index_connections.values():
+            connection.close()
+        filetags.tag_index_connections = {}
+        os.remove(os.path.join(directory, filetags.TAG_INDEX_FILENAME))
+
+
+def benchmark_similar_tags():
+
+    random.seed(42)
+    letters = 'etaoinshrdlcumwfgypbvkjxqz'
+    tags = set()
+    while len(tags) < 20000:
+        tags.add(''.join(random.choice(letters[:random.randint(8, 26)]) for number in range(random.randint(3, 14))))
+    tags = sorted(tags)
+    queries = tags[::100]
+    print('\nSimilar tags among %i tags for %i of them:\n' % (len(tags), len(queries)))
+
+    def get_close_matches():
+        return [[x for x in difflib.get_close_matches(tag, tags, n=999, cutoff=0.7) if x != tag] for tag in queries]
+
+    def similarity_index():
+        index = filetags.TagSimilarityIndex(tags)
+        return [index.find_similar_tags(tag) for tag in queries]
+
+    compared = measure('difflib.get_close_matches() per tag', get_close_matches)
+    indexed = measure('TagSimilarityIndex', similarity_index)
+    assert compared == indexed
+
+    queries = tags[::10]
+    print('\nSimilar tags among %i tags for %i of them on %i CPU cores:\n' % (len(tags), len(queries), os.cpu_count()))
+    durations = {}
+    for jobs in sorted(set([1, 2, 4, os.cpu_count()])):
+        start = time.time()
+        similar = filetags.TagSimilarityIndex(tags).find_similar_tags_of_many(queries, jobs)
+        durations[jobs] = time.time() - start
+        if jobs == 1:
+            sequential = similar
+        assert list(similar.items()) == list(sequential.items())
+        print('  {:<45s} {:>7.3f}s   (speedup: {:.2f})'.format('--jobs %i' % jobs, durations[jobs],
+                                                             durations[1] / durations[jobs]))
+
+
+def benchmark_similar_tags_cache():
+
+    random.seed(23)
+    letters = 'etaoinshrdlcumwfgypbvkjxqz'
+    tags = set()
+    while len(tags) < 5000:
+        tags.add(''.join(random.choice(letters[:random.randint(8, 26)]) for number in range(random.randint(3, 14))))
+    tags = sorted(tags)
+    changed_tags = tags[10:] + ['newtag%i' % number for number in range(10)]
+    cachedir = tempfile.mkdtemp(prefix='filetags_benchmark_cache_')
+    filename = os.path.join(cachedir, filetags.SIMILAR_TAGS_CACHE_FILENAME)
+    print('\nSimilar tags of all %i tags with a persistent cache:\n' % len(tags))
+
+    def run(tags):
+        cache = filetags.SimilarTagsCache(filename)
+        cache.update(tags)
+        tag_set = frozenset(tags)
+        similar = {tag: cache.find_similar_tags(tag, tag_set) for tag in tags}
+        cache.save()
+        return similar
+
+    try:
+        first = measure('first run', run, tags)
+        measure('unchanged tags', run, tags)
+        changed = measure('10 tags removed and 10 tags added', run, changed_tags)
+        index = filetags.TagSimilarityIndex(changed_tags)
+        assert changed == {tag: index.find_similar_tags(tag) for tag in changed_tags}
+        other_tags = [tag.upper() for tag in tags[:1000]]
+        measure('tags of another archive', run, other_tags)
+        again = measure('first tags again', run, tags)
+        assert again == first
+    finally:
+        rmtree(cachedir)
+
+
+def benchmark_vocabulary_cache():
+
+    random.seed(23)
+    letters = 'etaoinshrdlcumwfgypbvkjxqz'
+    cachedir = tempfile.mkdtemp(prefix='filetags_benchmark_cache_')
+    vocabulary_filename = os.path.join(cachedir, '.filetags')
+    with open(vocabulary_filename, 'w') as outputhandle:
+        for number in range(20000):
+            tag = ''.join(random.choice(letters) for character in range(random.randint(3, 14)))
+            if number % 10 == 0:
+                outputhandle.write('%s %s_draft %s_final  # group\n' % (tag, tag, tag))
+            elif number % 100 == 1:
+                outputhandle.write('#donotsuggest %s\n' % tag)
+            else:
+                outputhandle.write(tag + '\n')
+    original_cache_directory = filetags.CACHE_DIRECTORY
+    filetags.CACHE_DIRECTORY = cachedir
+    print('\nReading a controlled vocabulary of 20,000 lines:\n')
+    try:
+        filetags.options.no_cache = True
+        parsed = measure('parsing without cache', filetags.read_controlled_vocabulary, vocabulary_filename)
+        filetags.options.no_cache = False
+        measure('parsing and writing the cache', filetags.read_controlled_vocabulary, vocabulary_filename)
+        cached = measure('reading the cache', filetags.read_controlled_vocabulary, vocabulary_filename)
+        assert cached == parsed
+    finally:
+        filetags.CACHE_DIRECTORY = original_cache_directory
+        rmtree(cachedir)
+
+
+def benchmark_filter():
+
+    files = ['2018-03-18 file %05i -- tag%i tag%i.txt' % (number, number % 13, number % 1009)
+             for number in range(NUMBER_OF_DIRECTORIES * FILES_PER_DIRECTORY)]
+    queries = [['tag%i' % (number % 13), 'tag%i' % (number % 1009)] for number in range(100)]
+
+    print('\nFiltering %i file names with %i queries for a frequent and a rare tag:\n' % (len(files), len(queries)))
+
+    def parse_each_file_per_query():
+        return [[x for x in files if set(filetags.extract_tags_from_filename(x)).issuperset(set(query))]
+                for query in queries]
+
+    def intersect_posting_lists():
+        inverted_tag_index = filetags.build_inverted_tag_index(files)
+        return [filetags.filter_files_matching_tags(files, query, inverted_tag_index) for query in queries]
+
+    filetags.options.parse_cache_size = 0
+    parsed = measure('parsing each file name per query', parse_each_file_per_query)
+    filetags.options.parse_cache_size = filetags.DEFAULT_PARSE_CACHE_SIZE
+    filetags.parse_cache_statistics.update(hits=0, misses=0)
+    cached = measure('... with --parse-cache-size %i' % filetags.DEFAULT_PARSE_CACHE_SIZE, parse_each_file_per_query)
+    print('  {:<45s} {:>9,d} hits / {:,d} misses'.format('', filetags.parse_cache_statistics['hits'],
+                                                           filetags.parse_cache_statistics['misses']))
+    assert parsed == cached
+    intersected = measure('inverted tag index built once', intersect_posting_lists)
+    assert parsed == intersected
+
+
+def benchmark_tagtrees(tempdir):
+
+    directory = os.path.join(tempdir, sorted(os.listdir(tempdir))[0])
+    tagtrees = os.path.join(tempfile.mkdtemp(prefix='filetags_benchmark_tagtrees_'), 'tagtrees')
+    print('\nTagtrees of depth 3 for the %i files of one directory after re-tagging three files:\n' %
+          len(os.listdir(directory)))
+
+    def generate_tagtrees():
+        filetags.cache_of_inverted_tag_index = {}
+        filetags.generate_tagtrees(tagtrees, 3, False, False, False)
+
+    def retag_three_files():
+        for filename in sorted(os.listdir(directory))[:3]:
+            if ' -- ' in filename:
+                os.rename(os.path.join(directory, filename), os.path.join(directory, filename.replace(' -- ', ' -- new ')))
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    filetags.options.recursive = False
+    filetags.options.overwrite = True
+    try:
+        generate_tagtrees()
+        retag_three_files()
+        measure('re-creating tagtrees from scratch', generate_tagtrees)
+        for jobs in [4, 16]:
+            filetags.options.jobs = jobs
+            measure('re-creating tagtrees with --jobs %i' % jobs, generate_tagtrees)
+        filetags.options.jobs = filetags.DEFAULT_JOBS
+        for ordering in filetags.TAGTREES_ORDERINGS[1:]:
+            filetags.options.tagtrees_ordering = ordering
+            measure('re-creating tagtrees, ordering %s' % ordering, generate_tagtrees)
+        filetags.options.tagtrees_ordering = filetags.TAGTREES_ORDERINGS[0]
+        filetags.options.tagtrees_min_files = 5
+        measure('re-creating tagtrees, min-files 5', generate_tagtrees)
+        filetags.options.tagtrees_min_files = 1
+        filetags.options.tagtrees_incremental = True
+        generate_tagtrees()  # writes the manifest
+        retag_three_files()
+        measure('--tagtrees-incremental', generate_tagtrees)
+    finally:
+        filetags.options.tagtrees_incremental = False
+        filetags.options.overwrite = False
+        os.chdir(cwd)
+        rmtree(os.path.dirname(tagtrees))
+
+
+def benchmark_daemon(tempdir):
+
+    directory = os.path.join(tempdir, sorted(os.listdir(tempdir))[1])
+    filename = os.path.join(directory, sorted(x for x in os.listdir(directory) if not x.startswith('link'))[0])
+    socket_filename = os.path.join(tempfile.mkdtemp(prefix='filetags_benchmark_daemon_'), 'daemon.socket')
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    client = os.path.join(package, 'bin', 'filetags_client.py')
+    repetitions = 10
+    print('\nAdding and removing a tag %i times, listing the tags of a directory of %i files %i times:\n' %
+          (repetitions, len(os.listdir(directory)), repetitions))
+
+    def run(*commands):
+        for number in range(repetitions):
+            for command in commands:
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    filename_with_tag = os.path.join(directory, str(filetags.TaggedFileName.parse(os.path.basename(filename)).with_tag_added('daemon')))
+    command = [sys.executable, os.path.join(package, 'filetags', '__init__.py')]
+    daemon = threading.Thread(target=filetags.serve_daemon, args=(socket_filename,))
+    daemon.start()
+    filetags.options.quiet = True
+    try:
+        while not os.path.exists(socket_filename):
+            time.sleep(0.01)
+        measure('filetags processes', run,
+                command + ['-t', 'daemon', filename], command + ['--tags=-daemon', filename_with_tag])
+        measure('filetags_client.py processes', run,
+                [sys.executable, client, '--socket', socket_filename, 'tag', '-t', 'daemon', filename],
+                [sys.executable, client, '--socket', socket_filename, 'tag', '--tags=-daemon', filename_with_tag])
+        os.chdir(directory)
+        measure('filetags --ln processes', run, command + ['--ln'])
+        measure('filetags_client.py list processes', run, [sys.executable, client, '--socket', socket_filename, 'list'])
+    finally:
+        subprocess.run([sys.executable, client, '--socket', socket_filename, 'stop'], stdout=subprocess.DEVNULL)
+        daemon.join()
+        filetags.options.quiet = False
+        rmtree(os.path.dirname(socket_filename))
+
+
+def benchmark_startup(tempdir):
+
+    directory = os.path.join(tempdir, sorted(os.listdir(tempdir))[2])
+    filename = sorted(x for x in os.listdir(directory) if not x.startswith('link'))[0]
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=package)
+    repetitions = 10
+    print('\nStart-up time, mean of %i runs:\n' % repetitions)
+
+    # -X importtime reports microseconds on stderr; the last line is the top-level module:
+    importtime = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import filetags'], env=environment,
+                                stderr=subprocess.PIPE, check=True).stderr.decode().strip().split('\n')
+    slowest = sorted((int(x.split('|')[1]), x.split('|')[2].strip()) for x in importtime[1:])[-6:-1]
+    print('  {:<45s} {:>7.3f}s   (slowest: {})'.format('import filetags', int(importtime[-1].split('|')[1]) / 1e6,
+                                                     ', '.join('%s %.3fs' % (name, micros / 1e6) for micros, name in reversed(slowest))))
+
+    def wall_clock(description, arguments):
+        start = time.time()
+        for number in range(repetitions):
+            subprocess.run([sys.executable] + arguments, env=environment, cwd=directory, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print('  {:<45s} {:>7.3f}s'.format(description, (time.time() - start) / repetitions))
+
+    wall_clock('python -c pass', ['-c', 'pass'])
+    wall_clock('filetags/__init__.py --version', [os.path.join(package, 'filetags', '__init__.py'), '--version'])
+    wall_clock('python -m filetags --version', ['-m', 'filetags', '--version'])
+    wall_clock('python -m filetags --dryrun --tags new FILE', ['-m', 'filetags', '--dryrun', '--tags', 'new', filename])
+    wall_clock('python -m filetags --ln', ['-m', 'filetags', '--ln'])
+
+
+def main():
+
+    tempdir = create_test_hierarchy()
+    try:
+        benchmark_startup(tempdir)
+        benchmark_scanner(tempdir)
+        benchmark_split_up_filename(tempdir)
+        benchmark_path_tags(tempdir)
+        benchmark_file_catalog(tempdir)
+        benchmark_tag_matrix(tempdir)
+        benchmark_tag_matrix_scaling()
+        benchmark_suggestions(tempdir)
+        benchmark_similar_tags()
+        benchmark_similar_tags_cache()
+        benchmark_vocabulary_cache()
+        benchmark_filter()
+        benchmark_tagtrees(tempdir)
+        benchmark_daemon(tempdir)
+    finally:
+        rmtree(tempdir)
+    print('')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,14 @@
 # ~/src/vktag % PYTHONPATH="~/src/filetags:" tests/unit_tests.py --verbose
 
 import unittest
+import itertools
+import difflib
+import random
+import importlib.util  # for loading bin/filetags_client.py
+import threading
+import subprocess
+import json
+import sys
 import os
 import filetags
 import tempfile
@@ -78,8 +86,109 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(filetags.adding_tag_to_filename('Some file name -- foo.jpeg.lnk', 'foo'),
                          'Some file name -- foo.jpeg.lnk')
 
+    def test_parse_cache(self):
+
+        filetags.cache_of_parsed_basenames.clear()
+        filetags.parse_cache_statistics.update(hits=0, misses=0)
+        filetags.options.parse_cache_size = 2
+        try:
+            name = filetags.TaggedFileName.parse('a -- foo.jpeg')
+            self.assertIs(filetags.TaggedFileName.parse('a -- foo.jpeg'), name)
+            self.assertEqual(filetags.extract_tags_from_filename('/some/path/a -- foo.jpeg'), ['foo'])
+            self.assertEqual(filetags.parse_cache_statistics, {'hits': 2, 'misses': 1})
+
+            # the least recently used basename gets evicted:
+            filetags.TaggedFileName.parse('b -- bar.jpeg')
+            filetags.TaggedFileName.parse('a -- foo.jpeg')
+            filetags.TaggedFileName.parse('c -- baz.jpeg')
+            self.assertEqual(list(filetags.cache_of_parsed_basenames.keys()), ['a -- foo.jpeg', 'c -- baz.jpeg'])
+
+            filetags.options.parse_cache_size = 0
+            filetags.cache_of_parsed_basenames.clear()
+            self.assertEqual(filetags.contains_tag('d -- foo.jpeg', 'foo'), True)
+            self.assertEqual(len(filetags.cache_of_parsed_basenames), 0)
+        finally:
+            filetags.options.parse_cache_size = filetags.DEFAULT_PARSE_CACHE_SIZE
+            filetags.cache_of_parsed_basenames.clear()
+
+    def test_parse_controlled_vocabulary(self):
+
+        self.assertEqual(filetags.parse_controlled_vocabulary(['foo\n', '# comment\n', 'draft final # comment\n',
+                                                               '#donotsuggest Bar baz\n', '\n']),
+                         (['foo', 'draft', 'final'], [['draft', 'final']], ['bar', 'baz']))
+        self.assertEqual(filetags.parse_controlled_vocabulary([]), ([], [], []))
+
+    def test_import_does_not_parse_the_command_line(self):
+
+        # importing must neither fail on foreign arguments nor ask the terminal for its size:
+        output = subprocess.check_output([sys.executable, '-c',
+                                          'import sys; sys.argv = ["indexer", "--unknown-option"]; ' +
+                                          'import filetags; print(filetags.options.files, filetags.TTY_WIDTH)'],
+                                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(filetags.__file__))))
+        self.assertEqual(output.decode().strip(), '[] 80')
+
+    def test_modules_for_some_features_are_imported_on_demand(self):
+
+        package_directory = os.path.dirname(os.path.dirname(os.path.abspath(filetags.__file__)))
+        output = subprocess.check_output([sys.executable, '-c',
+                                          'import sys; import filetags; ' +
+                                          'print(sorted(set(["readline", "difflib", "colorama", "clint", "platform"]) & set(sys.modules)))'],
+                                         cwd=package_directory)
+        self.assertEqual(output.decode().strip(), '[]')
+
+        self.assertEqual(subprocess.check_output([sys.executable, os.path.abspath(filetags.__file__), '--version'],
+                                                 cwd=package_directory).decode(),
+                         '__init__.py version ' + filetags.PROG_VERSION_DATE + '\n')
+
+    def test_split_up_filename_pure(self):
+
+        self.assertEqual(filetags.split_up_filename_pure('Some file name -- foo.jpeg'),
+                         ('Some file name -- foo.jpeg', '', 'Some file name -- foo.jpeg', 'Some file name -- foo.jpeg'))
+        self.assertEqual(filetags.split_up_filename_pure(os.path.join('dir', 'Some file -- foo.jpeg.lnk')),
+                         (os.path.join('dir', 'Some file -- foo.jpeg.lnk'), 'dir',
+                          'Some file -- foo.jpeg.lnk', 'Some file -- foo.jpeg'))
+
+        # existing files get resolved to a normalized absolute path only by split_up_filename():
+        testdir = os.path.dirname(os.path.abspath(__file__))
+        filename = os.path.join(testdir, os.pardir, os.path.basename(testdir), os.path.basename(__file__))
+        self.assertEqual(filetags.split_up_filename_pure(filename)[1], os.path.dirname(filename))
+        self.assertEqual(filetags.split_up_filename(filename)[1], testdir)
+
+    def test_tagged_file_name(self):
+
+        for basename in ['Some file name.jpeg', 'Some file name -- foo bar.jpeg', 'Some file name -- foo',
+                         'Some file name', 'my.file -- foo', 'Some file name -- foo.jpeg.lnk', 'archive.tar.gz',
+                         '2018-03-18 a -- b.tar.gz', '.hidden']:
+            self.assertEqual(str(filetags.TaggedFileName.parse(basename)), basename)
+
+        name = filetags.TaggedFileName.parse('Some file name -- foo bar.jpeg.lnk')
+        self.assertEqual((name.stem, name.tags, name.extension, name.is_lnk),
+                         ('Some file name', ('foo', 'bar'), 'jpeg', True))
+        with self.assertRaises(AttributeError):
+            name.tags = ('baz',)
+
+        self.assertEqual(str(name.with_tag_added('baz')), 'Some file name -- foo bar baz.jpeg.lnk')
+        self.assertIs(name.with_tag_added('foo'), name)
+        self.assertEqual(str(name.with_tag_removed('foo').with_tag_removed('bar')), 'Some file name.jpeg.lnk')
+        self.assertEqual(str(name.with_tag_replaced('foo', 'new')), 'Some file name -- new bar.jpeg.lnk')
+        self.assertEqual(str(name.with_tag_replaced('foo', 'bar')), 'Some file name -- bar.jpeg.lnk')
+        self.assertEqual(name.with_tag_added('baz').with_tag_removed('baz'), name)
+
+        # dots within the name of a file without extension are no extension:
+        self.assertEqual(filetags.adding_tag_to_filename('my.file -- foo', 'bar'), 'my.file -- foo bar')
+        # extensions which are no words stay at the end:
+        self.assertEqual(filetags.adding_tag_to_filename('x -- a.tar-gz', 'b'), 'x -- a b.tar-gz')
+        self.assertEqual(filetags.adding_tag_to_filename('x -- a.tar-gz.lnk', 'b'), 'x -- a b.tar-gz.lnk')
+        self.assertEqual(filetags.adding_tag_to_filename('x.tar-gz', 'b'), 'x -- b.tar-gz')
+
     def test_removing_tag_from_filename(self):
 
+        # the basename is returned when a tag was removed:
+        self.assertEqual(filetags.removing_tag_from_filename(os.path.join('/tmp', 'd', 'x -- a b.txt'), 'a'),
+                         'x -- b.txt')
+        self.assertEqual(filetags.removing_tag_from_filename(os.path.join('/tmp', 'd', 'x -- a b.txt'), 'c'),
+                         os.path.join('/tmp', 'd', 'x -- a b.txt'))
+
         self.assertEqual(filetags.removing_tag_from_filename('Some file name -- bar.jpeg', 'bar'),
                          'Some file name.jpeg')
         self.assertEqual(filetags.removing_tag_from_filename('Some file name -- foo bar.jpeg', 'bar'),
@@ -134,6 +243,116 @@ class TestMethods(unittest.TestCase):
                                                                 'Schneewittchen']),
                          ['impson', 'Simson', 'Simpso', 'simpson', 'mpson', 'sumpson'])
 
+        # callers comparing many tags compute the set of tags once:
+        tags = filetags.update_similar_tags_cache(['Simpson', 'Simson', 'Frankenstein'])
+        self.assertEqual(tags, frozenset(['Simpson', 'Simson', 'Frankenstein']))
+        self.assertEqual(filetags.find_similar_tags('Simpson', tags), ['Simson'])
+        self.assertEqual(filetags.find_similar_tags('simpson', tags), ['Simpson', 'Simson'])
+
+    def test_tag_similarity_index(self):
+
+        tags = ['abc', 'aXbXc', 'ab', 'aXb', 'abcd', 'aXbXcXd', 'Simpson', 'Simson', 'simpson', 'mpson', 'x', 'xy',
+                'yx', '', 'tag1', 'tag2', 'tag10', 'tags', 'gat', 'ttaagg', 'Frankenstein', 'Schneewittchen']
+        index = filetags.TagSimilarityIndex(tags)
+        for tag in tags + ['Simpsons', 'unknown', 'a']:
+            self.assertEqual(index.find_similar_tags(tag),
+                             [x for x in difflib.get_close_matches(tag, tags, n=999, cutoff=0.7) if x != tag])
+
+        # similar tags without any bigram in common apart from the first and the last character:
+        self.assertEqual(index.find_similar_tags('abc'), ['abcd', 'ab', 'aXbXc'])
+
+    def test_find_similar_tags_of_many_in_parallel(self):
+
+        letters = random.Random(42)
+        tags = [''.join(letters.choice('abcdefghijklmnopqrstuvwxyz') for number in range(8))
+                for x in range(2 * filetags.SIMILAR_TAGS_PER_CHUNK)] + ['Simpson', 'Simson']
+        sequential = filetags.TagSimilarityIndex(tags).find_similar_tags_of_many(tags, jobs=1)
+        parallel = filetags.TagSimilarityIndex(tags).find_similar_tags_of_many(tags, jobs=2)
+        self.assertEqual(list(parallel.items()), list(sequential.items()))
+        self.assertEqual(parallel['Simpson'], ['Simson'])
+
+    def test_similar_tags_cache(self):
+
+        cachedir = tempfile.mkdtemp()
+        filename = os.path.join(cachedir, 'subdir', filetags.SIMILAR_TAGS_CACHE_FILENAME)
+        tags = ['Simpson', 'Simson', 'simpson', 'mpson', 'Frankenstein', 'tag1', 'tag2']
+        changed_tags = ['Simpson', 'Simpsons', 'simpson', 'mpson', 'Frankenstein', 'tag1', 'tag3']
+        try:
+            cache = filetags.SimilarTagsCache(filename)
+            cache.update(tags)
+            cache.save()
+
+            cache = filetags.SimilarTagsCache(filename)
+            self.assertEqual(set(cache.matches.keys()), set(tags))
+            self.assertFalse(cache.modified)
+            cache.update(changed_tags)
+            for tag in changed_tags:
+                self.assertEqual(cache.find_similar_tags(tag, frozenset(changed_tags)),
+                                 [x for x in difflib.get_close_matches(tag, changed_tags, n=999, cutoff=0.7) if x != tag])
+            cache.save()
+
+            # tags of other runs are kept:
+            cache = filetags.SimilarTagsCache(filename)
+            self.assertEqual(set(cache.matches.keys()), set(tags + changed_tags))
+            self.assertFalse(cache.modified)
+
+            # beyond the size, the least recently used tags are dropped:
+            cache = filetags.SimilarTagsCache(filename, size=3)
+            for tag in cache.last_used:
+                cache.last_used[tag] -= 1
+            cache.update(['Simpsons', 'simpson', 'tag2'])
+            cache.save()
+            cache = filetags.SimilarTagsCache(filename)
+            self.assertEqual(set(cache.matches.keys()), set(['Simpsons', 'simpson', 'tag2']))
+            self.assertEqual(cache.find_similar_tags('simpson', frozenset(['Simpsons', 'Simpson'])), ['Simpsons'])
+        finally:
+            rmtree(cachedir)
+
+    def test_vocabulary_cache(self):
+
+        tempdir = tempfile.mkdtemp()
+        original_cache_directory = filetags.CACHE_DIRECTORY
+        filetags.CACHE_DIRECTORY = os.path.join(tempdir, 'cache')
+        vocabulary_filename = os.path.join(tempdir, '.filetags')
+        try:
+            with open(vocabulary_filename, 'w') as outputhandle:
+                outputhandle.write('foo\ndraft final\n#donotsuggest bar\n')
+            expected = (['foo', 'draft', 'final'], [['draft', 'final']], ['bar'])
+            self.assertEqual(filetags.read_controlled_vocabulary(vocabulary_filename), expected)
+            cache_filename = filetags.get_vocabulary_cache_filename(vocabulary_filename)
+            self.assertTrue(os.path.isfile(cache_filename))
+
+            # an unchanged vocabulary is not parsed again:
+            with open(cache_filename) as inputhandle:
+                content = json.load(inputhandle)
+            content['tags'] = ['from_cache']
+            with open(cache_filename, 'w') as outputhandle:
+                json.dump(content, outputhandle)
+            self.assertEqual(filetags.read_controlled_vocabulary(vocabulary_filename)[0], ['from_cache'])
+
+            # unless the cache is disabled:
+            filetags.options.no_cache = True
+            self.assertEqual(filetags.read_controlled_vocabulary(vocabulary_filename), expected)
+            filetags.options.no_cache = False
+
+            # a modified vocabulary replaces the cache:
+            with open(vocabulary_filename, 'a') as outputhandle:
+                outputhandle.write('baz\n')
+            self.assertEqual(filetags.read_controlled_vocabulary(vocabulary_filename)[0],
+                             ['foo', 'draft', 'final', 'baz'])
+            self.assertEqual(filetags.read_controlled_vocabulary(vocabulary_filename)[0],
+                             ['foo', 'draft', 'final', 'baz'])
+
+            # a broken cache is ignored:
+            with open(cache_filename, 'w') as outputhandle:
+                outputhandle.write('{"version": ')
+            self.assertEqual(filetags.read_controlled_vocabulary(vocabulary_filename)[0],
+                             ['foo', 'draft', 'final', 'baz'])
+        finally:
+            filetags.options.no_cache = False
+            filetags.CACHE_DIRECTORY = original_cache_directory
+            rmtree(tempdir)
+
     def test_check_for_possible_shortcuts_in_entered_tags(self):
 
         self.assertEqual(filetags.check_for_possible_shortcuts_in_entered_tags(['bar'],
@@ -207,6 +426,65 @@ class TestMethods(unittest.TestCase):
                                                                      'file4 -- common foo bar jodel.txt.lnk'])),
                             set(['common', 'foo']))
 
+    def test_filter_files_matching_tags(self):
+
+        files = ['file1 -- foo bar.txt', 'file2.txt', 'file3 -- bar.txt', 'file4 -- baz foo bar.txt', 'file5 -- foo']
+        self.assertEqual(filetags.filter_files_matching_tags(files, []), files)
+        self.assertEqual(filetags.filter_files_matching_tags(files, ['unknown']), [])
+        self.assertEqual(filetags.filter_files_matching_tags(files, ['foo']),
+                         ['file1 -- foo bar.txt', 'file4 -- baz foo bar.txt', 'file5 -- foo'])
+        self.assertEqual(filetags.filter_files_matching_tags(files, ['bar', 'foo']),
+                         ['file1 -- foo bar.txt', 'file4 -- baz foo bar.txt'])
+        self.assertEqual(filetags.filter_files_matching_tags(files, ['foo', 'baz', 'bar']),
+                         ['file4 -- baz foo bar.txt'])
+        self.assertEqual(filetags.filter_files_matching_tags(files, ['foo', 'unknown']), [])
+
+        # the same results with a pre-built inverted index:
+        inverted_tag_index = filetags.build_inverted_tag_index(files)
+        self.assertEqual(inverted_tag_index['bar'], set([0, 2, 3]))
+        self.assertEqual(filetags.filter_files_matching_tags(files, ['bar', 'foo'], inverted_tag_index),
+                         ['file1 -- foo bar.txt', 'file4 -- baz foo bar.txt'])
+
+    def test_parse_tag_query(self):
+
+        self.assertEqual(filetags.parse_tag_query('foo'), ('tag', 'foo'))
+        self.assertEqual(filetags.parse_tag_query('foo bar'), ('and', [('tag', 'foo'), ('tag', 'bar')]))
+        self.assertEqual(filetags.parse_tag_query('foo AND bar'), filetags.parse_tag_query('foo bar'))
+        self.assertEqual(filetags.parse_tag_query('-foo'), ('not', ('tag', 'foo')))
+        self.assertEqual(filetags.parse_tag_query('NOT foo'), ('not', ('tag', 'foo')))
+        self.assertEqual(filetags.parse_tag_query('car (red OR blue) -draft'),
+                         ('and', [('tag', 'car'),
+                                  ('or', [('tag', 'red'), ('tag', 'blue')]),
+                                  ('not', ('tag', 'draft'))]))
+        # AND binds stronger than OR:
+        self.assertEqual(filetags.parse_tag_query('a b OR c'),
+                         ('or', [('and', [('tag', 'a'), ('tag', 'b')]), ('tag', 'c')]))
+        # lower-case operators are tags; dashes within tags are no negation:
+        self.assertEqual(filetags.parse_tag_query('or x-y'), ('and', [('tag', 'or'), ('tag', 'x-y')]))
+
+        for invalid_query in ['', '  ', '(foo', 'foo)', 'foo OR', 'AND foo', '()', 'NOT', '-', 'foo (OR bar)']:
+            with self.assertRaises(ValueError):
+                filetags.parse_tag_query(invalid_query)
+
+    def test_filter_files_matching_tag_query(self):
+
+        files = ['p1 -- car red.jpg', 'p2 -- car blue draft.jpg', 'p3 -- car blue.jpg', 'p4 -- bike red.jpg', 'p5.jpg']
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, 'car'), files[:3])
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, 'car (red OR blue) -draft'),
+                         ['p1 -- car red.jpg', 'p3 -- car blue.jpg'])
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, 'red OR draft'),
+                         ['p1 -- car red.jpg', 'p2 -- car blue draft.jpg', 'p4 -- bike red.jpg'])
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, 'NOT car'),
+                         ['p4 -- bike red.jpg', 'p5.jpg'])
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, 'bike OR NOT (red OR blue)'),
+                         ['p4 -- bike red.jpg', 'p5.jpg'])
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, 'car unknown'), [])
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, '-unknown'), files)
+
+        # a plain list of tags gives the same result as filter_files_matching_tags():
+        self.assertEqual(filetags.filter_files_matching_tag_query(files, 'blue car'),
+                         filetags.filter_files_matching_tags(files, ['blue', 'car']))
+
     def test_extract_tags_from_path(self):
         self.assertEqual(set(filetags.extract_tags_from_path('/a/path/without/tags')), set([]))
         self.assertEqual(set(filetags.extract_tags_from_path('/path -- ptag1/with -- ptag1 ptag2/tags')),
@@ -214,6 +492,61 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(set(filetags.extract_tags_from_path('/path -- ptag1/with -- ptag1 ptag2/tags -- ftag1')),
                          set(['ptag1', 'ptag2', 'ftag1']))
 
+    def test_get_path_tags_of_directory(self):
+
+        filetags.cache_of_path_tags.clear()
+        self.assertEqual(filetags.get_path_tags_of_directory(os.path.abspath('/path -- ptag1/with -- ptag2 ptag1')),
+                         ('ptag1', 'ptag2'))
+        self.assertIn(os.path.abspath('/path -- ptag1'), filetags.cache_of_path_tags)
+
+        # files inherit the cached tags of their directories:
+        self.assertEqual(filetags.extract_tags_from_path('/path -- ptag1/with -- ptag2 ptag1/file -- ftag1 ptag2'),
+                         ['ptag1', 'ptag2', 'ftag1'])
+        self.assertEqual(filetags.extract_tags_from_path('/path -- ptag1/with -- ptag2 ptag1/'), ['ptag1', 'ptag2'])
+        self.assertEqual(filetags.get_path_tags_of_directory(os.path.abspath('/')), ())
+
+    def test_file_catalog(self):
+
+        catalog = filetags.FileCatalog()
+        directory = catalog.add_directory('/this/is -- tag1/the -- tag3/path')
+        self.assertEqual(catalog.add_directory('/this/is -- tag1/the -- tag3/path'), directory)
+        catalog.append(directory, '2018-03-18 this is a file name -- tag1 tag2.txt', ['tag1', 'tag2'], 1521331200.0)
+        catalog.append(directory, 'no tags.txt', [], 0.0)
+
+        self.assertEqual(len(catalog), 2)
+        self.assertEqual(catalog.tag_names, ['tag1', 'tag2'])
+        self.assertEqual(dict(catalog[0]), {
+            'filename': '2018-03-18 this is a file name -- tag1 tag2.txt',
+            'filetags': ['tag1', 'tag2'],
+            'path': '/this/is -- tag1/the -- tag3/path',
+            'alltags': ['tag1', 'tag3', 'tag2'],
+            'ctime': time.localtime(1521331200.0),
+            'datestamp': ['2018', '03', '18']})
+        self.assertEqual(catalog[-1]['filetags'], [])
+        self.assertEqual([x['filename'] for x in catalog[1:]], ['no tags.txt'])
+        with self.assertRaises(TypeError):
+            catalog[0]['filetags'] = []
+        with self.assertRaises(IndexError):
+            catalog[2]
+
+    def test_tag_matrix(self):
+
+        rows = [['a', 'b'], ['b', 'c'], [], ['c', 'b', 'd'], ['e']]
+        for use_numpy in [False, True]:
+            if use_numpy and not filetags.import_numpy():
+                continue
+            matrix = filetags.TagMatrix(rows, use_numpy=use_numpy)
+            self.assertEqual(matrix.number_of_files, 5)
+            self.assertEqual(matrix.counts(), {'a': 1, 'b': 3, 'c': 2, 'd': 1, 'e': 1})
+            self.assertEqual(matrix.top(3), [('b', 3), ('c', 2), ('a', 1)])
+            self.assertEqual(matrix.count_files_with_any(['a', 'c']), 3)
+            self.assertEqual(matrix.count_files_with_any(['unknown']), 0)
+            self.assertEqual(matrix.count_files_without_tags(), 1)
+            self.assertEqual(matrix.cooccurrence(['b']), {'a': 1, 'c': 2, 'd': 1})
+            self.assertEqual(matrix.cooccurrence(['b', 'c']), {'d': 1})
+            self.assertEqual(matrix.cooccurrence(['unknown']), {})
+            self.assertEqual(filetags.TagMatrix([['a', 'a'], ['a']], use_numpy=use_numpy).counts(), {'a': 2})
+
     def test_extract_iso_datestamp_from_filename(self):
         self.assertEqual(filetags.extract_iso_datestamp_from_filename(''), [])
         self.assertEqual(filetags.extract_iso_datestamp_from_filename('foo'), [])
@@ -734,6 +1067,52 @@ class TestHierarchyWithFilesAndFolders(unittest.TestCase):
 
         # FIXXME: write test which tests the cache
 
+    def test_scan_directory_tree(self):
+
+        scanned = [(dirpath, sorted(x.name for x in subdirs), sorted(x.name for x in files))
+                   for dirpath, subdirs, files in filetags.scan_directory_tree(self.tempdir)]
+        self.assertEqual(len(scanned), 3)
+        self.assertEqual(scanned[0], (self.tempdir, ['sub dir 1', 'sub dir 2'],
+                                      ['foo1 -- bar.txt', 'foo2 -- bar baz.txt', 'foo3 -- baz teststring1.txt']))
+        self.assertEqual(set(x[0] for x in scanned[1:]), set([self.subdir1, self.subdir2]))
+
+        # non-recursive: only the start directory
+        self.assertEqual(len(list(filetags.scan_directory_tree(self.tempdir, recursive=False))), 1)
+
+        if platform.system() != 'Windows':
+            # links to directories are listed but not followed:
+            os.symlink(self.subdir1, os.path.join(self.tempdir, 'link to sub dir 1'))
+            scanned = list(filetags.scan_directory_tree(self.tempdir))
+            self.assertEqual(len(scanned), 3)
+            self.assertIn('link to sub dir 1', [x.name for x in scanned[0][1]])
+
+    def test_scan_directory_tree_in_parallel(self):
+
+        os.makedirs(os.path.join(self.subdir1, 'sub sub dir a'))
+        os.makedirs(os.path.join(self.subdir1, 'sub sub dir b'))
+        os.makedirs(os.path.join(self.subdir2, 'sub sub dir c'))
+
+        def scan(jobs):
+            return [(dirpath, [x.name for x in subdirs], [x.name for x in files])
+                    for dirpath, subdirs, files in filetags.scan_directory_tree(self.tempdir, jobs=jobs)]
+
+        sequential = scan(1)
+        self.assertEqual(len(sequential), 6)
+        self.assertEqual([x[0] for x in sequential],
+                         [self.tempdir,
+                          self.subdir1,
+                          os.path.join(self.subdir1, 'sub sub dir a'),
+                          os.path.join(self.subdir1, 'sub sub dir b'),
+                          self.subdir2,
+                          os.path.join(self.subdir2, 'sub sub dir c')])
+        for jobs in [2, 4, 16]:
+            self.assertEqual(scan(jobs), sequential)
+
+        # stopping early does not block:
+        generator = filetags.scan_directory_tree(self.tempdir, jobs=4)
+        self.assertEqual(next(generator)[0], self.tempdir)
+        generator.close()
+
     def test_list_unknown_tags(self):
 
         print("FIXXME: test_list_unknown_tags() not implemented yet")
@@ -826,6 +1205,261 @@ class TestHierarchyWithFilesAndFolders(unittest.TestCase):
         self.assertTrue(os.path.isdir(os.path.join(self.subdir2, 'nontagged_items')))
 
 
+    def test_tagtrees_with_tagfilter_query(self):
+
+        filetags.generate_tagtrees(directory=self.subdir2,
+                                   maxdepth=5,
+                                   ignore_nontagged=True,
+                                   nontagged_subdir=False,
+                                   link_missing_mutual_tagged_items=False,
+                                   filtertags=['bar', 'OR', 'teststring1', '-baz'])
+
+        self.assertEqual(set(os.listdir(self.subdir2)), set(['bar', 'baz']))
+        self.assertEqual(set(os.listdir(os.path.join(self.subdir2, 'bar'))),
+                         set(['baz', 'foo1 -- bar.txt', 'foo2 -- bar baz.txt']))
+
+    def get_tree(self, directory):
+        "Returns a set of all relative paths below directory; links with their targets which have to resolve"
+
+        tree = set()
+        for root, dirs, files in os.walk(directory):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    # comparing trees of the same planning would not notice broken links:
+                    self.assertTrue(os.path.exists(path), 'broken link ' + path)
+                    if os.path.isfile(path):
+                        self.assertEqual(os.path.basename(os.path.realpath(path)), name)
+                    tree.add((os.path.relpath(path, directory), os.readlink(path)))
+                else:
+                    tree.add(os.path.relpath(path, directory))
+        return tree
+
+    def generate_tagtrees(self, directory):
+
+        filetags.cache_of_inverted_tag_index = {}  # files get renamed between the runs
+        filetags.generate_tagtrees(directory=directory,
+                                   maxdepth=2,
+                                   ignore_nontagged=False,
+                                   nontagged_subdir='nontagged_items',
+                                   link_missing_mutual_tagged_items=False)
+
+    def test_tagtrees_links_resolve_to_their_files(self):
+
+        tagtrees = tempfile.mkdtemp()
+        try:
+            self.generate_tagtrees(tagtrees)
+            links = [os.path.join(root, name) for root, dirs, files in os.walk(tagtrees) for name in files]
+            self.assertEqual(len([x for x in links if os.path.basename(x) == 'foo2 -- bar baz.txt']), 4)
+            for link in links:
+                self.assertTrue(os.path.islink(link))
+                self.assertTrue(os.path.exists(link), link)
+                self.assertEqual(os.path.realpath(link),
+                                 os.path.realpath(os.path.join(self.tempdir, os.path.basename(link))))
+        finally:
+            rmtree(tagtrees)
+
+    def test_plan_tagtrees_orderings(self):
+
+        files = ['/data/foo -- a b c.txt']
+        tags_of_files = [['c', 'a', 'b']]
+
+        directories, links = filetags.plan_tagtrees(files, tags_of_files, 3, True, False, False, 'permutations')
+        self.assertEqual(len(directories), 3 + 6 + 6)
+        self.assertEqual(len(links), 15)
+
+        directories, links = filetags.plan_tagtrees(files, tags_of_files, 3, True, False, False, 'canonical')
+        self.assertEqual(directories, set(['a', 'b', 'c', os.path.join('a', 'b'), os.path.join('a', 'c'),
+                                           os.path.join('b', 'c'), os.path.join('a', 'b', 'c')]))
+        self.assertEqual(len(links), 7)
+
+        directories, links = filetags.plan_tagtrees(files, tags_of_files, 3, True, False, False, 'canonical-aliases')
+        self.assertEqual(len(directories), 7)
+        self.assertEqual(links[os.path.join('b', 'a')], os.path.join('..', 'a', 'b'))
+        self.assertEqual(links[os.path.join('b', 'c', 'a')], os.path.join('..', '..', 'a', 'b', 'c'))
+        self.assertEqual(links[os.path.join('a', 'c', 'b')], os.path.join('..', '..', 'a', 'b', 'c'))
+        self.assertEqual(len(links), 7 + 3 + 2)
+
+    def test_estimate_tagtrees(self):
+
+        tags_of_files = [['a', 'b', 'c'], [], ['b', 'a'], ['d', 'a', 'c', 'e'], ['a', 'a'], ['c']]
+        files = ['/data/file%i -- x.txt' % number for number in range(len(tags_of_files))]
+
+        for ordering in filetags.TAGTREES_ORDERINGS:
+            for maxdepth in range(1, 6):
+                for ignore_nontagged, nontagged_subdir in [(True, False), (False, False), (False, 'untagged')]:
+                    directories, links = filetags.plan_tagtrees(files, tags_of_files, maxdepth, ignore_nontagged,
+                                                                nontagged_subdir, False, ordering)
+                    self.assertEqual(filetags.estimate_tagtrees(tags_of_files, maxdepth, ignore_nontagged,
+                                                                nontagged_subdir, False, ordering),
+                                     (len(directories), len(links)))
+
+                for min_files in [2, 3]:
+                    frequent_tagsets = filetags.find_frequent_tagsets(tags_of_files, maxdepth, min_files)
+                    directories, links = filetags.plan_tagtrees(files, tags_of_files, maxdepth, True, False, False,
+                                                                ordering, frequent_tagsets)
+                    self.assertEqual(filetags.estimate_tagtrees(tags_of_files, maxdepth, True, False, False,
+                                                                ordering, frequent_tagsets),
+                                     (len(directories), len(links)))
+
+    def test_find_frequent_tagsets(self):
+
+        tags_of_files = [['a', 'b', 'c'], [], ['b', 'a'], ['d', 'a', 'c', 'e'], ['a', 'a'], ['c', 'a', 'b']]
+
+        def brute_force(maxdepth, min_files):
+            counts = {}
+            for tags in tags_of_files:
+                for depth in range(1, maxdepth + 1):
+                    for combination in itertools.combinations(sorted(set(tags)), depth):
+                        counts[combination] = counts.get(combination, 0) + 1
+            return set(x for x in counts if counts[x] >= min_files)
+
+        for maxdepth in range(1, 5):
+            for min_files in range(1, 6):
+                self.assertEqual(filetags.find_frequent_tagsets(tags_of_files, maxdepth, min_files),
+                                 brute_force(maxdepth, min_files))
+        self.assertEqual(filetags.find_frequent_tagsets(tags_of_files, None, 3),
+                         set([('a',), ('b',), ('c',), ('a', 'b'), ('a', 'c')]))
+
+        # directories of single tags are kept, rare combinations are omitted:
+        files = ['/data/file%i -- x.txt' % number for number in range(len(tags_of_files))]
+        directories, links = filetags.plan_tagtrees(files, tags_of_files, 3, True, False, False, 'canonical',
+                                                    filetags.find_frequent_tagsets(tags_of_files, 3, 3))
+        self.assertEqual(directories, set(['a', 'b', 'c', 'd', 'e', os.path.join('a', 'b'), os.path.join('a', 'c')]))
+
+    def test_tagtrees_max_links(self):
+
+        os.makedirs(os.path.join(self.subdir2, 'old tagtrees'))
+        filetags.options.tagtrees_max_links = 5
+        filetags.options.overwrite = True
+        try:
+            with self.assertRaises(SystemExit) as context:
+                self.generate_tagtrees(self.subdir2)
+            self.assertEqual(context.exception.code, 24)
+            # nothing was touched:
+            self.assertEqual(os.listdir(self.subdir2), ['old tagtrees'])
+
+            # depth 1 results in 5 links, depth 2 in 9 links:
+            filetags.options.tagtrees_max_links = 6
+            filetags.options.tagtrees_auto_depth = True
+            self.generate_tagtrees(self.subdir2)
+            self.assertTrue(os.path.isdir(os.path.join(self.subdir2, 'bar')))
+            self.assertFalse(os.path.isdir(os.path.join(self.subdir2, 'bar', 'baz')))
+
+            self.assertEqual(filetags.choose_tagtrees_depth(lambda depth: (0, [10, 20, 30, 30][depth - 1]), None, 100), 3)
+            self.assertEqual(filetags.choose_tagtrees_depth(lambda depth: (0, [10, 20, 30, 30][depth - 1]), 2, 100), 2)
+            self.assertEqual(filetags.choose_tagtrees_depth(lambda depth: (0, [10, 20, 30, 30][depth - 1]), None, 25), 2)
+        finally:
+            filetags.options.tagtrees_max_links = None
+            filetags.options.tagtrees_auto_depth = False
+            filetags.options.overwrite = False
+
+    @unittest.skipIf(platform.system() == 'Windows', "aliases are lnk files on Windows")
+    def test_tagtrees_with_canonical_aliases(self):
+
+        filetags.options.tagtrees_ordering = 'canonical-aliases'
+        try:
+            self.generate_tagtrees(self.subdir2)
+        finally:
+            filetags.options.tagtrees_ordering = filetags.TAGTREES_ORDERINGS[0]
+
+        self.assertTrue(os.path.isdir(os.path.join(self.subdir2, 'bar', 'baz')))
+        self.assertTrue(os.path.islink(os.path.join(self.subdir2, 'baz', 'bar')))
+        self.assertEqual(set(os.listdir(os.path.join(self.subdir2, 'baz', 'bar'))), set(['foo2 -- bar baz.txt']))
+        self.assertEqual(os.path.realpath(os.path.join(self.subdir2, 'teststring1', 'baz')),
+                         os.path.realpath(os.path.join(self.subdir2, 'baz', 'teststring1')))
+        self.assertFalse(os.path.exists(os.path.join(self.subdir2, 'teststring1', 'bar')))
+
+    def test_tagtrees_staged(self):
+
+        regular = os.path.join(self.subdir2, 'regular')
+        staged = os.path.join(self.subdir2, 'staged')
+        self.generate_tagtrees(regular)
+
+        os.makedirs(os.path.join(staged, 'old content'))
+        filetags.options.tagtrees_staged = True
+        try:
+            self.generate_tagtrees(staged)
+        finally:
+            filetags.options.tagtrees_staged = False
+        for thread in filetags.tagtrees_removal_threads:
+            thread.join()
+
+        self.assertEqual(self.get_tree(staged), self.get_tree(regular))
+        self.assertEqual(set(os.listdir(self.subdir2)), set(['regular', 'staged']))
+
+    def test_tagtrees_in_parallel(self):
+
+        sequential = os.path.join(self.subdir2, 'sequential')
+        parallel = os.path.join(self.subdir2, 'parallel')
+
+        self.generate_tagtrees(sequential)
+        filetags.options.jobs = 4
+        try:
+            self.generate_tagtrees(parallel)
+        finally:
+            filetags.options.jobs = filetags.DEFAULT_JOBS
+        self.assertEqual(self.get_tree(parallel), self.get_tree(sequential))
+        self.assertIn(os.path.join('bar', 'baz'), self.get_tree(parallel))
+
+    @unittest.skipIf(platform.system() == 'Windows', "incremental tagtrees of lnk files are not tested")
+    def test_tagtrees_incremental(self):
+
+        full = os.path.join(self.subdir2, 'full')
+        incremental = os.path.join(self.subdir2, 'incremental')
+
+        filetags.options.tagtrees_incremental = True
+        try:
+            self.generate_tagtrees(incremental)
+            self.assertTrue(os.path.isfile(filetags.get_tagtrees_manifest_filename(incremental)))
+            filetags.options.tagtrees_incremental = False
+            self.generate_tagtrees(full)
+            self.assertEqual(self.get_tree(incremental), self.get_tree(full))
+
+            # tagging files results in stale links, missing links and empty directories:
+            os.rename(os.path.join(self.tempdir, 'foo3 -- baz teststring1.txt'),
+                      os.path.join(self.tempdir, 'foo3 -- baz new.txt'))
+            os.rename(os.path.join(self.tempdir, 'foo1 -- bar.txt'), os.path.join(self.tempdir, 'foo1.txt'))
+            rmtree(full)
+            self.generate_tagtrees(full)
+            filetags.options.tagtrees_incremental = True
+            self.generate_tagtrees(incremental)
+            self.assertEqual(self.get_tree(incremental), self.get_tree(full))
+            self.assertFalse(os.path.exists(os.path.join(incremental, 'teststring1')))
+
+            # without a manifest, the tagtrees are created from scratch:
+            os.remove(filetags.get_tagtrees_manifest_filename(incremental))
+            os.rename(os.path.join(self.tempdir, 'foo2 -- bar baz.txt'),
+                      os.path.join(self.tempdir, 'foo2 -- bar.txt'))
+            filetags.options.tagtrees_incremental = False
+            rmtree(full)
+            self.generate_tagtrees(full)
+            filetags.options.tagtrees_incremental = True
+            self.generate_tagtrees(incremental)
+            self.assertEqual(self.get_tree(incremental), self.get_tree(full))
+            self.assertTrue(os.path.isfile(filetags.get_tagtrees_manifest_filename(incremental)))
+        finally:
+            filetags.options.tagtrees_incremental = False
+
+    def test_tagtrees_incremental_without_manifest_keeps_foreign_links(self):
+
+        directory = os.path.join(self.subdir2, 'userdata')
+        os.makedirs(directory)
+        foreign_link = os.path.join(directory, 'my link')
+        os.symlink(os.path.join(self.tempdir, 'foo1 -- bar.txt'), foreign_link)
+
+        filetags.options.tagtrees_incremental = True
+        filetags.options.tagtrees_directory = directory
+        try:
+            with self.assertRaises(SystemExit) as context:
+                self.generate_tagtrees(directory)
+            self.assertEqual(context.exception.code, 13)
+            self.assertTrue(os.path.islink(foreign_link))
+            self.assertFalse(os.path.isfile(filetags.get_tagtrees_manifest_filename(directory)))
+        finally:
+            filetags.options.tagtrees_incremental = False
+            filetags.options.tagtrees_directory = None
+
     def tearDown(self):
 
         if platform.system() != 'Windows':
@@ -834,6 +1468,392 @@ class TestHierarchyWithFilesAndFolders(unittest.TestCase):
             rmtree(self.tempdir)
 
 
+class TestTagIndex(unittest.TestCase):
+
+    tempdir = None
+    subdir1 = None
+
+    def setUp(self):
+        """This setup function creates following dir/file structure:
+
+        tempdir   (via tempfile.mkdtemp())
+          |_ "foo1 -- bar.txt"
+          |_ "2018-03-18 foo2 -- bar baz.txt"
+          |_ sub dir 1 -- ptag/
+               |_ "foo3 -- baz.txt"
+               |_ "foo4.txt"
+        """
+
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        print("\nTestTagIndex: temporary directory: " + self.tempdir)
+
+        self.create_tmp_file(self.tempdir, "foo1 -- bar.txt")
+        self.create_tmp_file(self.tempdir, "2018-03-18 foo2 -- bar baz.txt")
+        self.subdir1 = os.path.join(self.tempdir, "sub dir 1 -- ptag")
+        os.makedirs(self.subdir1)
+        self.create_tmp_file(self.subdir1, "foo3 -- baz.txt")
+        self.create_tmp_file(self.subdir1, "foo4.txt")
+
+        self.connection = filetags.open_tag_index(filetags.get_tag_index_filename(self.tempdir))
+        # the files were just created; see test_recently_modified_directories_are_scanned_again:
+        self.mtime_granularity = filetags.TAG_INDEX_MTIME_GRANULARITY
+        filetags.TAG_INDEX_MTIME_GRANULARITY = 0
+
+    def create_tmp_file(self, directory, name):
+
+        with open(os.path.join(directory, name), 'w') as outputhandle:
+            outputhandle.write('This is a test file for filetags unit testing')
+
+    def test_index_is_located_in_startdir_without_vocabulary(self):
+
+        self.assertEqual(filetags.get_tag_index_filename(self.tempdir),
+                         os.path.join(self.tempdir, filetags.TAG_INDEX_FILENAME))
+
+    def test_incremental_refresh(self):
+
+        # first run scans everything, second run nothing:
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 2)
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 0)
+
+        # renaming a file in the sub-directory only requires re-scanning the sub-directory:
+        os.rename(os.path.join(self.subdir1, "foo4.txt"), os.path.join(self.subdir1, "foo4 -- new.txt"))
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 1)
+        self.assertEqual(filetags.get_files_of_directory_from_tag_index(self.subdir1, recursive=False),
+                         ['foo3 -- baz.txt', 'foo4 -- new.txt'])
+
+        # removing the sub-directory removes its files from the index:
+        rmtree(self.subdir1)
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 1)
+        self.assertEqual(filetags.get_files_of_directory_from_tag_index(self.tempdir, recursive=True),
+                         [os.path.join(self.tempdir, '2018-03-18 foo2 -- bar baz.txt'),
+                          os.path.join(self.tempdir, 'foo1 -- bar.txt')])
+
+    def test_recently_modified_directories_are_scanned_again(self):
+
+        filetags.TAG_INDEX_MTIME_GRANULARITY = 2
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 2)
+        # a rename within the same tick of a coarse timestamp would go unnoticed otherwise:
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 2)
+
+        old = time.time_ns() - 10 * 10**9
+        for directory in [self.tempdir, self.subdir1]:
+            os.utime(directory, ns=(old, old))
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 2)
+        self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 0)
+
+    def test_refresh_in_parallel(self):
+
+        filetags.options.jobs = 4
+        try:
+            self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 2)
+            self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 0)
+            os.rename(os.path.join(self.subdir1, "foo4.txt"), os.path.join(self.subdir1, "foo4 -- new.txt"))
+            self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 1)
+        finally:
+            filetags.options.jobs = 1
+        self.assertEqual(filetags.get_files_of_directory_from_tag_index(self.tempdir, recursive=True),
+                         [os.path.join(self.tempdir, '2018-03-18 foo2 -- bar baz.txt'),
+                          os.path.join(self.tempdir, 'foo1 -- bar.txt'),
+                          os.path.join(self.subdir1, 'foo3 -- baz.txt'),
+                          os.path.join(self.subdir1, 'foo4 -- new.txt')])
+
+    def test_files_from_index_in_order_of_scanner(self):
+
+        # " " sorts before "/": "dir a" has to follow all of "dir/sub" nevertheless
+        for directory in ['dir', os.path.join('dir', 'sub'), 'dir a', 'dir-b']:
+            os.makedirs(os.path.join(self.tempdir, directory))
+            self.create_tmp_file(os.path.join(self.tempdir, directory), 'same -- tag.txt')
+        self.create_tmp_file(os.path.join(self.tempdir, 'dir'), 'z -- tag.txt')
+
+        filetags.options.recursive = True
+        filetags.options.tag_gardening = True  # get_files_with_metadata() is recursive for it
+        try:
+            filetags.options.use_index = False
+            scanned = filetags.get_files_of_directory(self.tempdir)
+            scanned_metadata = [(x['path'], x['filename']) for x in
+                                filetags.get_files_with_metadata(self.tempdir, use_cache=False)]
+            filetags.options.use_index = True
+            self.assertEqual(filetags.get_files_of_directory(self.tempdir), scanned)
+            self.assertEqual([(x['path'], x['filename']) for x in
+                              filetags.get_files_with_metadata_from_tag_index(self.tempdir, recursive=True)],
+                             scanned_metadata)
+        finally:
+            filetags.options.use_index = False
+            filetags.options.recursive = False
+            filetags.options.tag_gardening = False
+        self.assertLess(scanned.index(os.path.join(self.tempdir, 'dir', 'sub', 'same -- tag.txt')),
+                        scanned.index(os.path.join(self.tempdir, 'dir a', 'same -- tag.txt')))
+
+    def test_files_with_metadata_from_index(self):
+
+        files = filetags.get_files_with_metadata_from_tag_index(self.tempdir, recursive=True)
+        self.assertEqual([x['filename'] for x in files],
+                         ['2018-03-18 foo2 -- bar baz.txt', 'foo1 -- bar.txt', 'foo3 -- baz.txt', 'foo4.txt'])
+        self.assertEqual(files[0]['filetags'], ['bar', 'baz'])
+        self.assertEqual(files[0]['datestamp'], ['2018', '03', '18'])
+        self.assertEqual(files[2]['path'], self.subdir1)
+        self.assertEqual(set(files[2]['alltags']), set(['ptag', 'baz']))
+        self.assertEqual(files[3]['filetags'], [])
+
+    def test_tags_from_index_match_file_system(self):
+
+        self.assertEqual(filetags.get_tags_from_tag_index(self.tempdir, recursive=False),
+                         filetags.get_tags_from_files_and_subfolders(self.tempdir, use_cache=False))
+        self.assertEqual(filetags.get_tags_from_tag_index(self.tempdir, recursive=True),
+                         {'bar': 2, 'baz': 2, 'ptag': 1})
+
+    def test_tag_cooccurrences_from_index_match_file_system(self):
+
+        filetags.cache_of_tag_cooccurrences = {}
+        cooccurrences = filetags.get_tag_cooccurrences(self.tempdir)
+        self.assertEqual(cooccurrences, ({'bar': {'bar': 2, 'baz': 1}, 'baz': {'bar': 1, 'baz': 1}, 'ptag': {'ptag': 1}},
+                                         ['bar', 'baz', 'ptag']))
+        self.assertEqual(cooccurrences[0]['bar']['bar'],
+                         filetags.get_tags_from_files_and_subfolders(self.tempdir, use_cache=False)['bar'])
+
+        filetags.cache_of_tag_cooccurrences = {}
+        filetags.options.use_index = True
+        try:
+            self.assertEqual(filetags.get_tag_cooccurrences(self.tempdir), cooccurrences)
+
+            # renaming a file updates the co-occurrences of its directory only:
+            os.rename(os.path.join(self.subdir1, "foo4.txt"), os.path.join(self.subdir1, "foo4 -- baz new.txt"))
+            self.assertEqual(filetags.refresh_tag_index(self.connection, self.tempdir, recursive=True), 1)
+            filetags.cache_of_tag_cooccurrences = {}
+            self.assertEqual(filetags.get_tag_cooccurrences(self.subdir1)[0],
+                             {'baz': {'baz': 2, 'new': 1}, 'new': {'baz': 1, 'new': 1}})
+
+            # the differences of renamed, added and removed names sum up to a fresh count:
+            os.rename(os.path.join(self.tempdir, "foo1 -- bar.txt"), os.path.join(self.tempdir, "foo1 -- baz.txt"))
+            os.remove(os.path.join(self.tempdir, "2018-03-18 foo2 -- bar baz.txt"))
+            self.create_tmp_file(self.tempdir, "foo5 -- bar new.txt")
+            os.makedirs(os.path.join(self.tempdir, "sub dir 2 -- new"))
+            os.rename(self.subdir1, os.path.join(self.tempdir, "sub dir 1 -- other"))
+            filetags.refresh_tag_index(self.connection, self.tempdir, recursive=False)
+            filetags.cache_of_tag_cooccurrences = {}
+            from_index = filetags.get_tag_cooccurrences(self.tempdir)
+            filetags.options.use_index = False
+            filetags.cache_of_tag_cooccurrences = {}
+            self.assertEqual(from_index, filetags.get_tag_cooccurrences(self.tempdir))
+            self.assertNotIn('ptag', from_index[0])
+
+            # only the pairs of the requested tags are returned:
+            for use_index in [False, True]:
+                filetags.options.use_index = use_index
+                self.assertEqual(filetags.get_tag_cooccurrences(self.tempdir, ['bar'])[0],
+                                 {'bar': {'bar': 1, 'new': 1}, 'baz': {'baz': 1}, 'new': {'new': 2},
+                                  'other': {'other': 1}})
+        finally:
+            filetags.options.use_index = False
+            filetags.cache_of_tag_cooccurrences = {}
+
+    def test_upto_nine_suggested_tags(self):
+
+        filetags.cache_of_tag_cooccurrences = {}
+        for name in ['a -- car red.txt', 'b -- car blue.txt', 'c -- car blue.txt'] + \
+                    ['d%i -- tree%i.txt' % (x, x % 11) for x in range(44)]:
+            self.create_tmp_file(self.tempdir, name)
+        try:
+            # without common tags, the most frequent tags are suggested:
+            self.assertNotIn('car', filetags.get_upto_nine_suggested_tags(self.tempdir, []))
+            # tags sharing files with the common tags are suggested first:
+            self.assertEqual(set(filetags.get_upto_nine_suggested_tags(self.tempdir, ['car'])) & {'red', 'blue', 'car'},
+                             {'red', 'blue'})
+        finally:
+            filetags.cache_of_tag_cooccurrences = {}
+
+    def tearDown(self):
+
+        filetags.TAG_INDEX_MTIME_GRANULARITY = self.mtime_granularity
+        if platform.system() != 'Windows':
+            rmtree(self.tempdir)
+
+
+class TestFileTagger(unittest.TestCase):
+
+    tempdir = None
+
+    def setUp(self):
+        """This setup function creates following dir/file structure:
+
+        tempdir   (via tempfile.mkdtemp())
+          |_ ".filetags" with "draft final" and "#donotsuggest foo"
+          |_ "a -- foo.txt"
+          |_ "b.txt"
+        """
+
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        print("\nTestFileTagger: temporary directory: " + self.tempdir)
+        self.vocabulary_filename = os.path.join(self.tempdir, '.filetags')
+        with open(self.vocabulary_filename, 'w') as outputhandle:
+            outputhandle.write('draft final\n#donotsuggest foo\n')
+        for name in ['a -- foo.txt', 'b.txt']:
+            with open(os.path.join(self.tempdir, name), 'w') as outputhandle:
+                outputhandle.write('This is a test file for filetags unit testing')
+        self.unique_tags = filetags.unique_tags
+
+    def test_file_tagger(self):
+
+        tagger = filetags.FileTagger.for_file(os.path.join(self.tempdir, 'b.txt'))
+        self.assertEqual(tagger.vocabulary_filename, self.vocabulary_filename)
+        self.assertEqual(tagger.vocabulary, ['draft', 'final'])
+        self.assertEqual(tagger.unique_tags, [filetags.UNIQUE_TAG_TESTSTRINGS, ['draft', 'final']])
+        self.assertEqual(tagger.do_not_suggest_tags, ['foo'])
+
+        self.assertEqual(tagger.tag([os.path.join(self.tempdir, 'b.txt')], ['draft']),
+                         ([os.path.join(self.tempdir, 'b -- draft.txt')], []))
+        self.assertEqual(tagger.tag([os.path.join(self.tempdir, 'b -- draft.txt')], ['final']),
+                         ([os.path.join(self.tempdir, 'b -- final.txt')], []))
+        # the global state is not touched:
+        self.assertIs(filetags.unique_tags, self.unique_tags)
+
+        self.assertEqual(tagger.list_tags(self.tempdir), {'foo': 1, 'final': 1})
+        self.assertEqual(tagger.filter(self.tempdir, 'foo OR final'),
+                         [os.path.join(self.tempdir, 'a -- foo.txt'), os.path.join(self.tempdir, 'b -- final.txt')])
+        self.assertRaises(ValueError, tagger.filter, self.tempdir, 'foo AND')
+
+        new_files, errors = tagger.untag([os.path.join(self.tempdir, 'a -- foo.txt'),
+                                          os.path.join(self.tempdir, 'missing.txt')], ['foo'])
+        self.assertEqual(new_files, [os.path.join(self.tempdir, 'a.txt')])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(tagger.list_tags(self.tempdir), {'final': 1})
+
+        self.assertFalse(tagger.refresh_vocabulary())
+        with open(self.vocabulary_filename, 'a') as outputhandle:
+            outputhandle.write('new\n')
+        self.assertTrue(tagger.refresh_vocabulary())
+        self.assertEqual(tagger.vocabulary, ['draft', 'final', 'new'])
+
+    def tearDown(self):
+
+        filetags.unique_tags = self.unique_tags
+        if platform.system() != 'Windows':
+            rmtree(self.tempdir)
+
+
+@unittest.skipIf(platform.system() == 'Windows', "the daemon requires Unix sockets")
+class TestDaemon(unittest.TestCase):
+
+    tempdir = None
+
+    def setUp(self):
+        """This setup function creates following dir/file structure and
+        starts a daemon listening on a socket in tempdir:
+
+        tempdir   (via tempfile.mkdtemp())
+          |_ ".filetags" with "draft final"
+          |_ "a -- foo.txt"
+          |_ "b -- foo bar.txt"
+          |_ "c.txt"
+          |_ sub -- ptag/
+               |_ "d -- foo.txt"
+        """
+
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        print("\nTestDaemon: temporary directory: " + self.tempdir)
+
+        with open(os.path.join(self.tempdir, '.filetags'), 'w') as outputhandle:
+            outputhandle.write('draft final\n')
+        for name in ['a -- foo.txt', 'b -- foo bar.txt', 'c.txt', os.path.join('sub -- ptag', 'd -- foo.txt')]:
+            os.makedirs(os.path.dirname(os.path.join(self.tempdir, name)), exist_ok=True)
+            with open(os.path.join(self.tempdir, name), 'w') as outputhandle:
+                outputhandle.write('This is a test file for filetags unit testing')
+
+        self.unique_tags = filetags.unique_tags
+        self.do_not_suggest_tags = filetags.do_not_suggest_tags
+
+        # the client is a script and no module of the package:
+        clientfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin', 'filetags_client.py')
+        spec = importlib.util.spec_from_file_location('filetags_client', clientfile)
+        self.client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.client)
+
+        self.socket_filename = os.path.join(self.tempdir, 'daemon.socket')
+        self.daemon = threading.Thread(target=filetags.serve_daemon, args=(self.socket_filename,))
+        self.daemon.start()
+        for attempt in range(100):
+            if os.path.exists(self.socket_filename):
+                break
+            time.sleep(0.01)
+
+    def request(self, **request):
+
+        return self.client.send_requests(self.socket_filename, [request])[0]
+
+    def test_requests(self):
+
+        self.assertEqual(self.request(command='list', directory=self.tempdir),
+                         {'ok': True, 'tags': {'foo': 2, 'bar': 1, 'ptag': 1}})
+        self.assertEqual(self.request(command='list', directory=self.tempdir, recursive=True)['tags']['foo'], 3)
+
+        self.assertEqual(self.request(command='filter', directory=self.tempdir, query='foo -bar'),
+                         {'ok': True, 'files': [os.path.join(self.tempdir, 'a -- foo.txt')]})
+        self.assertEqual(self.request(command='filter', directory=self.tempdir, query='foo -bar', recursive=True)['files'],
+                         [os.path.join(self.tempdir, 'a -- foo.txt'), os.path.join(self.tempdir, 'sub -- ptag', 'd -- foo.txt')])
+        self.assertFalse(self.request(command='filter', directory=self.tempdir, query='(foo')['ok'])
+
+        # unique tags of the vocabulary replace each other:
+        self.assertEqual(self.request(command='tag', files=[os.path.join(self.tempdir, 'c.txt')], tags=['draft']),
+                         {'ok': True, 'files': [os.path.join(self.tempdir, 'c -- draft.txt')]})
+        self.assertEqual(self.request(command='tag', files=[os.path.join(self.tempdir, 'c -- draft.txt')], tags=['final', '-foo']),
+                         {'ok': True, 'files': [os.path.join(self.tempdir, 'c -- final.txt')]})
+        self.assertEqual(self.request(command='untag', files=[os.path.join(self.tempdir, 'c -- final.txt')], tags=['final']),
+                         {'ok': True, 'files': [os.path.join(self.tempdir, 'c.txt')]})
+        self.assertEqual(self.request(command='tag', files=[os.path.join(self.tempdir, 'c.txt')], tags=['new'], dryrun=True)['files'],
+                         [os.path.join(self.tempdir, 'c -- new.txt')])
+        self.assertTrue(os.path.isfile(os.path.join(self.tempdir, 'c.txt')))
+
+        # a changed vocabulary gets parsed again:
+        with open(os.path.join(self.tempdir, '.filetags'), 'w') as outputhandle:
+            outputhandle.write('draft final\nnew old\n')
+        self.request(command='tag', files=[os.path.join(self.tempdir, 'c.txt')], tags=['old'])
+        self.request(command='tag', files=[os.path.join(self.tempdir, 'c -- old.txt')], tags=['new'])
+        self.assertTrue(os.path.isfile(os.path.join(self.tempdir, 'c -- new.txt')))
+
+        response = self.request(command='tag', files=[os.path.join(self.tempdir, 'missing.txt')], tags=['foo'])
+        self.assertFalse(response['ok'])
+        self.assertIn('missing.txt', response['error'])
+        self.assertFalse(self.request(command='tag')['ok'])
+        self.assertFalse(self.request(command='unknown')['ok'])
+
+    def test_failing_requests_do_not_stop_the_daemon(self):
+
+        filename = os.path.join(self.tempdir, 'a -- foo.txt')
+        response = self.request(command='tag', files=[filename], tags='bar')
+        self.assertFalse(response['ok'])
+        self.assertIn('tags', response['error'])
+        self.assertFalse(self.request(command='tag', files=filename, tags=['bar'])['ok'])
+        self.assertFalse(self.request(command='tag', files=[filename], tags=[1])['ok'])
+
+        # renaming to a non-existing sub-directory fails:
+        self.assertFalse(self.request(command='tag', files=[filename], tags=['a/b'])['ok'])
+        self.assertTrue(os.path.isfile(filename))
+
+        self.assertTrue(self.daemon.is_alive())
+        self.assertEqual(self.request(command='list', directory=self.tempdir)['tags']['foo'], 2)
+        self.assertEqual(os.stat(self.socket_filename).st_mode & 0o777, 0o600)
+
+    def test_cached_tags_follow_renamed_files(self):
+
+        self.assertEqual(self.request(command='list', directory=self.tempdir)['tags']['foo'], 2)
+        os.rename(os.path.join(self.tempdir, 'c.txt'), os.path.join(self.tempdir, 'c -- foo.txt'))
+        self.assertEqual(self.request(command='list', directory=self.tempdir)['tags']['foo'], 3)
+        self.assertEqual(len(self.request(command='filter', directory=self.tempdir, query='foo')['files']), 3)
+
+    def tearDown(self):
+
+        self.request(command='stop')
+        self.daemon.join()
+        self.assertFalse(os.path.exists(self.socket_filename))
+        filetags.unique_tags = self.unique_tags
+        filetags.do_not_suggest_tags = self.do_not_suggest_tags
+        if platform.system() != 'Windows':
+            rmtree(self.tempdir)
+
+
 class TestReplacingLinkSourceAndTarget(unittest.TestCase):
 
     tempdir = None